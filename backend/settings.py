@@ -144,8 +144,9 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
-CORS_EXPOSE_HEADERS = ['authorization','content-Type', 'cookie','set-cookie']
+CORS_EXPOSE_HEADERS = ['authorization','content-Type', 'cookie','set-cookie', 'idempotent-replayed']
 
 CSRF_COOKIE_SECURE = True
 CSRF_COOKIE_SAMESITE = 'Lax'
@@ -237,6 +238,97 @@ AFRICASTALKING_USERNAME = config('AFRICASTALKING_USERNAME')
 AFRICASTALKING_API_KEY = config('AFRICASTALKING_API_KEY')
 AFRICASTALKING_PRODUCT_NAME = config('AFRICASTALKING_PRODUCT_NAME')
 
+# Cache (shared Redis when REDIS_URL is set, per-process memory otherwise)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Rider GPS tracking
+RIDER_LOCATION_BUFFER_SIZE = config('RIDER_LOCATION_BUFFER_SIZE', default=500, cast=int)
+RIDER_LOCATION_FLUSH_SECONDS = config('RIDER_LOCATION_FLUSH_SECONDS', default=5.0, cast=float)
+RIDER_LOCATION_CACHE_TIMEOUT = config('RIDER_LOCATION_CACHE_TIMEOUT', default=3600, cast=int)
+RIDER_LOCATION_MAX_BATCH = config('RIDER_LOCATION_MAX_BATCH', default=1000, cast=int)
+
+# Order status event stream (SSE)
+ORDER_EVENTS_CACHE_TIMEOUT = config('ORDER_EVENTS_CACHE_TIMEOUT', default=3600, cast=int)
+ORDER_EVENTS_POLL_SECONDS = config('ORDER_EVENTS_POLL_SECONDS', default=3.0, cast=float)  # EventSource reconnect (retry) interval
+ORDER_EVENTS_TOKEN_SECONDS = config('ORDER_EVENTS_TOKEN_SECONDS', default=900, cast=int)  # Lifetime of a ?token= stream token
+
+# Order history and admin exports
+ORDER_HISTORY_THUMBNAILS = 3  # Product images shown per order in the order history list
+EXPORT_CHUNK_SIZE = 2000  # Rows per database fetch and per streamed chunk
+SALES_ANALYTICS_MAX_DAYS = 731  # Longest date range one analytics request may cover
+ORDER_BULK_MAX = 5000  # Orders per bulk action request
+ORDER_PENDING_TTL_MINUTES = config('ORDER_PENDING_TTL_MINUTES', default=30, cast=int)  # Unpaid checkouts expire after this
+ORDER_EXPIRY_BATCH_SIZE = 500  # Orders cancelled per transaction by expire_pending_orders
+IDEMPOTENCY_KEY_TTL_HOURS = 24  # Checkout retries with the same Idempotency-Key are replayed this long
+
+# Order archival (orders/archive.py); run archive_orders nightly
+ORDER_ARCHIVE_MONTHS = config('ORDER_ARCHIVE_MONTHS', default=6, cast=int)  # Closed orders older than this leave the hot tables
+ORDER_ARCHIVE_BATCH_SIZE = 500  # Orders moved per transaction
+
+# Branch lookup
+BRANCH_INDEX_REFRESH_SECONDS = config('BRANCH_INDEX_REFRESH_SECONDS', default=5, cast=int)
+BRANCH_SERVICE_RADIUS_KM = config('BRANCH_SERVICE_RADIUS_KM', default=0.0, cast=float)  # 0 disables the limit
+DELIVERY_ZONE_GRID_DEGREES = config('DELIVERY_ZONE_GRID_DEGREES', default=0.01, cast=float)
+DELIVERY_ZONE_REROUTE = config('DELIVERY_ZONE_REROUTE', default=True, cast=bool)  # False rejects out-of-zone checkouts
+
+# Delivery fees: (max_km, fee) tiers from the branch, a max_km of None covers any distance
+DELIVERY_FEE_TIERS = ((3, 100), (7, 200), (12, 350), (None, 500))
+DELIVERY_FEE_BRANCH_TIERS = {}  # {branch_id: tiers} overrides for individual branches
+DELIVERY_FEE_COORDINATE_PRECISION = 3  # ~100 m; quotes are memoized per branch and cell
+DELIVERY_FEE_CACHE_TIMEOUT = config('DELIVERY_FEE_CACHE_TIMEOUT', default=86400, cast=int)
+
+# Route optimization
+ROUTE_SOLVER_SECONDS = config('ROUTE_SOLVER_SECONDS', default=10, cast=float)
+ROUTE_WARM_START_SECONDS = config('ROUTE_WARM_START_SECONDS', default=2, cast=float)
+ROUTE_POLISH_MS = 50  # Local-search budget after inserting a stop into a live route
+ROUTE_EXACT_MAX_STOPS = config('ROUTE_EXACT_MAX_STOPS', default=7, cast=int)
+ROUTE_COORDINATE_PRECISION = 5  # ~1 m; distance cache key granularity
+ROUTE_START_PRECISION = 3  # ~100 m; route cache key granularity for the rider's position
+ROUTE_DISTANCE_CACHE_TIMEOUT = config('ROUTE_DISTANCE_CACHE_TIMEOUT', default=7 * 86400, cast=int)
+ROUTE_PLAN_CACHE_TIMEOUT = config('ROUTE_PLAN_CACHE_TIMEOUT', default=6 * 3600, cast=int)
+ROUTE_DISTANCE_BACKEND = config('ROUTE_DISTANCE_BACKEND', default='geodesic')  # 'geodesic' or 'road'
+ROAD_NETWORK_PATH = config('ROAD_NETWORK_PATH', default='')  # .npz built by `manage.py build_road_network`
+ROAD_NETWORK_DETOUR_FACTOR = 1.4  # Straight-line multiplier for stops the road graph cannot connect
+RIDER_MANIFEST_CACHE_TIMEOUT = config('RIDER_MANIFEST_CACHE_TIMEOUT', default=18 * 3600, cast=int)
+
+# Auto-assignment of paid deliveries to riders
+DISPATCH_AUTO_ASSIGN = config('DISPATCH_AUTO_ASSIGN', default=False, cast=bool)
+DISPATCH_INDEX_REFRESH_SECONDS = 10
+DISPATCH_LOCATION_MAX_AGE_SECONDS = 900  # Older GPS pings fall back to the rider's route start
+DISPATCH_CANDIDATES = 8  # Nearest riders scored per delivery
+DISPATCH_MAX_DISTANCE_KM = config('DISPATCH_MAX_DISTANCE_KM', default=15.0, cast=float)
+DISPATCH_MAX_LOAD = config('DISPATCH_MAX_LOAD', default=8, cast=int)  # Open deliveries per rider
+DISPATCH_LOAD_PENALTY_M = 1500  # Score added per open delivery, in meters
+DELIVERY_CLUSTER_MAX_CELLS = 1000  # Upper bound on clusters returned for one map view
+DELIVERY_BULK_MAX = 5000  # Deliveries per bulk status request
+
+# Delivery time slots
+DELIVERY_SLOT_TIME_ZONE = 'Africa/Nairobi'
+DELIVERY_SLOT_MINUTES = 120
+DELIVERY_SLOT_FIRST_HOUR = 8
+DELIVERY_SLOT_LAST_HOUR = 20  # Last slot ends at this hour
+DELIVERY_SLOT_DAYS = config('DELIVERY_SLOT_DAYS', default=7, cast=int)
+DELIVERY_SLOT_LEAD_MINUTES = config('DELIVERY_SLOT_LEAD_MINUTES', default=60, cast=int)  # Slots starting sooner are closed
+DELIVERY_SLOT_CAPACITY = config('DELIVERY_SLOT_CAPACITY', default=20, cast=int)  # Deliveries per branch per slot
+DELIVERY_SLOT_BRANCH_CAPACITY = {}  # {branch_id: capacity} overrides
+DELIVERY_SLOT_AVAILABILITY_TIMEOUT = 60
+
+# Admin dashboard counters (users/stats.py); run reconcile_dashboard_stats periodically
+DASHBOARD_STATS_TIMEOUT = None  # Counters are kept until reconciled
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -1,6 +1,18 @@
 # delivery/admin.py
 from django.contrib import admin
-from .models import Delivery
+from .models import Delivery, DeliveryEvent
+from .transitions import bulk_transition
+
+class DeliveryEventInline(admin.TabularInline):
+    model = DeliveryEvent
+    fields = ('from_status', 'to_status', 'rider', 'created_at')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Delivery)
 class DeliveryAdmin(admin.ModelAdmin):
@@ -13,29 +25,31 @@ class DeliveryAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
     list_per_page = 25
     actions = ['mark_as_in_transit', 'mark_as_delivered']
+    inlines = [DeliveryEventInline]
+
+    def _bulk_transition(self, request, queryset, new_status):
+        result = bulk_transition(list(queryset.values_list('id', flat=True)), new_status)
+        for outcome in result['results']:
+            if not outcome['ok']:
+                self.message_user(request, f"Error for Delivery {outcome['id']}: {outcome['error']}", level='error')
+        return result['updated']
 
     def mark_as_in_transit(self, request, queryset):
-        for delivery in queryset:
-            try:
-                delivery.update_status('in_transit')
-            except ValueError as e:
-                self.message_user(request, f"Error for Delivery {delivery.id}: {str(e)}", level='error')
-        self.message_user(request, "Selected deliveries marked as in transit.")
+        updated = self._bulk_transition(request, queryset, 'in_transit')
+        self.message_user(request, f"{updated} deliveries marked as in transit.")
     mark_as_in_transit.short_description = "Mark as In Transit"
 
     def mark_as_delivered(self, request, queryset):
-        for delivery in queryset:
-            try:
-                delivery.update_status('delivered')
-            except ValueError as e:
-                self.message_user(request, f"Error for Delivery {delivery.id}: {str(e)}", level='error')
-        self.message_user(request, "Selected deliveries marked as delivered.")
+        updated = self._bulk_transition(request, queryset, 'delivered')
+        self.message_user(request, f"{updated} deliveries marked as delivered.")
     mark_as_delivered.short_description = "Mark as Delivered"
 
     def save_model(self, request, obj, form, change):
         if 'status' in form.changed_data:
+            # Validate the transition from the stored status; update_status saves and logs it
+            new_status, obj.status = obj.status, form.initial.get('status', obj.status)
             try:
-                obj.update_status(obj.status)
+                obj.update_status(new_status)
             except ValueError as e:
                 self.message_user(request, f"Error: {str(e)}", level='error')
                 return
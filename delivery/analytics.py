@@ -0,0 +1,78 @@
+import logging
+from datetime import timedelta
+from django.db import connection
+from django.db.models import Aggregate, Count, FloatField
+from django.utils import timezone
+from .models import DeliverySLA
+
+logger = logging.getLogger(__name__)
+
+
+class PercentileCont(Aggregate):
+    """PostgreSQL percentile_cont(fraction) WITHIN GROUP (ORDER BY expression)."""
+    function = 'percentile_cont'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def _percentile(values, fraction):
+    # Linear interpolation, matching percentile_cont
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def sla_percentiles(metric='assigned_to_delivered_seconds', days=30, branch_id=None, rider_id=None,
+                    group_by=None, fractions=(0.5, 0.9)):
+    """
+    Percentiles of a delivery stage duration over the last `days`, from the DeliverySLA rollup.
+    Args:
+        metric: One of DeliverySLA.METRICS.
+        branch_id, rider_id: Optional filters.
+        group_by: None, 'branch' or 'rider'.
+        fractions: Percentiles to compute, as fractions.
+    Returns:
+        List of dicts with the group key (if any), 'count' and 'p50', 'p90', ... in seconds.
+    """
+    if metric not in DeliverySLA.METRICS:
+        raise ValueError(f"Unknown metric {metric}")
+    if group_by not in (None, 'branch', 'rider'):
+        raise ValueError(f"Cannot group by {group_by}")
+
+    rows = DeliverySLA.objects.filter(
+        delivered_at__gte=timezone.now() - timedelta(days=days), **{f'{metric}__isnull': False}
+    )
+    if branch_id is not None:
+        rows = rows.filter(branch_id=branch_id)
+    if rider_id is not None:
+        rows = rows.filter(rider_id=rider_id)
+    group_field = f'{group_by}_id' if group_by else None
+    names = {fraction: f'p{round(fraction * 100)}' for fraction in fractions}
+
+    if connection.vendor == 'postgresql':
+        aggregates = {name: PercentileCont(metric, fraction) for fraction, name in names.items()}
+        aggregates['count'] = Count('id')
+        if group_field:
+            return list(rows.values(group_field).annotate(**aggregates).order_by(group_field))
+        return [rows.aggregate(**aggregates)]
+
+    # Other databases: compute the same percentiles in Python
+    groups = {}
+    for key, value in rows.values_list(group_field or 'id', metric):
+        groups.setdefault(key if group_field else None, []).append(value)
+    if not group_field:
+        groups.setdefault(None, [])
+    result = []
+    for key, values in sorted(groups.items(), key=lambda item: (item[0] is None, item[0] or 0)):
+        entry = {group_field: key} if group_field else {}
+        entry['count'] = len(values)
+        entry.update({name: _percentile(values, fraction) for fraction, name in names.items()})
+        result.append(entry)
+    return result
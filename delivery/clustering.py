@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db.models import Avg, Count, Q
+from django.db.models.functions import Substr
+from .geo import geohash_cell_size, geohash_cover
+from .models import Delivery, GEOHASH_PRECISION
+
+
+def zoom_to_precision(zoom):
+    """Geohash length whose cells are roughly a quarter of a map tile wide at this zoom."""
+    return max(1, min(GEOHASH_PRECISION - 1, round((zoom + 2) * 2 / 5)))
+
+
+def _cell_count(min_lat, min_lng, max_lat, max_lng, precision):
+    cell_lat, cell_lng = geohash_cell_size(precision)
+    return (int((max_lat - min_lat) / cell_lat) + 2) * (int((max_lng - min_lng) / cell_lng) + 2)
+
+
+def cluster_deliveries(min_lat, min_lng, max_lat, max_lng, zoom, statuses=None):
+    """
+    Aggregate deliveries inside a bounding box into geohash cells.
+    The cell size follows the zoom level and is coarsened until the box spans at most
+    DELIVERY_CLUSTER_MAX_CELLS cells, so the response size does not grow with delivery volume.
+    Rows are found with prefix scans on the geohash index and grouped in the database.
+    Returns:
+        Dict with 'precision', 'total' and 'clusters' (geohash, count, centroid lat/lng, statuses).
+    """
+    precision = zoom_to_precision(zoom)
+    max_cells = getattr(settings, 'DELIVERY_CLUSTER_MAX_CELLS', 1000)
+    while precision > 1 and _cell_count(min_lat, min_lng, max_lat, max_lng, precision) > max_cells:
+        precision -= 1
+
+    # A handful of coarse prefixes is enough to bound the index scan
+    cover_precision = precision
+    cover = geohash_cover(min_lat, min_lng, max_lat, max_lng, cover_precision)
+    while cover_precision > 1 and len(cover) > 32:
+        cover_precision -= 1
+        cover = geohash_cover(min_lat, min_lng, max_lat, max_lng, cover_precision)
+    prefixes = Q()
+    for prefix in cover:
+        prefixes |= Q(geohash__startswith=prefix)
+
+    deliveries = Delivery.objects.filter(
+        prefixes,
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lng, max_lng),
+    )
+    if statuses:
+        deliveries = deliveries.filter(status__in=statuses)
+    rows = (
+        deliveries.annotate(cell=Substr('geohash', 1, precision))
+        .values('cell', 'status')
+        .annotate(count=Count('id'), lat=Avg('latitude'), lng=Avg('longitude'))
+        .order_by()
+    )
+
+    clusters = {}
+    for row in rows:
+        cluster = clusters.setdefault(row['cell'], {'geohash': row['cell'], 'count': 0, 'lat': 0.0, 'lng': 0.0, 'statuses': {}})
+        cluster['count'] += row['count']
+        # Running sums, turned into the centroid below
+        cluster['lat'] += row['lat'] * row['count']
+        cluster['lng'] += row['lng'] * row['count']
+        cluster['statuses'][row['status']] = row['count']
+    for cluster in clusters.values():
+        cluster['lat'] = round(cluster['lat'] / cluster['count'], 6)
+        cluster['lng'] = round(cluster['lng'] / cluster['count'], 6)
+
+    return {
+        'precision': precision,
+        'total': sum(cluster['count'] for cluster in clusters.values()),
+        'clusters': sorted(clusters.values(), key=lambda cluster: cluster['geohash']),
+    }
@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from users.models import CustomUser
+from .geo import KDTree, haversine_m
+from .models import Delivery
+from .routing import RIDER_ROUTE_KEY
+from .tracking import RIDER_LOCATION_KEY, TRACKABLE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class RiderIndex:
+    """
+    Process-local KD-tree of available riders with their open-delivery load.
+    A rider is placed at their last GPS ping if it is recent enough, else at the start
+    of their current route (usually their branch); riders with neither are offline.
+    The index is rebuilt every DISPATCH_INDEX_REFRESH_SECONDS with one rider query,
+    one load aggregate and two cache reads, however many deliveries are assigned.
+    """
+
+    def __init__(self):
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if self._built_at is not None and now - self._built_at < _setting('DISPATCH_INDEX_REFRESH_SECONDS', 10):
+            return
+        with self._lock:
+            if self._built_at is None or now - self._built_at >= _setting('DISPATCH_INDEX_REFRESH_SECONDS', 10):
+                self._build()
+                self._built_at = now
+
+    def _build(self):
+        rider_ids = list(CustomUser.objects.filter(role='delivery', is_active=True).values_list('id', flat=True))
+        locations = cache.get_many([RIDER_LOCATION_KEY.format(rider_id) for rider_id in rider_ids])
+        routes = cache.get_many([RIDER_ROUTE_KEY.format(rider_id) for rider_id in rider_ids])
+        self._loads = dict(
+            Delivery.objects.filter(status__in=TRACKABLE_STATUSES, delivery_person_id__in=rider_ids)
+            .values('delivery_person').annotate(open_deliveries=Count('id'))
+            .values_list('delivery_person', 'open_deliveries')
+        )
+
+        oldest = time.time() - _setting('DISPATCH_LOCATION_MAX_AGE_SECONDS', 900)
+        self._routes = {}
+        positions = []
+        for rider_id in rider_ids:
+            location = locations.get(RIDER_LOCATION_KEY.format(rider_id))
+            route = routes.get(RIDER_ROUTE_KEY.format(rider_id))
+            if route is not None:
+                self._routes[rider_id] = (route['start'], [point for _, point in route['stops']])
+            if location is not None and location['ts'] >= oldest:
+                positions.append((location['latitude'], location['longitude'], rider_id))
+            elif route is not None:
+                positions.append((route['start'][0], route['start'][1], rider_id))
+        self._tree = KDTree(positions)
+        logger.info(f"Rider index rebuilt: {len(positions)} of {len(rider_ids)} riders available")
+
+    def reset(self):
+        with self._lock:
+            self._built_at = None
+
+    def _detour(self, rider_id, point):
+        # Straight-line cost of inserting the point into the rider's current closed route
+        start, stops = self._routes.get(rider_id, (None, []))
+        if not stops:
+            return 0.0
+        tour = [start] + stops + [start]
+        return min(
+            haversine_m(a, point) + haversine_m(point, b) - haversine_m(a, b)
+            for a, b in zip(tour, tour[1:])
+        )
+
+    def best_rider(self, latitude, longitude):
+        """
+        Pick the rider with the lowest score for a stop at (latitude, longitude):
+        distance from the rider + detour into their current route + DISPATCH_LOAD_PENALTY_M
+        per open delivery. Only the DISPATCH_CANDIDATES nearest riders under DISPATCH_MAX_LOAD
+        within DISPATCH_MAX_DISTANCE_KM are scored.
+        Returns:
+            Rider id, or None if no rider is available.
+        """
+        self._ensure_current()
+        max_load = _setting('DISPATCH_MAX_LOAD', 8)
+        penalty = _setting('DISPATCH_LOAD_PENALTY_M', 1500)
+        max_distance_km = _setting('DISPATCH_MAX_DISTANCE_KM', 15.0)
+        candidates = self._tree.nearest(
+            latitude, longitude,
+            k=_setting('DISPATCH_CANDIDATES', 8),
+            max_distance_m=max_distance_km * 1000 if max_distance_km else None,
+            predicate=lambda rider_id: self._loads.get(rider_id, 0) < max_load,
+        )
+        if not candidates:
+            return None
+        point = (latitude, longitude)
+        scored = [
+            (distance + self._detour(rider_id, point) + penalty * self._loads.get(rider_id, 0), rider_id)
+            for rider_id, distance in candidates
+        ]
+        return min(scored)[1]
+
+    def record_assignment(self, rider_id, point):
+        """Account for an assignment until the next rebuild."""
+        self._loads[rider_id] = self._loads.get(rider_id, 0) + 1
+        if rider_id in self._routes:
+            self._routes[rider_id][1].append(point)
+
+
+rider_index = RiderIndex()
+
+
+def auto_assign_deliveries(delivery_ids=None, order_ids=None):
+    """
+    Assign pending, unassigned deliveries whose payment succeeded to the best available rider.
+    Safe to call repeatedly and concurrently: each delivery is re-checked under a row lock.
+    Args:
+        delivery_ids / order_ids: Limit to these deliveries or orders (all assignable if both None).
+    Returns:
+        Dict with 'assigned' ({delivery_id: rider_id}) and 'unassigned' (delivery ids with no rider).
+    """
+    deliveries = Delivery.objects.filter(
+        status='pending',
+        delivery_person__isnull=True,
+        order__payment__status='successful',
+        latitude__isnull=False,
+        longitude__isnull=False,
+    )
+    if delivery_ids is not None:
+        deliveries = deliveries.filter(id__in=delivery_ids)
+    if order_ids is not None:
+        deliveries = deliveries.filter(order_id__in=order_ids)
+
+    assigned, unassigned = {}, []
+    for delivery_id, latitude, longitude in deliveries.order_by('created_at').values_list('id', 'latitude', 'longitude'):
+        rider_id = rider_index.best_rider(latitude, longitude)
+        if rider_id is None:
+            unassigned.append(delivery_id)
+            continue
+        with transaction.atomic():
+            delivery = Delivery.objects.select_for_update().filter(
+                id=delivery_id, status='pending', delivery_person__isnull=True
+            ).first()
+            if delivery is None:
+                continue  # Assigned elsewhere in the meantime
+            delivery.delivery_person_id = rider_id
+            delivery.update_status('assigned')
+        rider_index.record_assignment(rider_id, (latitude, longitude))
+        assigned[delivery_id] = rider_id
+        logger.info(f"Delivery {delivery_id} auto-assigned to rider {rider_id}")
+
+    if unassigned:
+        logger.warning(f"No available rider for {len(unassigned)} deliveries: {unassigned[:50]}")
+    return {'assigned': assigned, 'unassigned': unassigned}
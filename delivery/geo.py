@@ -0,0 +1,294 @@
+"""
+Pure-Python geometry helpers shared by branch lookup, dispatch and routing.
+Coordinates are (latitude, longitude) in degrees; distances are in meters.
+"""
+import heapq
+import math
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(a, b):
+    """Great-circle distance in meters between two (lat, lng) points."""
+    lat1, lng1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lng2 = math.radians(b[0]), math.radians(b[1])
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(h)))
+
+
+def to_unit_vector(lat, lng):
+    """Project (lat, lng) onto the unit sphere as an (x, y, z) tuple."""
+    lat, lng = math.radians(lat), math.radians(lng)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lng), cos_lat * math.sin(lng), math.sin(lat))
+
+
+def _chord_to_meters(chord):
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, chord / 2))
+
+
+def _meters_to_chord(meters):
+    return 2 * math.sin(min(math.pi, meters / EARTH_RADIUS_M) / 2)
+
+
+class KDTree:
+    """
+    Static 3-d tree over points on the unit sphere.
+    Euclidean (chord) distance on the sphere orders points exactly like
+    great-circle distance, so nearest-neighbour queries are exact anywhere on Earth.
+    """
+
+    def __init__(self, items):
+        """
+        Args:
+            items: Iterable of (lat, lng, payload) tuples.
+        """
+        nodes = [(to_unit_vector(lat, lng), payload) for lat, lng, payload in items]
+        self.size = len(nodes)
+        self._root = self._build(nodes, 0)
+
+    def __len__(self):
+        return self.size
+
+    def _build(self, nodes, depth):
+        if not nodes:
+            return None
+        axis = depth % 3
+        nodes.sort(key=lambda node: node[0][axis])
+        mid = len(nodes) // 2
+        return (
+            nodes[mid][0],
+            nodes[mid][1],
+            axis,
+            self._build(nodes[:mid], depth + 1),
+            self._build(nodes[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, lat, lng, k=1, max_distance_m=None, predicate=None):
+        """
+        Find the k nearest payloads to (lat, lng).
+        Args:
+            k: Maximum number of results.
+            max_distance_m: Optional radius; farther points are ignored.
+            predicate: Optional callable(payload) -> bool to skip points.
+        Returns:
+            List of (payload, distance_m), nearest first.
+        """
+        if self._root is None or k < 1:
+            return []
+        target = to_unit_vector(lat, lng)
+        limit = _meters_to_chord(max_distance_m) ** 2 if max_distance_m is not None else float('inf')
+        heap = []  # max-heap of (-squared chord, tiebreak, payload)
+        counter = 0
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            vector, payload, axis, left, right = node
+            d2 = (
+                (vector[0] - target[0]) ** 2
+                + (vector[1] - target[1]) ** 2
+                + (vector[2] - target[2]) ** 2
+            )
+            bound = -heap[0][0] if len(heap) == k else limit
+            if d2 <= bound and (predicate is None or predicate(payload)):
+                counter += 1
+                if len(heap) == k:
+                    heapq.heapreplace(heap, (-d2, counter, payload))
+                else:
+                    heapq.heappush(heap, (-d2, counter, payload))
+                bound = -heap[0][0] if len(heap) == k else limit
+            diff = target[axis] - vector[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Push the far side first so the near side is explored first
+            if diff * diff <= bound:
+                stack.append(far)
+            stack.append(near)
+        results = sorted(((-neg_d2, payload) for neg_d2, _, payload in heap), key=lambda item: item[0])
+        return [(payload, _chord_to_meters(math.sqrt(d2))) for d2, payload in results]
+
+
+def encode_polyline(points, precision=5):
+    """
+    Encode (lat, lng) points with the Google encoded polyline algorithm.
+    Each coordinate is stored as a zig-zag varint delta from the previous point,
+    typically 2-6 ASCII characters per coordinate.
+    """
+    factor = 10 ** precision
+    chunks = []
+    previous_lat = previous_lng = 0
+    for lat, lng in points:
+        lat, lng = round(lat * factor), round(lng * factor)
+        for delta in (lat - previous_lat, lng - previous_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lng = lat, lng
+    return ''.join(chunks)
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lng, precision=9):
+    """Geohash of a point; each extra character narrows the cell by 5 bits."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, value, even = 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """Return (lat_degrees, lng_degrees) spanned by a geohash cell of the given precision."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_cover(min_lat, min_lng, max_lat, max_lng, precision):
+    """Set of geohash cells of the given precision that intersect a bounding box."""
+    cell_lat, cell_lng = geohash_cell_size(precision)
+    rows = range(math.floor((min_lat + 90) / cell_lat), math.floor((max_lat + 90) / cell_lat) + 1)
+    cols = range(math.floor((min_lng + 180) / cell_lng), math.floor((max_lng + 180) / cell_lng) + 1)
+    return {
+        geohash_encode(
+            min((row + 0.5) * cell_lat - 90, 90.0),
+            min((col + 0.5) * cell_lng - 180, 180.0),
+            precision,
+        )
+        for row in rows
+        for col in cols
+    }
+
+
+def point_in_polygon(lat, lng, polygon):
+    """
+    Even-odd ray casting test.
+    Args:
+        polygon: List of (lat, lng) vertices; the ring is closed implicitly.
+    """
+    inside = False
+    n = len(polygon)
+    j = n - 1
+    for i in range(n):
+        lat_i, lng_i = polygon[i]
+        lat_j, lng_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat):
+            crossing_lng = lng_i + (lat - lat_i) * (lng_j - lng_i) / (lat_j - lat_i)
+            if lng < crossing_lng:
+                inside = not inside
+        j = i
+    return inside
+
+
+def _side(origin, target, point):
+    # Which side of origin->target the point is on; points on the line count as the left side
+    return (
+        (target[1] - origin[1]) * (point[0] - origin[0])
+        - (target[0] - origin[0]) * (point[1] - origin[1])
+    ) >= 0
+
+
+def _segments_cross(a, b, c, d):
+    return _side(a, b, c) != _side(a, b, d) and _side(c, d, a) != _side(c, d, b)
+
+
+class PolygonGridIndex:
+    """
+    Uniform grid over polygon bounding boxes for constant-time point-in-polygon tests.
+    Every grid cell a polygon touches is classified once at build time:
+      - cells crossed by no edge are wholly inside (stored) or outside (dropped);
+      - boundary cells keep the few edges that touch them plus a reference point
+        (the cell centre) with its precomputed inside/outside state.
+    A lookup reads one cell and, for boundary cells, counts how many of those
+    local edges the segment from the reference point to the query crosses.
+    """
+
+    def __init__(self, polygons, cell_size=0.01):
+        """
+        Args:
+            polygons: Iterable of (key, vertices) with vertices as (lat, lng) pairs.
+            cell_size: Grid cell size in degrees.
+        """
+        self.cell_size = cell_size
+        self._cells = {}
+        self.keys = set()
+        for key, vertices in polygons:
+            self.add(key, vertices)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def add(self, key, vertices):
+        vertices = [(float(lat), float(lng)) for lat, lng in vertices]
+        if len(vertices) < 3:
+            return
+        self.keys.add(key)
+        edges = list(zip(vertices, vertices[1:] + vertices[:1]))
+
+        # Conservative edge -> cell assignment via each edge's bounding box
+        edge_cells = {}
+        for edge in edges:
+            (lat1, lng1), (lat2, lng2) = edge
+            row0, col0 = self._cell(min(lat1, lat2), min(lng1, lng2))
+            row1, col1 = self._cell(max(lat1, lat2), max(lng1, lng2))
+            for row in range(row0, row1 + 1):
+                for col in range(col0, col1 + 1):
+                    edge_cells.setdefault((row, col), []).append(edge)
+
+        lats = [lat for lat, _ in vertices]
+        lngs = [lng for _, lng in vertices]
+        row0, col0 = self._cell(min(lats), min(lngs))
+        row1, col1 = self._cell(max(lats), max(lngs))
+        half = self.cell_size / 2
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                center = (row * self.cell_size + half, col * self.cell_size + half)
+                center_inside = point_in_polygon(center[0], center[1], vertices)
+                local_edges = edge_cells.get((row, col))
+                if local_edges:
+                    entry = (key, (center, center_inside, local_edges))
+                elif center_inside:
+                    entry = (key, None)
+                else:
+                    continue
+                self._cells.setdefault((row, col), []).append(entry)
+
+    def lookup(self, lat, lng):
+        """Return the set of keys whose polygon contains (lat, lng)."""
+        point = (lat, lng)
+        matches = set()
+        for key, boundary in self._cells.get(self._cell(lat, lng), ()):
+            if boundary is None:
+                matches.add(key)
+                continue
+            center, inside, local_edges = boundary
+            for a, b in local_edges:
+                if _segments_cross(center, point, a, b):
+                    inside = not inside
+            if inside:
+                matches.add(key)
+        return matches
+
+    def __len__(self):
+        return len(self._cells)
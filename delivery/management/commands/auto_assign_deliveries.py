@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from delivery.dispatch import auto_assign_deliveries
+
+
+class Command(BaseCommand):
+    help = "Assign every paid, unassigned delivery to the best available rider."
+
+    def handle(self, *args, **options):
+        result = auto_assign_deliveries()
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {len(result['assigned'])} deliveries, {len(result['unassigned'])} without an available rider."
+        ))
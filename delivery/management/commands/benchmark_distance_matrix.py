@@ -0,0 +1,47 @@
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from delivery.road_network import RoadNetworkBackend, get_road_graph
+from delivery.utils import GeodesicBackend
+
+# Nairobi, used for random stops when no road graph is loaded
+DEFAULT_BOUNDS = (-1.35, 36.70, -1.22, 36.95)
+
+
+class Command(BaseCommand):
+    help = "Time a full distance-matrix build (no cache) for random stops with each available backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--backend', choices=['geodesic', 'road', 'all'], default='all')
+
+    def handle(self, *args, **options):
+        graph = get_road_graph()
+        backends = []
+        if options['backend'] in ('geodesic', 'all'):
+            backends.append(GeodesicBackend())
+        if options['backend'] in ('road', 'all'):
+            if graph is None:
+                if options['backend'] == 'road':
+                    raise CommandError("No road graph loaded; set ROAD_NETWORK_PATH.")
+                self.stdout.write("Road graph not configured, skipping the road backend.")
+            else:
+                backends.append(RoadNetworkBackend(graph))
+
+        min_lat, min_lng, max_lat, max_lng = graph.bounds() if graph is not None else DEFAULT_BOUNDS
+        rng = random.Random(options['seed'])
+        points = [
+            (rng.uniform(min_lat, max_lat), rng.uniform(min_lng, max_lng)) for _ in range(options['stops'])
+        ]
+        pairs = [(i, j) for i in range(len(points)) for j in range(len(points)) if i != j]
+
+        for backend in backends:
+            if isinstance(backend, RoadNetworkBackend):
+                backend.graph.snap(points[0])  # Build the snapping index outside the timing
+            started = time.perf_counter()
+            backend.distances(points, pairs)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{backend.name}: {len(points)} stops, {len(pairs)} pairs in {elapsed:.3f}s"
+            )
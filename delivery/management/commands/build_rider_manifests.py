@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from delivery.manifests import build_rider_manifests
+
+
+class Command(BaseCommand):
+    help = "Precompute rider manifests (stops, contacts, items and route) ahead of the shift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rider', type=int, action='append', dest='riders',
+                            help='Only build for this rider (repeatable).')
+
+    def handle(self, *args, **options):
+        etags = build_rider_manifests(rider_ids=options['riders'])
+        self.stdout.write(self.style.SUCCESS(f"Built {len(etags)} rider manifests."))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from delivery.road_network import RoadGraph
+
+
+class Command(BaseCommand):
+    help = "Compile an OSM XML road extract into the compact graph used by the 'road' distance backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('osm_file', help='Path to an .osm XML extract (e.g. exported with Overpass or osmium).')
+        parser.add_argument('--output', help='Destination .npz (defaults to ROAD_NETWORK_PATH).')
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.ROAD_NETWORK_PATH
+        if not output:
+            raise CommandError("Pass --output or set ROAD_NETWORK_PATH.")
+        try:
+            graph = RoadGraph.from_osm(options['osm_file'])
+        except (OSError, SyntaxError) as e:  # ElementTree.ParseError subclasses SyntaxError
+            raise CommandError(f"Could not read {options['osm_file']}: {e}")
+        if not graph.node_count:
+            raise CommandError("No drivable roads found in the extract.")
+        graph.save(output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved road graph with {graph.node_count} nodes and {graph.edge_count} edges to {output}"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from delivery.slots import reconcile_slot_counters
+
+
+class Command(BaseCommand):
+    help = "Reset the cached delivery slot counters to the booked deliveries in the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, action='append', help="Only this branch (repeatable)")
+
+    def handle(self, *args, **options):
+        written = reconcile_slot_counters(branch_ids=options['branch'])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {written} slot counters."))
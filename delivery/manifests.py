@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import json
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from orders.models import OrderItem
+from .models import Delivery
+from .routing import plan_delivery_route
+from .tracking import TRACKABLE_STATUSES, get_rider_location
+
+logger = logging.getLogger(__name__)
+
+RIDER_MANIFEST_KEY = "rider_manifest_{}"
+MANIFEST_FIELDS = (
+    'id', 'order_id', 'status', 'delivery_address', 'latitude', 'longitude',
+    'estimated_delivery_time', 'delivery_person_id',
+    'order__total_amount', 'order__payment_status', 'order__payment_phone_number',
+    'order__customer__first_name', 'order__customer__last_name', 'order__customer__phone_number',
+    'order__branch__latitude', 'order__branch__longitude',
+)
+
+
+def _manifest_timeout():
+    return getattr(settings, 'RIDER_MANIFEST_CACHE_TIMEOUT', 18 * 3600)
+
+
+def _pack(document):
+    body = json.dumps(document, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    return {
+        'etag': f'"{hashlib.sha1(body).hexdigest()}"',
+        'body': gzip.compress(body, mtime=0),
+    }
+
+
+def build_rider_manifests(rider_ids=None):
+    """
+    Precompute the manifest of every rider with open (assigned or in transit) deliveries.
+    Deliveries, customer contacts and item summaries are read with two queries
+    for all riders at once; each rider's stops are then ordered with the route planner.
+    Manifests are stored gzipped with their ETag under RIDER_MANIFEST_KEY.
+    Args:
+        rider_ids: Only build for these riders (all riders if None).
+    Returns:
+        Dict {rider_id: etag} of the manifests written.
+    """
+    deliveries = Delivery.objects.filter(status__in=TRACKABLE_STATUSES, delivery_person__isnull=False)
+    if rider_ids is not None:
+        deliveries = deliveries.filter(delivery_person_id__in=rider_ids)
+    rows = list(deliveries.order_by('estimated_delivery_time', 'id').values(*MANIFEST_FIELDS))
+
+    items = {}
+    for order_id, name, quantity in OrderItem.objects.filter(
+        order_id__in=[row['order_id'] for row in rows]
+    ).values_list('order_id', 'product_name', 'quantity').order_by('order_id', 'product_name'):
+        items.setdefault(order_id, []).append({'name': name, 'quantity': quantity})
+
+    by_rider = {rider_id: [] for rider_id in rider_ids or ()}
+    for row in rows:
+        by_rider.setdefault(row['delivery_person_id'], []).append(row)
+
+    generated_at = timezone.now()
+    packed = {
+        rider_id: _pack(_build_document(rider_id, rider_rows, items, generated_at))
+        for rider_id, rider_rows in by_rider.items()
+    }
+    if packed:
+        cache.set_many(
+            {RIDER_MANIFEST_KEY.format(rider_id): manifest for rider_id, manifest in packed.items()},
+            timeout=_manifest_timeout(),
+        )
+    logger.info(f"Built {len(packed)} rider manifests covering {len(rows)} deliveries")
+    return {rider_id: manifest['etag'] for rider_id, manifest in packed.items()}
+
+
+def _build_document(rider_id, rows, items, generated_at):
+    stops = {
+        row['id']: {
+            'delivery_id': row['id'],
+            'order_id': row['order_id'],
+            'status': row['status'],
+            'address': row['delivery_address'],
+            'lat': row['latitude'],
+            'lng': row['longitude'],
+            'eta': row['estimated_delivery_time'],
+            'customer_name': f"{row['order__customer__first_name']} {row['order__customer__last_name']}".strip(),
+            'customer_phone': row['order__customer__phone_number'] or row['order__payment_phone_number'],
+            'total_amount': row['order__total_amount'],
+            'payment_status': row['order__payment_status'],
+            'items': items.get(row['order_id'], []),
+        }
+        for row in rows
+    }
+
+    # Start from the rider's last known position, else the branch of their first stop
+    location = get_rider_location(rider_id)
+    if location is not None:
+        start = (location['latitude'], location['longitude'])
+    else:
+        start = next(
+            (
+                (row['order__branch__latitude'], row['order__branch__longitude'])
+                for row in rows if row['order__branch__latitude'] is not None
+            ),
+            None,
+        )
+
+    routable = [
+        (stop['delivery_id'], (stop['lat'], stop['lng']))
+        for stop in stops.values() if stop['lat'] is not None and stop['lng'] is not None
+    ]
+    plan = plan_delivery_route(rider_id, start, routable) if start and routable else None
+    ordered = plan['delivery_ids'] if plan else []
+    routed = set(ordered)
+    return {
+        'rider_id': rider_id,
+        'generated_at': generated_at,
+        'start': {'lat': start[0], 'lng': start[1]} if start else None,
+        'total_distance_m': plan['distance_m'] if plan else None,
+        'deliveries': [stops[delivery_id] for delivery_id in ordered]
+        + [stop for delivery_id, stop in stops.items() if delivery_id not in routed],
+        'unrouted': [delivery_id for delivery_id in stops if delivery_id not in routed],
+    }
+
+
+def get_rider_manifest(rider_id):
+    """
+    Return the cached {'etag', 'body'} manifest for a rider, building it on a miss.
+    The body is gzip-compressed JSON.
+    """
+    key = RIDER_MANIFEST_KEY.format(rider_id)
+    manifest = cache.get(key)
+    if manifest is None:
+        build_rider_manifests(rider_ids=[rider_id])
+        manifest = cache.get(key)
+    return manifest
+
+
+def invalidate_rider_manifest(*rider_ids):
+    cache.delete_many([RIDER_MANIFEST_KEY.format(rider_id) for rider_id in rider_ids if rider_id])
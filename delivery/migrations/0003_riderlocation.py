@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-19 07:29
+
+import django.contrib.postgres.indexes
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0002_alter_delivery_delivery_person'),
+        ('orders', '0007_alter_branch_options_alter_order_branch_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiderLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.FloatField(validators=[django.core.validators.MinValueValidator(-90.0), django.core.validators.MaxValueValidator(90.0)])),
+                ('longitude', models.FloatField(validators=[django.core.validators.MinValueValidator(-180.0), django.core.validators.MaxValueValidator(180.0)])),
+                ('accuracy', models.FloatField(blank=True, null=True)),
+                ('speed', models.FloatField(blank=True, null=True)),
+                ('heading', models.FloatField(blank=True, null=True)),
+                ('recorded_at', models.DateTimeField()),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-recorded_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='delivery',
+            name='delivery_address',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='delivery',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('assigned', 'Assigned'), ('in_transit', 'In Transit'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], default='pending', max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_person', 'status'], name='delivery_de_deliver_469b35_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['order'], name='delivery_de_order_i_6d5362_idx'),
+        ),
+        migrations.AddField(
+            model_name='riderlocation',
+            name='rider',
+            field=models.ForeignKey(db_index=False, limit_choices_to={'role': 'delivery'}, on_delete=django.db.models.deletion.CASCADE, related_name='locations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='riderlocation',
+            index=models.Index(fields=['rider', '-recorded_at'], name='delivery_ri_rider_i_5768c6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='riderlocation',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['recorded_at'], name='delivery_ri_recorde_20332a_brin'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-19 07:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0003_riderlocation'),
+        ('orders', '0008_deliveryzone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, max_length=15)),
+                ('to_status', models.CharField(max_length=15)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('branch', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.branch')),
+                ('delivery', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='delivery.delivery')),
+                ('rider', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['delivery', 'created_at'], name='delivery_de_deliver_c068c3_idx'), models.Index(fields=['to_status', 'created_at'], name='delivery_de_to_stat_63f9ae_idx'), models.Index(fields=['branch', 'to_status', 'created_at'], name='delivery_de_branch__447783_idx'), models.Index(fields=['rider', 'to_status', 'created_at'], name='delivery_de_rider_i_65426a_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeliverySLA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivered_at', models.DateTimeField()),
+                ('pending_seconds', models.PositiveIntegerField(blank=True, null=True)),
+                ('assigned_seconds', models.PositiveIntegerField(blank=True, null=True)),
+                ('in_transit_seconds', models.PositiveIntegerField(blank=True, null=True)),
+                ('assigned_to_delivered_seconds', models.PositiveIntegerField(blank=True, null=True)),
+                ('total_seconds', models.PositiveIntegerField()),
+                ('branch', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.branch')),
+                ('delivery', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sla', to='delivery.delivery')),
+                ('rider', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-delivered_at'],
+                'indexes': [models.Index(fields=['delivered_at'], name='delivery_de_deliver_9bfffc_idx'), models.Index(fields=['branch', 'delivered_at'], name='delivery_de_branch__467016_idx'), models.Index(fields=['rider', 'delivered_at'], name='delivery_de_rider_i_14ee65_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-19 07:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_geohash(apps, schema_editor):
+    from delivery.geo import geohash_encode
+    Delivery = apps.get_model('delivery', 'Delivery')
+    deliveries = Delivery.objects.filter(latitude__isnull=False, longitude__isnull=False).only('id', 'latitude', 'longitude')
+    batch = []
+    for delivery in deliveries.iterator(chunk_size=2000):
+        delivery.geohash = geohash_encode(delivery.latitude, delivery.longitude, 9)
+        batch.append(delivery)
+        if len(batch) == 2000:
+            Delivery.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Delivery.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0004_deliveryevent_deliverysla'),
+        ('orders', '0008_deliveryzone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='geohash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['geohash'], name='delivery_geohash_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-19 07:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0005_delivery_geohash'),
+        ('orders', '0009_order_delivery_fee'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='slot_start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['slot_start'], name='delivery_de_slot_st_83d805_idx'),
+        ),
+    ]
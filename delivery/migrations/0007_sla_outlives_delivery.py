@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 08:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0006_delivery_slot_start'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deliverysla',
+            name='delivery',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sla', to='delivery.delivery'),
+        ),
+    ]
@@ -1,9 +1,20 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.contrib.postgres.indexes import BrinIndex
 from django.utils import timezone
 from datetime import timedelta
-from orders.models import Order
+from orders.models import Order, Branch
 from users.models import CustomUser  # Assuming 'users' app
+from .geo import geohash_encode
+
+GEOHASH_PRECISION = 9  # ~5 m cells; clustering groups by shorter prefixes
+STATUS_TRANSITIONS = {
+    'pending': ['assigned', 'cancelled'],
+    'assigned': ['in_transit', 'cancelled'],
+    'in_transit': ['delivered', 'cancelled'],
+    'delivered': [],
+    'cancelled': []
+}
 
 def default_estimated_delivery_time():
     """Return the default estimated delivery time (2 days from now)."""
@@ -46,22 +57,45 @@ class Delivery(models.Model):
         default=default_estimated_delivery_time
     )
     actual_delivery_time = models.DateTimeField(null=True, blank=True)
+    slot_start = models.DateTimeField(null=True, blank=True)  # Booked delivery window, see delivery/slots.py
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Delivery for Order {self.order.id} - Status: {self.status}"
 
+    def remember_saved_state(self):
+        """
+        Snapshot the stored status and rider, compared against by save() and the signal
+        receivers; taken on load (post_init), after each save and on refresh_from_db().
+        """
+        self._original_status = self.__dict__.get('status')
+        self._original_rider_id = self.__dict__.get('delivery_person_id')
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None or {'status', 'delivery_person', 'delivery_person_id'} & set(fields):
+            self.remember_saved_state()
+
+    def save(self, *args, **kwargs):
+        """Save and, if the status changed, append a DeliveryEvent in the same transaction."""
+        previous_status = None if self._state.adding else self._original_status
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geohash_encode(self.latitude, self.longitude, GEOHASH_PRECISION)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.status != previous_status:
+                DeliveryEvent.record(self, previous_status)
+
     def can_transition_to(self, new_status):
         """Define valid status transitions."""
-        transitions = {
-            'pending': ['assigned', 'cancelled'],
-            'assigned': ['in_transit', 'cancelled'],
-            'in_transit': ['delivered', 'cancelled'],
-            'delivered': [],
-            'cancelled': []
-        }
-        return new_status in transitions.get(self.status, [])
+        return new_status in STATUS_TRANSITIONS.get(self.status, [])
 
     def update_status(self, new_status):
         """Update status with transition validation."""
@@ -77,4 +111,148 @@ class Delivery(models.Model):
         indexes = [
             models.Index(fields=['delivery_person', 'status']),
             models.Index(fields=['order']),
-        ]
\ No newline at end of file
+            models.Index(fields=['slot_start']),
+            # Prefix (LIKE 'abc%') scans for map clustering
+            models.Index(fields=['geohash'], name='delivery_geohash_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+
+class RiderLocation(models.Model):
+    """Append-only GPS ping, written in bulk by the tracking buffer."""
+    rider = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='locations',
+        db_index=False,  # Covered by the (rider, recorded_at) index
+        limit_choices_to={'role': 'delivery'}
+    )
+    latitude = models.FloatField(validators=[MinValueValidator(-90.0), MaxValueValidator(90.0)])
+    longitude = models.FloatField(validators=[MinValueValidator(-180.0), MaxValueValidator(180.0)])
+    accuracy = models.FloatField(null=True, blank=True)  # meters
+    speed = models.FloatField(null=True, blank=True)  # m/s
+    heading = models.FloatField(null=True, blank=True)  # degrees
+    recorded_at = models.DateTimeField()
+    received_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Rider {self.rider_id} at ({self.latitude}, {self.longitude}) - {self.recorded_at}"
+
+    class Meta:
+        ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['rider', '-recorded_at']),
+            BrinIndex(fields=['recorded_at']),
+        ]
+
+
+class DeliveryEvent(models.Model):
+    """Append-only log of delivery status transitions."""
+    delivery = models.ForeignKey(
+        Delivery,
+        on_delete=models.CASCADE,
+        related_name='events',
+        db_index=False,  # Covered by the (delivery, created_at) index
+    )
+    from_status = models.CharField(max_length=15, blank=True)
+    to_status = models.CharField(max_length=15)
+    rider = models.ForeignKey(
+        CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False
+    )
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Delivery {self.delivery_id}: {self.from_status or '-'} -> {self.to_status} at {self.created_at}"
+
+    @classmethod
+    def record(cls, delivery, from_status):
+        event = cls.objects.create(
+            delivery=delivery,
+            from_status=from_status or '',
+            to_status=delivery.status,
+            rider_id=delivery.delivery_person_id,
+            branch_id=delivery.order.branch_id,
+        )
+        if delivery.status == 'delivered':
+            DeliverySLA.record(delivery, event)
+        return event
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['delivery', 'created_at']),
+            models.Index(fields=['to_status', 'created_at']),
+            models.Index(fields=['branch', 'to_status', 'created_at']),
+            models.Index(fields=['rider', 'to_status', 'created_at']),
+        ]
+
+
+class DeliverySLA(models.Model):
+    """
+    Per-delivery stage durations, written once when a delivery is delivered.
+    Percentiles per branch or rider over a period read only this table through its indexes.
+    Facts outlive their delivery (delivery is set to NULL when it is archived or deleted).
+    """
+    delivery = models.OneToOneField(Delivery, on_delete=models.SET_NULL, null=True, blank=True, related_name='sla')
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False)
+    rider = models.ForeignKey(
+        CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False
+    )
+    delivered_at = models.DateTimeField()
+    pending_seconds = models.PositiveIntegerField(null=True, blank=True)  # created -> assigned
+    assigned_seconds = models.PositiveIntegerField(null=True, blank=True)  # assigned -> in_transit
+    in_transit_seconds = models.PositiveIntegerField(null=True, blank=True)  # in_transit -> delivered
+    assigned_to_delivered_seconds = models.PositiveIntegerField(null=True, blank=True)
+    total_seconds = models.PositiveIntegerField()  # created -> delivered
+
+    METRICS = ('pending_seconds', 'assigned_seconds', 'in_transit_seconds', 'assigned_to_delivered_seconds', 'total_seconds')
+
+    def __str__(self):
+        return f"SLA for Delivery {self.delivery_id}: {self.total_seconds}s"
+
+    @staticmethod
+    def stage_durations(created_at, reached, delivered_at):
+        """
+        Args:
+            created_at: When the delivery was created.
+            reached: Dict {status: time the delivery last entered it}.
+        Returns:
+            Dict of the duration fields in seconds (None for stages that were skipped).
+        """
+        def seconds(start, end):
+            if start is None or end is None:
+                return None
+            return max(0, int((end - start).total_seconds()))
+
+        assigned_at, in_transit_at = reached.get('assigned'), reached.get('in_transit')
+        return {
+            'pending_seconds': seconds(created_at, assigned_at),
+            'assigned_seconds': seconds(assigned_at, in_transit_at),
+            'in_transit_seconds': seconds(in_transit_at, delivered_at),
+            'assigned_to_delivered_seconds': seconds(assigned_at, delivered_at),
+            'total_seconds': seconds(created_at, delivered_at),
+        }
+
+    @classmethod
+    def record(cls, delivery, delivered_event):
+        # Latest entry into each stage, from the (delivery, created_at) index
+        reached = dict(
+            DeliveryEvent.objects.filter(delivery=delivery).order_by('created_at').values_list('to_status', 'created_at')
+        )
+        return cls.objects.update_or_create(
+            delivery=delivery,
+            defaults={
+                'branch_id': delivered_event.branch_id,
+                'rider_id': delivered_event.rider_id,
+                'delivered_at': delivered_event.created_at,
+                **cls.stage_durations(delivery.created_at, reached, delivered_event.created_at),
+            },
+        )[0]
+
+    class Meta:
+        ordering = ['-delivered_at']
+        indexes = [
+            models.Index(fields=['delivered_at']),
+            models.Index(fields=['branch', 'delivered_at']),
+            models.Index(fields=['rider', 'delivered_at']),
+        ]
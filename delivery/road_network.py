@@ -0,0 +1,325 @@
+"""
+Offline road-network distances for route optimization.
+
+A local OpenStreetMap extract (.osm XML, e.g. from Overpass or `osmium cat`)
+is compiled once by `manage.py build_road_network` into a compact CSR graph
+(.npz). Only intersections are kept as nodes; the shape points between them
+are folded into edge lengths. At runtime the graph is loaded once per process,
+stops are snapped to their nearest node, and many-to-many road distances are
+computed with one early-exit Dijkstra per source.
+"""
+import heapq
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from array import array
+import numpy as np
+from django.conf import settings
+from .geo import KDTree, haversine_m
+
+try:  # Optional: vectorized Dijkstra when SciPy is installed
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+except ImportError:  # pragma: no cover
+    csr_matrix = csgraph_dijkstra = None
+
+logger = logging.getLogger(__name__)
+
+DRIVABLE_HIGHWAYS = {
+    'motorway', 'motorway_link', 'trunk', 'trunk_link', 'primary', 'primary_link',
+    'secondary', 'secondary_link', 'tertiary', 'tertiary_link', 'unclassified',
+    'residential', 'living_street', 'service', 'road',
+}
+ONEWAY_FORWARD = {'yes', '1', 'true'}
+ONEWAY_REVERSE = {'-1', 'reverse'}
+
+
+class RoadGraph:
+    """
+    Directed road graph in CSR form.
+    Node i sits at (lat[i], lng[i]); its outgoing edges are
+    indices[indptr[i]:indptr[i + 1]] with lengths (meters) in the same slots of weights.
+    """
+
+    def __init__(self, lat, lng, indptr, indices, weights):
+        self.lat = array('d', lat)
+        self.lng = array('d', lng)
+        self.indptr = array('l', indptr)
+        self.indices = array('l', indices)
+        self.weights = array('f', weights)
+        self._tree = None
+        self._csr = None
+        self._lock = threading.Lock()
+
+    @property
+    def node_count(self):
+        return len(self.lat)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def bounds(self):
+        """Return (min_lat, min_lng, max_lat, max_lng) of the graph."""
+        return (min(self.lat), min(self.lng), max(self.lat), max(self.lng))
+
+    # Building and persistence
+
+    @classmethod
+    def from_osm(cls, path):
+        """
+        Compile an OSM XML extract into a RoadGraph.
+        Ways are split at intersections and shape points are folded into edge lengths.
+        """
+        coords = {}
+        ways = []
+        for _, element in ET.iterparse(path, events=('end',)):
+            if element.tag == 'node':
+                coords[int(element.get('id'))] = (float(element.get('lat')), float(element.get('lon')))
+            elif element.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in element.iter('tag')}
+                if tags.get('highway') in DRIVABLE_HIGHWAYS and tags.get('access') not in ('no', 'private'):
+                    refs = [int(nd.get('ref')) for nd in element.iter('nd')]
+                    oneway = tags.get('oneway', '')
+                    if oneway in ONEWAY_REVERSE:
+                        refs.reverse()
+                    is_oneway = (
+                        oneway in ONEWAY_FORWARD or oneway in ONEWAY_REVERSE
+                        or tags.get('junction') == 'roundabout'
+                        or tags.get('highway') == 'motorway'
+                    )
+                    if len(refs) >= 2:
+                        ways.append((refs, is_oneway))
+            if element.tag in ('node', 'way', 'relation'):
+                element.clear()
+
+        # Intersections: way endpoints and nodes shared by more than one way position
+        usage = {}
+        for refs, _ in ways:
+            for ref in refs:
+                usage[ref] = usage.get(ref, 0) + 1
+        keep = set()
+        for refs, _ in ways:
+            keep.add(refs[0])
+            keep.add(refs[-1])
+        keep.update(ref for ref, count in usage.items() if count > 1)
+        keep &= coords.keys()
+
+        node_ids = {}
+        lat, lng = [], []
+        edges = {}
+        for refs, is_oneway in ways:
+            refs = [ref for ref in refs if ref in coords]
+            segment_start, length = None, 0.0
+            for previous, ref in zip([None] + refs[:-1], refs):
+                if previous is not None:
+                    length += haversine_m(coords[previous], coords[ref])
+                if ref in keep:
+                    if ref not in node_ids:
+                        node_ids[ref] = len(lat)
+                        lat.append(coords[ref][0])
+                        lng.append(coords[ref][1])
+                    if segment_start is not None and segment_start != ref:
+                        a, b = node_ids[segment_start], node_ids[ref]
+                        # Keep the shortest of parallel edges
+                        if length < edges.get((a, b), float('inf')):
+                            edges[(a, b)] = length
+                        if not is_oneway and length < edges.get((b, a), float('inf')):
+                            edges[(b, a)] = length
+                    segment_start, length = ref, 0.0
+
+        ordered = sorted(edges.items())
+        indptr = [0] * (len(lat) + 1)
+        for (a, _), _ in ordered:
+            indptr[a + 1] += 1
+        for i in range(len(lat)):
+            indptr[i + 1] += indptr[i]
+        indices = [b for (_, b), _ in ordered]
+        weights = [length for _, length in ordered]
+        logger.info(f"Road graph compiled: {len(lat)} nodes, {len(indices)} edges from {len(ways)} ways")
+        return cls(lat, lng, indptr, indices, weights)
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            lat=np.frombuffer(self.lat, dtype=np.float64),
+            lng=np.frombuffer(self.lng, dtype=np.float64),
+            indptr=np.asarray(self.indptr, dtype=np.int64),
+            indices=np.asarray(self.indices, dtype=np.int64),
+            weights=np.frombuffer(self.weights, dtype=np.float32),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data['lat'].tolist(),
+                data['lng'].tolist(),
+                data['indptr'].tolist(),
+                data['indices'].tolist(),
+                data['weights'].tolist(),
+            )
+
+    # Queries
+
+    def snap(self, point):
+        """Return (node, offset_m) for the graph node nearest to a (lat, lng) point."""
+        if self._tree is None:
+            with self._lock:
+                if self._tree is None:
+                    self._tree = KDTree(zip(self.lat, self.lng, range(self.node_count)))
+        nearest = self._tree.nearest(point[0], point[1])
+        return nearest[0] if nearest else (None, None)
+
+    def shortest_paths(self, source, targets):
+        """
+        Dijkstra from one node, stopping once every target is settled.
+        Returns:
+            (distances, predecessors) lists indexed by node; unreached nodes are inf / -1.
+        """
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        inf = float('inf')
+        distances = [inf] * self.node_count
+        predecessors = [-1] * self.node_count
+        distances[source] = 0.0
+        remaining = set(targets)
+        remaining.discard(source)
+        heap = [(0.0, source)]
+        heappop, heappush = heapq.heappop, heapq.heappush
+        while heap and remaining:
+            distance, node = heappop(heap)
+            if distance > distances[node]:
+                continue
+            remaining.discard(node)
+            for k in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[k]
+                candidate = distance + weights[k]
+                if candidate < distances[neighbour]:
+                    distances[neighbour] = candidate
+                    predecessors[neighbour] = node
+                    heappush(heap, (candidate, neighbour))
+        return distances, predecessors
+
+    def many_to_many(self, sources, targets):
+        """
+        Road distances in meters between graph nodes.
+        Returns:
+            Dict {(source, target): meters or None if unreachable}.
+        """
+        sources, targets = list(dict.fromkeys(sources)), list(dict.fromkeys(targets))
+        result = {}
+        if csgraph_dijkstra is not None and len(sources) > 1:
+            if self._csr is None:
+                self._csr = csr_matrix(
+                    (np.asarray(self.weights, dtype=np.float64), np.asarray(self.indices), np.asarray(self.indptr)),
+                    shape=(self.node_count, self.node_count),
+                )
+            target_index = np.asarray(targets)
+            # Chunk sources so the dense result stays small on large graphs
+            for start in range(0, len(sources), 32):
+                chunk = sources[start:start + 32]
+                rows = csgraph_dijkstra(self._csr, directed=True, indices=chunk)[:, target_index]
+                for source, row in zip(chunk, rows):
+                    for target, distance in zip(targets, row.tolist()):
+                        result[(source, target)] = None if distance == float('inf') else distance
+            return result
+
+        for source in sources:
+            distances, _ = self.shortest_paths(source, targets)
+            for target in targets:
+                distance = distances[target]
+                result[(source, target)] = None if distance == float('inf') else distance
+        return result
+
+    def path(self, source, target):
+        """Return the list of (lat, lng) node positions on the shortest path, or None."""
+        distances, predecessors = self.shortest_paths(source, [target])
+        if distances[target] == float('inf'):
+            return None
+        nodes = []
+        node = target
+        while node != -1:
+            nodes.append(node)
+            node = predecessors[node]
+        nodes.reverse()
+        return [(self.lat[node], self.lng[node]) for node in nodes]
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_road_graph():
+    """Load the graph at ROAD_NETWORK_PATH once per process; returns None if unavailable."""
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                path = getattr(settings, 'ROAD_NETWORK_PATH', '')
+                if not path:
+                    return None
+                try:
+                    _graph = RoadGraph.load(path)
+                    logger.info(f"Loaded road graph from {path}: {_graph.node_count} nodes, {_graph.edge_count} edges")
+                except (OSError, KeyError, ValueError) as e:
+                    logger.error(f"Failed to load road graph from {path}: {str(e)}")
+                    return None
+    return _graph
+
+
+def route_geometry(points):
+    """
+    Road geometry through consecutive (lat, lng) points, following the shortest path of each leg.
+    Returns:
+        List of (lat, lng), or None when no road graph is loaded.
+    """
+    graph = get_road_graph()
+    if graph is None or not points:
+        return None
+    snapped = [graph.snap(point)[0] for point in points]
+    geometry = [tuple(points[0])]
+    for index in range(1, len(points)):
+        leg = graph.path(snapped[index - 1], snapped[index])
+        if leg:
+            geometry.extend(leg)
+        geometry.append(tuple(points[index]))
+    # Drop consecutive duplicates where a stop sits on its snapped node
+    return [point for index, point in enumerate(geometry) if index == 0 or point != geometry[index - 1]]
+
+
+class RoadNetworkBackend:
+    """
+    Distance backend over the offline road graph.
+    Stops are snapped to the nearest intersection and the snapping offsets are
+    added to both ends; unreachable pairs fall back to a detoured straight line.
+    """
+    name = 'road'
+    symmetric = False  # One-way streets
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def distances(self, points, pairs):
+        """
+        Args:
+            points: List of (lat, lng).
+            pairs: Iterable of (i, j) index pairs into points.
+        Returns:
+            Dict {(i, j): integer meters}.
+        """
+        pairs = list(pairs)
+        needed = {index for pair in pairs for index in pair}
+        snapped = {index: self.graph.snap(points[index]) for index in needed}
+        node_distances = self.graph.many_to_many(
+            [snapped[i][0] for i, _ in pairs], [snapped[j][0] for _, j in pairs]
+        )
+        detour = getattr(settings, 'ROAD_NETWORK_DETOUR_FACTOR', 1.4)
+        result = {}
+        for i, j in pairs:
+            (source, source_offset), (target, target_offset) = snapped[i], snapped[j]
+            road = node_distances.get((source, target))
+            if road is None:
+                result[(i, j)] = int(haversine_m(points[i], points[j]) * detour)
+            else:
+                result[(i, j)] = int(source_offset + road + target_offset)
+        return result
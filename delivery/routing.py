@@ -0,0 +1,227 @@
+import hashlib
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .utils import build_distance_matrix, coordinate_key, route_length, solve_route_order
+
+logger = logging.getLogger(__name__)
+
+RIDER_ROUTE_KEY = "rider_route_{}"
+
+
+def _route_cache_key(start_location, stops):
+    # Canonical stop set: order-independent, coordinates rounded, start snapped to ~100 m
+    start_precision = getattr(settings, 'ROUTE_START_PRECISION', 3)
+    start = f"{round(start_location[0], start_precision)},{round(start_location[1], start_precision)}"
+    stop_set = sorted(f"{delivery_id}@{coordinate_key(point)}" for delivery_id, point in stops)
+    digest = hashlib.sha1("|".join([start] + stop_set).encode()).hexdigest()
+    return f"route_plan_{digest}"
+
+
+def _best_insertion(order, node, distance_matrix):
+    # Position and added length of the cheapest place for node in the closed tour 0 -> order -> 0
+    best_position, best_cost = 0, None
+    for position in range(len(order) + 1):
+        previous = order[position - 1] if position > 0 else 0
+        following = order[position] if position < len(order) else 0
+        cost = (
+            distance_matrix[previous][node]
+            + distance_matrix[node][following]
+            - distance_matrix[previous][following]
+        )
+        if best_cost is None or cost < best_cost:
+            best_position, best_cost = position, cost
+    return best_position, best_cost
+
+
+def cheapest_insertion(order, nodes, distance_matrix):
+    """
+    Insert nodes one by one where each adds the least distance to the closed tour 0 -> order -> 0.
+    Args:
+        order: Current visiting order (list of node indices, depot 0 excluded). Modified in place.
+        nodes: Nodes to insert.
+    Returns:
+        The updated order.
+    """
+    for node in nodes:
+        position, _ = _best_insertion(order, node, distance_matrix)
+        order.insert(position, node)
+    return order
+
+
+def relocate_polish(order, distance_matrix, time_limit_ms=None):
+    """
+    Local search that moves single stops to their cheapest position while that shortens the tour.
+    Works for asymmetric matrices and stops at the time limit.
+    Args:
+        order: Visiting order (depot 0 excluded). Modified in place.
+        time_limit_ms: Budget in milliseconds (defaults to ROUTE_POLISH_MS).
+    Returns:
+        The updated order.
+    """
+    if time_limit_ms is None:
+        time_limit_ms = getattr(settings, 'ROUTE_POLISH_MS', 50)
+    deadline = time.perf_counter() + time_limit_ms / 1000
+    improved = True
+    while improved:
+        improved = False
+        for node in list(order):
+            if time.perf_counter() > deadline:
+                return order
+            position = order.index(node)
+            previous = order[position - 1] if position > 0 else 0
+            following = order[position + 1] if position + 1 < len(order) else 0
+            saving = (
+                distance_matrix[previous][node]
+                + distance_matrix[node][following]
+                - distance_matrix[previous][following]
+            )
+            order.pop(position)
+            best_position, cost = _best_insertion(order, node, distance_matrix)
+            if cost < saving:
+                order.insert(best_position, node)
+                improved = True
+            else:
+                order.insert(position, node)
+    return order
+
+
+def plan_delivery_route(rider_id, start_location, stops):
+    """
+    Optimize the visiting order of a rider's stops, reusing earlier work where possible:
+      - the exact same stop set returns the cached plan;
+      - a changed stop set warm-starts from the rider's previous route, keeping its
+        order for remaining stops and inserting new ones at their cheapest position;
+      - pair distances come from the distance cache.
+    Args:
+        rider_id: Delivery person the route belongs to.
+        start_location: Tuple (lat, lng).
+        stops: List of (delivery_id, (lat, lng)).
+    Returns:
+        Dict with 'delivery_ids' (visiting order), 'distance_m', 'cached' and 'warm_start',
+        or None if no route could be computed.
+    """
+    if not stops:
+        return None
+
+    plan_key = _route_cache_key(start_location, stops)
+    plan = cache.get(plan_key)
+    if plan is not None:
+        logger.info(f"Route cache hit for rider {rider_id} with {len(stops)} stops")
+        _store_rider_route(rider_id, start_location, plan['delivery_ids'], dict(stops), plan['distance_m'])
+        return {**plan, 'cached': True, 'warm_start': False}
+
+    points = [tuple(start_location)] + [tuple(point) for _, point in stops]
+    distance_matrix = build_distance_matrix(points)
+    node_of = {delivery_id: index + 1 for index, (delivery_id, _) in enumerate(stops)}
+
+    initial_order = None
+    previous = get_rider_route(rider_id)
+    if previous:
+        kept = [node_of[delivery_id] for delivery_id, _ in previous['stops'] if delivery_id in node_of]
+        if kept:
+            kept_nodes = set(kept)
+            added = [node for node in node_of.values() if node not in kept_nodes]
+            initial_order = cheapest_insertion(kept, added, distance_matrix)
+
+    if initial_order is not None:
+        order = solve_route_order(
+            distance_matrix,
+            initial_order=initial_order,
+            time_limit=getattr(settings, 'ROUTE_WARM_START_SECONDS', 2),
+        )
+    else:
+        order = solve_route_order(distance_matrix)
+    if order is None:
+        return None
+
+    plan = {
+        'delivery_ids': [stops[node - 1][0] for node in order],
+        'distance_m': route_length(order, distance_matrix),
+    }
+    cache.set(plan_key, plan, timeout=_route_timeout())
+    _store_rider_route(rider_id, start_location, plan['delivery_ids'], dict(stops), plan['distance_m'])
+    logger.info(
+        f"Route planned for rider {rider_id}: {len(stops)} stops, {plan['distance_m']} m, "
+        f"{'warm' if initial_order is not None else 'cold'} start"
+    )
+    return {**plan, 'cached': False, 'warm_start': initial_order is not None}
+
+
+def get_rider_route(rider_id):
+    """
+    Return the rider's current route: {'start': (lat, lng), 'stops': [(delivery_id, (lat, lng)), ...]
+    in visiting order, 'distance_m'}, or None if no route has been planned.
+    """
+    return cache.get(RIDER_ROUTE_KEY.format(rider_id))
+
+
+def _store_rider_route(rider_id, start_location, delivery_ids, points, distance_m):
+    cache.set(RIDER_ROUTE_KEY.format(rider_id), {
+        'start': tuple(start_location),
+        'stops': [(delivery_id, tuple(points[delivery_id])) for delivery_id in delivery_ids],
+        'distance_m': distance_m,
+    }, timeout=_route_timeout())
+
+
+def _resequence(rider_id, route, stops, inserted, polish):
+    # stops keep their stored order; inserted delivery ids are placed by cheapest insertion
+    points = [route['start']] + [point for _, point in stops]
+    distance_matrix = build_distance_matrix(points)
+    node_of = {delivery_id: index + 1 for index, (delivery_id, _) in enumerate(stops)}
+    order = [node for delivery_id, node in node_of.items() if delivery_id not in inserted]
+    cheapest_insertion(order, [node_of[delivery_id] for delivery_id in inserted], distance_matrix)
+    if polish:
+        relocate_polish(order, distance_matrix)
+    delivery_ids = [stops[node - 1][0] for node in order]
+    distance_m = route_length(order, distance_matrix)
+    _store_rider_route(rider_id, route['start'], delivery_ids, dict(stops), distance_m)
+    return {'delivery_ids': delivery_ids, 'distance_m': distance_m}
+
+
+def insert_stop(rider_id, delivery_id, point, polish=True):
+    """
+    Add one stop to the rider's current route at its cheapest position, without a full re-solve.
+    Args:
+        point: (lat, lng) of the stop; an existing stop with the same id is moved.
+        polish: Follow with a short relocate local search (ROUTE_POLISH_MS).
+    Returns:
+        Dict with 'delivery_ids' and 'distance_m', or None if the rider has no current route.
+    """
+    route = get_rider_route(rider_id)
+    if route is None:
+        return None
+    stops = [stop for stop in route['stops'] if stop[0] != delivery_id] + [(delivery_id, tuple(point))]
+    result = _resequence(rider_id, route, stops, {delivery_id}, polish)
+    logger.info(f"Inserted delivery {delivery_id} into route of rider {rider_id} ({len(stops)} stops)")
+    return result
+
+
+def remove_stop(rider_id, delivery_id, polish=False):
+    """
+    Drop one stop from the rider's current route, keeping the order of the others.
+    Returns:
+        Dict with 'delivery_ids' and 'distance_m', or None if the rider has no current route.
+    """
+    return remove_stops(rider_id, [delivery_id], polish=polish)
+
+
+def remove_stops(rider_id, delivery_ids, polish=False):
+    """Drop several stops from the rider's current route in one pass; see remove_stop."""
+    route = get_rider_route(rider_id)
+    if route is None:
+        return None
+    removed = set(delivery_ids)
+    stops = [stop for stop in route['stops'] if stop[0] not in removed]
+    if len(stops) == len(route['stops']):
+        return {'delivery_ids': [stop[0] for stop in stops], 'distance_m': route['distance_m']}
+    result = _resequence(rider_id, route, stops, set(), polish)
+    logger.info(
+        f"Removed {len(route['stops']) - len(stops)} deliveries from route of rider {rider_id} ({len(stops)} stops)"
+    )
+    return result
+
+
+def _route_timeout():
+    return getattr(settings, 'ROUTE_PLAN_CACHE_TIMEOUT', 6 * 3600)
@@ -1,7 +1,11 @@
 from rest_framework import serializers
 import requests
 from time import sleep
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
 from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from .models import Delivery
 from orders.serializers import OrderSerializer
 from users.serializers import CustomUserSerializer
@@ -32,9 +36,9 @@ class DeliverySerializer(serializers.ModelSerializer):
         fields = [
             'id', 'order', 'order_id', 'delivery_person', 'delivery_person_id',
             'status', 'delivery_address', 'latitude', 'longitude',
-            'estimated_delivery_time', 'actual_delivery_time', 'created_at', 'updated_at'
+            'estimated_delivery_time', 'actual_delivery_time', 'slot_start', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at','delivery_address', 'updated_at', 'actual_delivery_time']
+        read_only_fields = ['created_at','delivery_address', 'updated_at', 'actual_delivery_time', 'slot_start']
 
     def validate_order(self, order):
         if not hasattr(order, 'payment') or order.payment.status != 'successful':
@@ -108,6 +112,8 @@ class RouteOptimizationSerializer(serializers.Serializer):
         child=serializers.ListField(child=serializers.FloatField(), min_length=2, max_length=2),
         required=False
     )  # [[lat, lng], ...]
+    route_format = serializers.ChoiceField(choices=['full', 'polyline'], default='full', required=False)
+    geometry = serializers.BooleanField(default=False, required=False)  # Road path, needs the road backend
 
     def validate_delivery_ids(self, value):
         """
@@ -117,4 +123,99 @@ class RouteOptimizationSerializer(serializers.Serializer):
         deliveries = Delivery.objects.filter(id__in=value, delivery_person=user)
         if len(deliveries) != len(value):
             raise serializers.ValidationError("Some delivery IDs are invalid or not assigned to you.")
-        return value
\ No newline at end of file
+        return value
+
+
+class BulkDeliveryStatusSerializer(serializers.Serializer):
+    delivery_ids = serializers.ListField(child=serializers.IntegerField(), min_length=1)
+    status = serializers.ChoiceField(choices=Delivery._meta.get_field('status').choices)
+
+    def validate_delivery_ids(self, value):
+        max_batch = getattr(settings, 'DELIVERY_BULK_MAX', 5000)
+        if len(value) > max_batch:
+            raise serializers.ValidationError(f"At most {max_batch} deliveries can be updated per request.")
+        return value
+
+
+class DeliveryClusterQuerySerializer(serializers.Serializer):
+    bbox = serializers.CharField(help_text='min_lat,min_lng,max_lat,max_lng')
+    zoom = serializers.IntegerField(min_value=0, max_value=22)
+    status = serializers.CharField(required=False, help_text='Comma-separated statuses')
+
+    def validate_bbox(self, value):
+        try:
+            min_lat, min_lng, max_lat, max_lng = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError("bbox must be min_lat,min_lng,max_lat,max_lng.")
+        if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+            raise serializers.ValidationError("bbox is out of range or inverted.")
+        return (min_lat, min_lng, max_lat, max_lng)
+
+    def validate_status(self, value):
+        statuses = [status.strip() for status in value.split(',') if status.strip()]
+        valid = {choice for choice, _ in Delivery._meta.get_field('status').choices}
+        invalid = set(statuses) - valid
+        if invalid:
+            raise serializers.ValidationError(f"Unknown status: {', '.join(sorted(invalid))}.")
+        return statuses
+
+
+class LocationBatchSerializer(serializers.Serializer):
+    """
+    Batch of GPS pings from a rider's device.
+    Points are checked by hand rather than with a nested serializer per point,
+    which keeps validation cheap for large batches.
+    """
+    points = serializers.ListField(child=serializers.DictField(), min_length=1)
+
+    def validate_points(self, value):
+        max_batch = getattr(settings, 'RIDER_LOCATION_MAX_BATCH', 1000)
+        if len(value) > max_batch:
+            raise serializers.ValidationError(f"At most {max_batch} points are allowed per batch.")
+
+        latest_allowed = timezone.now() + timedelta(minutes=5)
+        points = []
+        for index, point in enumerate(value):
+            try:
+                latitude = float(point['latitude'])
+                longitude = float(point['longitude'])
+            except (KeyError, TypeError, ValueError):
+                raise serializers.ValidationError(f"Point {index}: latitude and longitude are required numbers.")
+            if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+                raise serializers.ValidationError(f"Point {index}: coordinates out of range.")
+
+            recorded_at = self._parse_timestamp(point.get('recorded_at'))
+            if recorded_at is None:
+                raise serializers.ValidationError(
+                    f"Point {index}: recorded_at must be an ISO 8601 datetime or a Unix timestamp."
+                )
+            if recorded_at > latest_allowed:
+                raise serializers.ValidationError(f"Point {index}: recorded_at is in the future.")
+
+            cleaned = {'latitude': latitude, 'longitude': longitude, 'recorded_at': recorded_at}
+            for field in ('accuracy', 'speed', 'heading'):
+                if point.get(field) is not None:
+                    try:
+                        cleaned[field] = float(point[field])
+                    except (TypeError, ValueError):
+                        raise serializers.ValidationError(f"Point {index}: {field} must be a number.")
+            points.append(cleaned)
+        return points
+
+    def _parse_timestamp(self, value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            # Devices usually send milliseconds since the epoch
+            seconds = value / 1000 if value > 1e11 else value
+            try:
+                return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+            except (OverflowError, OSError, ValueError):
+                return None
+        if isinstance(value, str):
+            try:
+                parsed = parse_datetime(value)
+            except ValueError:
+                return None
+            if parsed is not None and timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed, dt_timezone.utc)
+            return parsed
+        return None
@@ -0,0 +1,116 @@
+# delivery/signals.py
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from orders.archive import is_archiving
+from orders.events import publish_order_event
+from orders.models import Order
+from payment.models import Payment
+from .models import Delivery
+from .tracking import invalidate_delivery_tracking, TRACKABLE_STATUSES
+from .manifests import invalidate_rider_manifest
+from .routing import insert_stop, remove_stop
+from .dispatch import auto_assign_deliveries
+from .slots import release_slot
+from users.stats import adjust_dashboard_counter, counter_delta
+
+logger = logging.getLogger(__name__)
+
+@receiver(post_init, sender=Delivery)
+def remember_delivery_status(sender, instance, **kwargs):
+    instance.remember_saved_state()
+
+@receiver(post_save, sender=Delivery)
+def publish_delivery_status(sender, instance, created, **kwargs):
+    if created or instance.status != instance._original_status:
+        publish_order_event(
+            instance.order_id, 'delivery',
+            delivery_id=instance.id,
+            status=instance.status,
+        )
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def refresh_delivery_tracking(sender, instance, **kwargs):
+    invalidate_delivery_tracking(instance.order_id)
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def refresh_rider_manifest(sender, instance, **kwargs):
+    # Rebuilt lazily on the rider's next request
+    invalidate_rider_manifest(instance._original_rider_id, instance.delivery_person_id)
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def update_rider_routes(sender, instance, **kwargs):
+    # Keep riders' current routes live: reassignment moves the stop, finishing drops it
+    if is_archiving():
+        return  # Only finished deliveries are archived; their stops are long gone
+    delivery_id = instance.id
+    old_rider, new_rider = instance._original_rider_id, instance.delivery_person_id
+    active = kwargs.get('signal') is post_save and instance.status in TRACKABLE_STATUSES
+    if old_rider and (old_rider != new_rider or not active):
+        transaction.on_commit(lambda: _update_route(remove_stop, old_rider, delivery_id))
+    if (
+        new_rider and active and new_rider != old_rider
+        and instance.latitude is not None and instance.longitude is not None
+    ):
+        point = (instance.latitude, instance.longitude)
+        transaction.on_commit(lambda: _update_route(insert_stop, new_rider, delivery_id, point))
+
+def _update_route(operation, rider_id, delivery_id, *args):
+    try:
+        operation(rider_id, delivery_id, *args)
+    except Exception as e:
+        # Routes are re-planned on the next optimize-route call; never break the write path
+        logger.error(f"Failed to update route of rider {rider_id} for delivery {delivery_id}: {str(e)}")
+
+@receiver(post_save, sender=Delivery)
+def auto_assign_new_delivery(sender, instance, created, **kwargs):
+    # Deliveries created after the payment succeeded (e.g. by an admin)
+    if created and getattr(settings, 'DISPATCH_AUTO_ASSIGN', False):
+        delivery_id = instance.id
+        transaction.on_commit(lambda: _auto_assign(delivery_ids=[delivery_id]))
+
+@receiver(post_save, sender=Payment)
+def auto_assign_paid_delivery(sender, instance, **kwargs):
+    # Repeated saves are harmless: only pending, unassigned deliveries are picked up
+    if instance.status == 'successful' and getattr(settings, 'DISPATCH_AUTO_ASSIGN', False):
+        order_id = instance.order_id
+        transaction.on_commit(lambda: _auto_assign(order_ids=[order_id]))
+
+def _auto_assign(**filters):
+    try:
+        auto_assign_deliveries(**filters)
+    except Exception as e:
+        # Left for the auto_assign_deliveries command or an admin
+        logger.error(f"Auto-assignment failed for {filters}: {str(e)}")
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def release_delivery_slot(sender, instance, **kwargs):
+    # A cancelled or deleted delivery frees its place in the booked window
+    if is_archiving():
+        return  # Archived deliveries are finished; their windows are past
+    if instance.slot_start is None or instance._original_status == 'cancelled':
+        return
+    if kwargs.get('signal') is post_save and instance.status != 'cancelled':
+        return
+    branch_id = Order.objects.filter(id=instance.order_id).values_list('branch_id', flat=True).first()
+    if branch_id is not None:
+        slot_start = instance.slot_start
+        transaction.on_commit(lambda: release_slot(branch_id, slot_start))
+
+@receiver(post_save, sender=Delivery)
+@receiver(post_delete, sender=Delivery)
+def count_pending_deliveries(sender, instance, created=False, **kwargs):
+    old = None if created else instance._original_status
+    new = instance.status if kwargs.get('signal') is post_save else None
+    adjust_dashboard_counter('pending_deliveries', counter_delta('pending', old, new))
+
+@receiver(post_save, sender=Delivery)
+def remember_saved_state(sender, instance, **kwargs):
+    # Registered last so the receivers above (and Delivery.save) compare against the state before this save
+    instance.remember_saved_state()
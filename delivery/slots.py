@@ -0,0 +1,182 @@
+"""
+Delivery time slots with per-branch capacity counters.
+
+Slots are fixed windows of DELIVERY_SLOT_MINUTES between DELIVERY_SLOT_FIRST_HOUR
+and DELIVERY_SLOT_LAST_HOUR (in DELIVERY_SLOT_TIME_ZONE) for the next
+DELIVERY_SLOT_DAYS days. Bookings are counted in the cache, one atomic counter
+per (branch, slot), so checkout never counts Delivery rows. A missing counter is
+seeded from the database, and `reconcile_slot_counters` (see the
+`reconcile_slot_counters` command) resets all upcoming counters to the database
+count to correct any drift.
+"""
+import logging
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+from orders.models import Branch
+from .models import Delivery
+
+logger = logging.getLogger(__name__)
+
+SLOT_COUNT_KEY = "slot_count_{}_{}"  # branch, slot start (Unix seconds)
+SLOT_AVAILABILITY_KEY = "slot_availability_{}"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def slot_length():
+    return timedelta(minutes=_setting('DELIVERY_SLOT_MINUTES', 120))
+
+
+def slot_capacity(branch_id):
+    """Deliveries a branch can take per slot."""
+    overrides = _setting('DELIVERY_SLOT_BRANCH_CAPACITY', {})
+    return overrides.get(branch_id, _setting('DELIVERY_SLOT_CAPACITY', 20))
+
+
+def upcoming_slots(now=None):
+    """
+    Start times of the bookable slots, earliest first.
+    Slots starting within DELIVERY_SLOT_LEAD_MINUTES of now are no longer bookable.
+    """
+    now = now or timezone.now()
+    zone = ZoneInfo(_setting('DELIVERY_SLOT_TIME_ZONE', 'Africa/Nairobi'))
+    length = slot_length()
+    earliest = now + timedelta(minutes=_setting('DELIVERY_SLOT_LEAD_MINUTES', 60))
+    first_hour, last_hour = _setting('DELIVERY_SLOT_FIRST_HOUR', 8), _setting('DELIVERY_SLOT_LAST_HOUR', 20)
+    today = now.astimezone(zone).date()
+    starts = []
+    for offset in range(_setting('DELIVERY_SLOT_DAYS', 7)):
+        day = today + timedelta(days=offset)
+        start = datetime.combine(day, time(first_hour), tzinfo=zone)
+        day_end = datetime.combine(day, time(0), tzinfo=zone) + timedelta(hours=last_hour)
+        while start + length <= day_end:
+            if start >= earliest:
+                starts.append(start)
+            start += length
+    return starts
+
+
+def is_bookable_slot(start):
+    return start in upcoming_slots()
+
+
+def _count_key(branch_id, start):
+    return SLOT_COUNT_KEY.format(branch_id, int(start.timestamp()))
+
+
+def _counter_timeout(start):
+    # Counters outlive their slot by a day so late cancellations still find them
+    return max(int((start + slot_length() - timezone.now()).total_seconds()) + 86400, 60)
+
+
+def _booked_counts(branch_ids, starts):
+    """Database count of non-cancelled deliveries per (branch_id, slot start)."""
+    if not branch_ids or not starts:
+        return {}
+    rows = (
+        Delivery.objects.filter(
+            order__branch_id__in=branch_ids, slot_start__in=starts,
+        ).exclude(status='cancelled')
+        .values('order__branch_id', 'slot_start').annotate(booked=Count('id')).order_by()
+        .values_list('order__branch_id', 'slot_start', 'booked')
+    )
+    return {(branch_id, slot_start): booked for branch_id, slot_start, booked in rows}
+
+
+def _seed_counters(branch_id, starts):
+    """Create missing counters from the database; existing counters are left untouched."""
+    counts = _booked_counts([branch_id], starts)
+    for start in starts:
+        cache.add(_count_key(branch_id, start), counts.get((branch_id, start), 0), timeout=_counter_timeout(start))
+
+
+def reserve_slot(branch_id, start):
+    """
+    Atomically take one place in a branch's slot.
+    Returns:
+        True if reserved, False if the slot is full.
+    """
+    key = _count_key(branch_id, start)
+    try:
+        booked = cache.incr(key)
+    except ValueError:  # No counter yet
+        _seed_counters(branch_id, [start])
+        booked = cache.incr(key)
+    if booked > slot_capacity(branch_id):
+        cache.decr(key)
+        return False
+    cache.delete(SLOT_AVAILABILITY_KEY.format(branch_id))
+    return True
+
+
+def release_slot(branch_id, start):
+    """Give back a place taken with reserve_slot (or by a delivery that is now cancelled)."""
+    try:
+        cache.decr(_count_key(branch_id, start))
+    except ValueError:
+        pass  # Seeded from the database on next use
+    cache.delete(SLOT_AVAILABILITY_KEY.format(branch_id))
+
+
+def slot_availability(branch_id):
+    """
+    Availability of a branch's upcoming slots, cached for DELIVERY_SLOT_AVAILABILITY_TIMEOUT
+    and dropped whenever a place is reserved or released.
+    Returns:
+        List of dicts with 'start', 'end', 'capacity', 'booked' and 'available'.
+    """
+    availability_key = SLOT_AVAILABILITY_KEY.format(branch_id)
+    slots = cache.get(availability_key)
+    if slots is not None:
+        return slots
+
+    starts = upcoming_slots()
+    keys = {_count_key(branch_id, start): start for start in starts}
+    counts = cache.get_many(list(keys))
+    missing = [start for key, start in keys.items() if key not in counts]
+    if missing:
+        _seed_counters(branch_id, missing)
+        counts.update(cache.get_many([_count_key(branch_id, start) for start in missing]))
+
+    capacity = slot_capacity(branch_id)
+    length = slot_length()
+    slots = []
+    for key, start in keys.items():
+        booked = counts.get(key, 0)
+        slots.append({
+            'start': start,
+            'end': start + length,
+            'capacity': capacity,
+            'booked': booked,
+            'available': max(capacity - booked, 0),
+        })
+    cache.set(availability_key, slots, timeout=_setting('DELIVERY_SLOT_AVAILABILITY_TIMEOUT', 60))
+    return slots
+
+
+def reconcile_slot_counters(branch_ids=None):
+    """
+    Reset the counters of all upcoming slots to the database count.
+    Args:
+        branch_ids: Only these branches (all active branches if None).
+    Returns:
+        Number of counters written.
+    """
+    if branch_ids is None:
+        branch_ids = list(Branch.objects.filter(is_active=True).values_list('id', flat=True))
+    starts = upcoming_slots()
+    counts = _booked_counts(branch_ids, starts)
+    for start in starts:
+        cache.set_many(
+            {_count_key(branch_id, start): counts.get((branch_id, start), 0) for branch_id in branch_ids},
+            timeout=_counter_timeout(start),
+        )
+    cache.delete_many([SLOT_AVAILABILITY_KEY.format(branch_id) for branch_id in branch_ids])
+    logger.info(f"Reconciled {len(starts) * len(branch_ids)} slot counters for {len(branch_ids)} branches")
+    return len(starts) * len(branch_ids)
@@ -1,11 +1,20 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from rest_framework.test import APIClient
 from django.urls import reverse
 from users.models import CustomUser
 from orders.models import Order
 from delivery.models import Delivery
-from delivery.utils import compute_shortest_route, geocode_address
+from delivery.utils import compute_shortest_route, geocode_address, build_distance_matrix
+from delivery.routing import plan_delivery_route, cheapest_insertion, relocate_polish, get_rider_route
+from delivery.road_network import RoadGraph, RoadNetworkBackend
+from delivery.geo import encode_polyline
+from delivery.slots import (
+    upcoming_slots, is_bookable_slot, reserve_slot, release_slot, slot_availability, reconcile_slot_counters,
+)
 import json
+import os
+import tempfile
 
 class DeliveryRouteOptimizationTests(TestCase):
     def setUp(self):
@@ -111,4 +120,626 @@ class DeliveryRouteOptimizationTests(TestCase):
             format='json'
         )
         self.assertEqual(response.status_code, 200)  # Should geocode successfully
-        self.assertIn('optimized_route', response.data)
\ No newline at end of file
+        self.assertIn('optimized_route', response.data)
+
+class RiderLocationTrackingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.rider = CustomUser.objects.create_user(
+            username='rider1',
+            password='pass123',
+            email='rider1@example.com',
+            role='delivery'
+        )
+        self.customer = CustomUser.objects.create_user(
+            username='customer3',
+            password='pass123',
+            email='customer3@example.com',
+            role='customer'
+        )
+        self.order = Order.objects.create(customer=self.customer, status='processing', total_amount=100.00)
+        self.delivery = Delivery.objects.create(
+            order=self.order,
+            delivery_person=self.rider,
+            status='in_transit',
+            delivery_address='Moi Avenue, Nairobi',
+            latitude=-1.2833,
+            longitude=36.8167
+        )
+
+    def test_location_batch_updates_latest_position(self):
+        from delivery.models import RiderLocation
+        from delivery.tracking import location_buffer
+        self.client.force_authenticate(user=self.rider)
+        response = self.client.post(
+            reverse('delivery-location'),
+            {
+                'points': [
+                    {'latitude': -1.2900, 'longitude': 36.8200, 'recorded_at': 1760000010000},
+                    {'latitude': -1.2850, 'longitude': 36.8180, 'recorded_at': 1760000020000},
+                    {'latitude': -1.2950, 'longitude': 36.8250, 'recorded_at': 1760000000000},
+                ]
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['accepted'], 3)
+        location_buffer.flush()
+        self.assertEqual(RiderLocation.objects.filter(rider=self.rider).count(), 3)
+
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.get(reverse('delivery-track', args=[self.order.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'in_transit')
+        self.assertEqual(response.data['location']['latitude'], -1.2850)
+
+    def test_location_batch_rejects_bad_points(self):
+        self.client.force_authenticate(user=self.rider)
+        response = self.client.post(
+            reverse('delivery-location'),
+            {'points': [{'latitude': 120, 'longitude': 36.8, 'recorded_at': 1760000000}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_tracking_hidden_from_other_customers(self):
+        other = CustomUser.objects.create_user(
+            username='customer4',
+            password='pass123',
+            email='customer4@example.com',
+            role='customer'
+        )
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse('delivery-track', args=[self.order.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class RoutePlanCacheTests(TestCase):
+    stops = [
+        (1, (-1.2833, 36.8167)),
+        (2, (-1.2921, 36.8219)),
+        (3, (-1.2676, 36.8108)),
+        (4, (-1.3031, 36.7073)),
+        (5, (-1.2195, 36.8869)),
+    ]
+    start = (-1.2864, 36.8172)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_distance_matrix_reuses_cached_pairs(self):
+        points = [self.start] + [point for _, point in self.stops]
+        first = build_distance_matrix(points)
+        self.assertEqual(first[1][2], first[2][1])
+        with self.assertNumQueries(0):
+            second = build_distance_matrix(list(reversed(points)))
+        self.assertEqual(second[0][1], first[5][4])
+
+    def test_same_stop_set_is_served_from_cache(self):
+        first = plan_delivery_route(7, self.start, self.stops)
+        second = plan_delivery_route(7, self.start, list(reversed(self.stops)))
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(first['delivery_ids'], second['delivery_ids'])
+
+    @override_settings(ROUTE_EXACT_MAX_STOPS=2, ROUTE_SOLVER_SECONDS=1, ROUTE_WARM_START_SECONDS=1)
+    def test_changed_stop_set_warm_starts_from_previous_route(self):
+        first = plan_delivery_route(7, self.start, self.stops)
+        self.assertFalse(first['warm_start'])
+        second = plan_delivery_route(7, self.start, self.stops[1:])
+        self.assertTrue(second['warm_start'])
+        self.assertEqual(sorted(second['delivery_ids']), [2, 3, 4, 5])
+
+    def test_cheapest_insertion(self):
+        matrix = [
+            [0, 1, 2, 3],
+            [1, 0, 1, 2],
+            [2, 1, 0, 1],
+            [3, 2, 1, 0],
+        ]
+        self.assertEqual(cheapest_insertion([1, 3], [2], matrix), [1, 2, 3])
+
+
+class RouteOutputFormatTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.rider = CustomUser.objects.create_user(
+            username='rider3', password='pass123', email='rider3@example.com', role='delivery'
+        )
+        customer = CustomUser.objects.create_user(
+            username='customer6', password='pass123', email='customer6@example.com', role='customer'
+        )
+        self.delivery_ids = []
+        for point in [(-1.2833, 36.8167), (-1.2921, 36.8219), (-1.2676, 36.8108)]:
+            order = Order.objects.create(customer=customer, status='processing', total_amount=100)
+            self.delivery_ids.append(Delivery.objects.create(
+                order=order, delivery_person=self.rider, status='assigned',
+                delivery_address='Nairobi', latitude=point[0], longitude=point[1]
+            ).id)
+        self.client.force_authenticate(user=self.rider)
+
+    def test_encode_polyline(self):
+        self.assertEqual(
+            encode_polyline([(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]),
+            '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+        )
+
+    def test_polyline_format_matches_full_route(self):
+        url = reverse('delivery-person-optimize-route')
+        body = {'start_location': [-1.2864, 36.8172], 'delivery_ids': self.delivery_ids}
+        full = self.client.post(url, body, format='json').data
+        compact = self.client.post(url, {**body, 'route_format': 'polyline'}, format='json').data
+        self.assertNotIn('optimized_route', compact)
+        self.assertEqual(compact['stop_order'], [stop['delivery_id'] for stop in full['optimized_route'][1:-1]])
+        self.assertEqual(
+            compact['polyline'],
+            encode_polyline([(stop['lat'], stop['lng']) for stop in full['optimized_route']])
+        )
+        self.assertLess(len(json.dumps(compact)), len(json.dumps(full)))
+
+
+class LiveRouteUpdateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.rider = CustomUser.objects.create_user(
+            username='rider4', password='pass123', email='rider4@example.com', role='delivery'
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='admin2', password='pass123', email='admin2@example.com', role='admin'
+        )
+        self.customer = CustomUser.objects.create_user(
+            username='customer7', password='pass123', email='customer7@example.com', role='customer'
+        )
+        self.deliveries = [
+            self._delivery(point, self.rider) for point in [(-1.2833, 36.8167), (-1.2921, 36.8219)]
+        ]
+        plan_delivery_route(
+            self.rider.id, (-1.2864, 36.8172),
+            [(delivery.id, (delivery.latitude, delivery.longitude)) for delivery in self.deliveries]
+        )
+
+    def _delivery(self, point, rider=None):
+        order = Order.objects.create(customer=self.customer, status='processing', total_amount=100)
+        return Delivery.objects.create(
+            order=order, delivery_person=rider, status='assigned' if rider else 'pending',
+            delivery_address='Nairobi', latitude=point[0], longitude=point[1]
+        )
+
+    def stop_ids(self):
+        return [delivery_id for delivery_id, _ in get_rider_route(self.rider.id)['stops']]
+
+    def test_assignment_inserts_stop_into_current_route(self):
+        extra = self._delivery((-1.2676, 36.8108))
+        self.client.force_authenticate(user=self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('delivery-admin-assign-delivery-person', args=[extra.id]),
+                {'delivery_person_id': self.rider.id},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(self.stop_ids()), sorted([d.id for d in self.deliveries] + [extra.id]))
+
+        self.client.force_authenticate(user=self.rider)
+        response = self.client.get(reverse('delivery-person-current-route'))
+        self.assertEqual(len(response.data['stops']), 3)
+
+    def test_finished_delivery_leaves_route(self):
+        delivery = self.deliveries[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.update_status('in_transit')
+        self.assertIn(delivery.id, self.stop_ids())
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.update_status('delivered')
+        self.assertEqual(self.stop_ids(), [self.deliveries[1].id])
+
+    def test_relocate_polish_fixes_misplaced_stop(self):
+        matrix = [
+            [0, 1, 2, 3],
+            [1, 0, 1, 2],
+            [2, 1, 0, 1],
+            [3, 2, 1, 0],
+        ]
+        self.assertEqual(relocate_polish([2, 1, 3], matrix), [1, 2, 3])
+
+
+@override_settings(DISPATCH_AUTO_ASSIGN=True)
+class AutoAssignmentTests(TestCase):
+    def setUp(self):
+        from delivery.dispatch import rider_index
+        cache.clear()
+        rider_index.reset()
+        self.customer = CustomUser.objects.create_user(
+            username='customer8', password='pass123', email='customer8@example.com', role='customer'
+        )
+        self.near, self.busy, self.far = [
+            CustomUser.objects.create_user(
+                username=name, password='pass123', email=f'{name}@example.com', role='delivery'
+            )
+            for name in ('near_rider', 'busy_rider', 'far_rider')
+        ]
+        import time
+        for rider, point in [
+            (self.near, (-1.2840, 36.8170)), (self.busy, (-1.2834, 36.8168)), (self.far, (-1.3500, 36.9000))
+        ]:
+            cache.set(f'rider_location_{rider.id}', {'latitude': point[0], 'longitude': point[1], 'ts': time.time()})
+        for index in range(3):
+            self._delivery((-1.29, 36.82), rider=self.busy, status='assigned')
+
+    def _delivery(self, point, rider=None, status='pending'):
+        order = Order.objects.create(customer=self.customer, status='processing', total_amount=100)
+        return Delivery.objects.create(
+            order=order, delivery_person=rider, status=status,
+            delivery_address='Nairobi', latitude=point[0], longitude=point[1]
+        )
+
+    def test_successful_payment_assigns_nearest_lightly_loaded_rider(self):
+        from payment.models import Payment
+        delivery = self._delivery((-1.2833, 36.8167))
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(order=delivery.order, amount=100, phone_number='+254700000000', status='pending')
+        delivery.refresh_from_db()
+        self.assertIsNone(delivery.delivery_person_id)
+
+        payment = delivery.order.payment
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.status = 'successful'
+            payment.save()
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'assigned')
+        self.assertEqual(delivery.delivery_person_id, self.near.id)
+
+    def test_burst_spreads_load_across_nearby_riders(self):
+        from payment.models import Payment
+        from delivery.dispatch import auto_assign_deliveries
+        with override_settings(DISPATCH_AUTO_ASSIGN=False):
+            deliveries = [self._delivery((-1.2833, 36.8167)) for _ in range(4)]
+            for delivery in deliveries:
+                Payment.objects.create(order=delivery.order, amount=100, phone_number='+254700000000', status='successful')
+        result = auto_assign_deliveries()
+        self.assertEqual(len(result['assigned']), 4)
+        riders = set(result['assigned'].values())
+        self.assertIn(self.near.id, riders)
+        self.assertNotIn(self.far.id, riders)
+
+
+class DeliveryEventLogTests(TestCase):
+    def setUp(self):
+        from orders.models import Branch
+        cache.clear()
+        self.branch = Branch.objects.create(name='CBD')
+        self.rider = CustomUser.objects.create_user(
+            username='rider5', password='pass123', email='rider5@example.com', role='delivery'
+        )
+        customer = CustomUser.objects.create_user(
+            username='customer9', password='pass123', email='customer9@example.com', role='customer'
+        )
+        self.deliveries = []
+        for _ in range(2):
+            order = Order.objects.create(customer=customer, status='processing', total_amount=100, branch=self.branch)
+            self.deliveries.append(Delivery.objects.create(order=order, delivery_address='Nairobi'))
+
+    def test_transitions_are_logged_and_rolled_up(self):
+        from delivery.models import DeliverySLA
+        delivery = self.deliveries[0]
+        delivery.delivery_person = self.rider
+        for new_status in ('assigned', 'in_transit', 'delivered'):
+            delivery.update_status(new_status)
+        delivery.save()  # No status change, no event
+
+        events = list(delivery.events.values_list('from_status', 'to_status'))
+        self.assertEqual(
+            events,
+            [('', 'pending'), ('pending', 'assigned'), ('assigned', 'in_transit'), ('in_transit', 'delivered')]
+        )
+        sla = DeliverySLA.objects.get(delivery=delivery)
+        self.assertEqual(sla.branch_id, self.branch.id)
+        self.assertEqual(sla.rider_id, self.rider.id)
+        self.assertIsNotNone(sla.assigned_to_delivered_seconds)
+
+    def test_refresh_from_db_resets_the_saved_status(self):
+        delivery = self.deliveries[0]
+        Delivery.objects.filter(id=delivery.id).update(status='assigned', delivery_person=self.rider)
+        delivery.refresh_from_db()
+        self.assertEqual((delivery._original_status, delivery._original_rider_id), ('assigned', self.rider.id))
+        delivery.update_status('in_transit')
+        self.assertEqual(delivery.events.last().from_status, 'assigned')
+
+    def test_admin_bulk_action_logs_each_transition(self):
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+        from delivery.models import DeliveryEvent
+        for delivery in self.deliveries:
+            delivery.update_status('assigned')
+        request = RequestFactory().post('/')
+        request.user = CustomUser.objects.create_superuser(
+            username='root', password='pass123', email='root@example.com'
+        )
+        model_admin = site._registry[Delivery]
+        model_admin.message_user = lambda *args, **kwargs: None
+        model_admin.mark_as_in_transit(request, Delivery.objects.all())
+        self.assertEqual(DeliveryEvent.objects.filter(to_status='in_transit').count(), 2)
+
+    def test_sla_endpoint_reports_percentiles_per_branch(self):
+        for delivery in self.deliveries:
+            for new_status in ('assigned', 'in_transit', 'delivered'):
+                delivery.update_status(new_status)
+        client = APIClient()
+        client.force_authenticate(user=CustomUser.objects.create_user(
+            username='admin3', password='pass123', email='admin3@example.com', role='admin'
+        ))
+        response = client.get(reverse('delivery-admin-sla'), {'group_by': 'branch', 'days': 30})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['branch_id'], self.branch.id)
+        self.assertEqual(response.data['results'][0]['count'], 2)
+        self.assertIn('p90', response.data['results'][0])
+        response = client.get(reverse('delivery-admin-sla'), {'metric': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkDeliveryTransitionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rider = CustomUser.objects.create_user(
+            username='rider6', password='pass123', email='rider6@example.com', role='delivery'
+        )
+        customer = CustomUser.objects.create_user(
+            username='customer11', password='pass123', email='customer11@example.com', role='customer'
+        )
+        self.deliveries = []
+        for _ in range(20):
+            order = Order.objects.create(customer=customer, status='processing', total_amount=100)
+            delivery = Delivery.objects.create(order=order, delivery_address='Nairobi', delivery_person=self.rider)
+            delivery.update_status('assigned')
+            delivery.update_status('in_transit')
+            self.deliveries.append(delivery)
+        self.deliveries[0].update_status('cancelled')
+        self.client = APIClient()
+        self.client.force_authenticate(user=CustomUser.objects.create_user(
+            username='admin5', password='pass123', email='admin5@example.com', role='admin'
+        ))
+
+    def test_closeout_updates_valid_deliveries_and_reports_the_rest(self):
+        from delivery.models import DeliveryEvent, DeliverySLA
+        ids = [delivery.id for delivery in self.deliveries] + [999999]
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(8):  # Independent of the number of deliveries
+                response = self.client.post(
+                    reverse('delivery-admin-bulk-status'), {'delivery_ids': ids, 'status': 'delivered'}, format='json'
+                )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 19)
+        outcomes = {outcome['id']: outcome for outcome in response.data['results']}
+        self.assertFalse(outcomes[self.deliveries[0].id]['ok'])
+        self.assertEqual(outcomes[999999]['error'], 'Delivery not found')
+
+        self.assertEqual(Delivery.objects.filter(status='delivered', actual_delivery_time__isnull=False).count(), 19)
+        self.assertEqual(Order.objects.filter(status='delivered').count(), 19)
+        self.assertEqual(DeliveryEvent.objects.filter(to_status='delivered').count(), 19)
+        self.assertEqual(DeliverySLA.objects.count(), 19)
+        self.assertIsNotNone(DeliverySLA.objects.first().in_transit_seconds)
+
+    def test_invalid_status_is_rejected(self):
+        response = self.client.post(
+            reverse('delivery-admin-bulk-status'), {'delivery_ids': [1], 'status': 'lost'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class DeliveryClusterTests(TestCase):
+    def setUp(self):
+        customer = CustomUser.objects.create_user(
+            username='customer10', password='pass123', email='customer10@example.com', role='customer'
+        )
+        points = [(-1.2833, 36.8167)] * 3 + [(-1.2834, 36.8168)] + [(-1.3031, 36.7073)] * 2 + [(40.0, -74.0)]
+        for index, point in enumerate(points):
+            order = Order.objects.create(customer=customer, status='processing', total_amount=100)
+            Delivery.objects.create(
+                order=order, delivery_address='Nairobi', latitude=point[0], longitude=point[1],
+                status='pending' if index % 2 else 'cancelled'
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user=CustomUser.objects.create_user(
+            username='admin4', password='pass123', email='admin4@example.com', role='admin'
+        ))
+
+    def test_clusters_aggregate_deliveries_in_bbox(self):
+        response = self.client.get(reverse('delivery-admin-clusters'), {'bbox': '-1.4,36.6,-1.2,36.9', 'zoom': 12})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 6)
+        counts = sorted(cluster['count'] for cluster in response.data['clusters'])
+        self.assertEqual(counts, [2, 4])
+        cbd = max(response.data['clusters'], key=lambda cluster: cluster['count'])
+        self.assertEqual(cbd['statuses'], {'cancelled': 2, 'pending': 2})
+        self.assertAlmostEqual(cbd['lat'], -1.283325, places=5)
+
+    def test_cluster_count_is_bounded_at_high_zoom(self):
+        with override_settings(DELIVERY_CLUSTER_MAX_CELLS=4):
+            response = self.client.get(
+                reverse('delivery-admin-clusters'), {'bbox': '-1.4,36.6,-1.2,36.9', 'zoom': 20, 'status': 'pending'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(response.data['clusters']), 4)
+        self.assertEqual(response.data['total'], 3)
+
+    def test_invalid_bbox_is_rejected(self):
+        response = self.client.get(reverse('delivery-admin-clusters'), {'bbox': '1,2,3', 'zoom': 5})
+        self.assertEqual(response.status_code, 400)
+
+
+class RiderManifestTests(TestCase):
+    def setUp(self):
+        from products.models import Category, Product
+        from orders.models import OrderItem
+        cache.clear()
+        self.client = APIClient()
+        self.rider = CustomUser.objects.create_user(
+            username='rider2', password='pass123', email='rider2@example.com', role='delivery'
+        )
+        customer = CustomUser.objects.create_user(
+            username='customer5', password='pass123', email='customer5@example.com',
+            role='customer', phone_number='+254700000001'
+        )
+        category = Category.objects.create(name='Dairy')
+        milk = Product.objects.create(name='Milk', price=60, stock=10, category=category)
+        self.deliveries = []
+        for index, point in enumerate([(-1.2833, 36.8167), (-1.2921, 36.8219)]):
+            order = Order.objects.create(customer=customer, status='processing', total_amount=120)
+            OrderItem.objects.create(order=order, product=milk, quantity=index + 1, price=60)
+            self.deliveries.append(Delivery.objects.create(
+                order=order, delivery_person=self.rider, status='assigned',
+                delivery_address='Nairobi', latitude=point[0], longitude=point[1]
+            ))
+        cache.set('rider_location_{}'.format(self.rider.id), {'latitude': -1.2864, 'longitude': 36.8172})
+        self.client.force_authenticate(user=self.rider)
+
+    def test_manifest_is_served_compressed_with_etag(self):
+        import gzip
+        response = self.client.get(reverse('delivery-manifest'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        manifest = json.loads(gzip.decompress(response.content))
+        self.assertEqual(
+            sorted(stop['delivery_id'] for stop in manifest['deliveries']),
+            sorted(delivery.id for delivery in self.deliveries)
+        )
+        self.assertEqual(manifest['deliveries'][0]['customer_phone'], '+254700000001')
+        self.assertEqual(manifest['unrouted'], [])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('delivery-manifest'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_delivery_change_rebuilds_manifest(self):
+        etag = self.client.get(reverse('delivery-manifest'))['ETag']
+        self.deliveries[0].update_status('in_transit')
+        response = self.client.get(reverse('delivery-manifest'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        statuses = {stop['delivery_id']: stop['status'] for stop in json.loads(response.content)['deliveries']}
+        self.assertEqual(statuses[self.deliveries[0].id], 'in_transit')
+
+
+ROAD_EXTRACT = """<?xml version="1.0"?>
+<osm version="0.6">
+  <node id="1" lat="-1.2800" lon="36.8000"/>
+  <node id="2" lat="-1.2800" lon="36.8050"/>
+  <node id="3" lat="-1.2800" lon="36.8100"/>
+  <node id="4" lat="-1.2850" lon="36.8100"/>
+  <node id="5" lat="-1.2850" lon="36.8000"/>
+  <node id="6" lat="-1.2900" lon="36.8000"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="primary"/><tag k="oneway" v="yes"/></way>
+  <way id="11"><nd ref="3"/><nd ref="4"/><nd ref="5"/><nd ref="1"/><tag k="highway" v="residential"/></way>
+  <way id="12"><nd ref="5"/><nd ref="6"/><tag k="highway" v="footway"/></way>
+</osm>
+"""
+
+
+class RoadNetworkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        handle, self.osm_path = tempfile.mkstemp(suffix='.osm')
+        with os.fdopen(handle, 'w') as f:
+            f.write(ROAD_EXTRACT)
+        self.addCleanup(os.remove, self.osm_path)
+        self.graph = RoadGraph.from_osm(self.osm_path)
+
+    def test_graph_keeps_intersections_and_drivable_roads(self):
+        # Node 2 is a shape point, node 6 is only reachable by footway
+        self.assertEqual(self.graph.node_count, 2)
+        self.assertEqual(self.graph.edge_count, 2)  # 1 -> 3 one-way; the loop keeps only 3 -> 1
+
+    def test_one_way_streets_make_distances_asymmetric(self):
+        backend = RoadNetworkBackend(self.graph)
+        points = [(-1.2800, 36.8000), (-1.2800, 36.8100)]
+        matrix = build_distance_matrix(points, backend=backend)
+        self.assertAlmostEqual(matrix[0][1], 1113, delta=5)
+        self.assertGreater(matrix[1][0], matrix[0][1] * 2)
+
+    def test_path_follows_one_way_street(self):
+        self.assertEqual(self.graph.path(0, 1), [(-1.28, 36.8), (-1.28, 36.81)])
+
+    def test_saved_graph_round_trips(self):
+        path = self.osm_path + '.npz'
+        self.graph.save(path)
+        self.addCleanup(os.remove, path)
+        loaded = RoadGraph.load(path)
+        self.assertEqual(loaded.node_count, self.graph.node_count)
+        self.assertEqual(
+            loaded.many_to_many([0], [1]), self.graph.many_to_many([0], [1])
+        )
+
+
+@override_settings(DELIVERY_SLOT_CAPACITY=2)
+class DeliverySlotTests(TestCase):
+    def setUp(self):
+        from orders.models import Branch
+        from orders.spatial import branch_index
+        cache.clear()
+        branch_index.reset()
+        self.customer = CustomUser.objects.create_user(
+            username='customer20', password='pass123', email='customer20@example.com', role='customer'
+        )
+        self.branch = Branch.objects.create(name='CBD', latitude=-1.2864, longitude=36.8172)
+        self.slot = upcoming_slots()[0]
+
+    def _delivery(self, slot_start):
+        order = Order.objects.create(customer=self.customer, branch=self.branch, status='processing', total_amount=100)
+        return Delivery.objects.create(
+            order=order, delivery_address='Kenyatta Avenue', latitude=-1.2900, longitude=36.8100, slot_start=slot_start
+        )
+
+    def _booked(self):
+        return next(slot['booked'] for slot in slot_availability(self.branch.id) if slot['start'] == self.slot)
+
+    def test_upcoming_slots_respect_lead_time_and_window(self):
+        from datetime import datetime, timezone as dt_timezone
+        now = datetime(2025, 3, 3, 6, 30, tzinfo=dt_timezone.utc)  # 09:30 in Nairobi
+        slots = upcoming_slots(now)
+        self.assertEqual(slots[0].astimezone(dt_timezone.utc).hour, 9)  # 12:00 local, the first starting after 10:30
+        self.assertEqual(len(slots), 4 + 6 * 6)
+        self.assertTrue(is_bookable_slot(self.slot))
+
+    def test_reserve_until_full(self):
+        self.assertTrue(reserve_slot(self.branch.id, self.slot))
+        self.assertTrue(reserve_slot(self.branch.id, self.slot))
+        self.assertFalse(reserve_slot(self.branch.id, self.slot))
+        release_slot(self.branch.id, self.slot)
+        self.assertTrue(reserve_slot(self.branch.id, self.slot))
+
+    def test_counters_are_seeded_from_database(self):
+        self._delivery(self.slot)
+        self.assertEqual(self._booked(), 1)
+        self.assertTrue(reserve_slot(self.branch.id, self.slot))
+        self.assertFalse(reserve_slot(self.branch.id, self.slot))
+
+    def test_cancelling_releases_the_slot(self):
+        reserve_slot(self.branch.id, self.slot)
+        delivery = self._delivery(self.slot)
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.update_status('cancelled')
+        self.assertEqual(self._booked(), 0)
+
+    def test_reconcile_resets_drifted_counters(self):
+        self._delivery(self.slot)
+        for _ in range(2):
+            reserve_slot(self.branch.id, self.slot)
+        self.assertEqual(self._booked(), 2)
+        reconcile_slot_counters([self.branch.id])
+        self.assertEqual(self._booked(), 1)
+
+    def test_availability_endpoint(self):
+        reserve_slot(self.branch.id, self.slot)
+        response = APIClient().get(reverse('delivery-slots', args=[self.branch.id]))
+        self.assertEqual(response.status_code, 200)
+        first = response.data['slots'][0]
+        self.assertEqual((first['capacity'], first['booked'], first['available']), (2, 1, 1))
+        self.assertEqual(APIClient().get(reverse('delivery-slots', args=[self.branch.id + 1])).status_code, 404)
+
+    def test_availability_for_branch_without_coordinates(self):
+        from orders.models import Branch
+        branch = Branch.objects.create(name='Westlands')
+        response = APIClient().get(reverse('delivery-slots', args=[branch.id]))
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,164 @@
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .models import Delivery, RiderLocation
+
+logger = logging.getLogger(__name__)
+
+RIDER_LOCATION_KEY = "rider_location_{}"
+DELIVERY_TRACKING_KEY = "delivery_tracking_{}"
+TRACKABLE_STATUSES = ('assigned', 'in_transit')
+
+
+class LocationBuffer:
+    """
+    Process-local buffer of RiderLocation rows.
+    Rows are written with a single bulk_create once the buffer holds max_size
+    pings or max_age seconds have passed since the last flush.
+    """
+
+    def __init__(self, max_size, max_age):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._rows = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, rows):
+        """Queue rows and flush if the buffer is due. Returns the number of rows written."""
+        with self._lock:
+            self._rows.extend(rows)
+            due = (
+                len(self._rows) >= self.max_size
+                or time.monotonic() - self._last_flush >= self.max_age
+            )
+            if not due:
+                return 0
+            batch = self._take()
+        return self._write(batch)
+
+    def flush(self):
+        """Write everything currently buffered."""
+        with self._lock:
+            batch = self._take()
+        return self._write(batch)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _take(self):
+        batch, self._rows = self._rows, []
+        self._last_flush = time.monotonic()
+        return batch
+
+    def _write(self, batch):
+        # Runs outside the lock so other requests keep buffering during the INSERT
+        if not batch:
+            return 0
+        try:
+            RiderLocation.objects.bulk_create(batch, batch_size=self.max_size)
+            logger.debug(f"Flushed {len(batch)} rider locations")
+            return len(batch)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(batch)} rider locations: {str(e)}")
+            return 0
+
+
+location_buffer = LocationBuffer(
+    max_size=getattr(settings, 'RIDER_LOCATION_BUFFER_SIZE', 500),
+    max_age=getattr(settings, 'RIDER_LOCATION_FLUSH_SECONDS', 5.0),
+)
+atexit.register(location_buffer.flush)
+
+
+def record_locations(rider_id, points):
+    """
+    Buffer a batch of GPS pings for a rider and publish the newest one to the cache.
+    Args:
+        rider_id: ID of the delivery user sending the pings.
+        points: List of validated dicts with latitude, longitude, recorded_at
+                and optional accuracy, speed, heading.
+    Returns:
+        Number of pings accepted.
+    """
+    if not points:
+        return 0
+
+    rows = [
+        RiderLocation(
+            rider_id=rider_id,
+            latitude=point['latitude'],
+            longitude=point['longitude'],
+            accuracy=point.get('accuracy'),
+            speed=point.get('speed'),
+            heading=point.get('heading'),
+            recorded_at=point['recorded_at'],
+        )
+        for point in points
+    ]
+
+    latest = max(points, key=lambda point: point['recorded_at'])
+    latest_ts = latest['recorded_at'].timestamp()
+    cache_key = RIDER_LOCATION_KEY.format(rider_id)
+    current = cache.get(cache_key)
+    # Batches can arrive out of order on flaky networks; never move a rider backwards in time
+    if current is None or current['ts'] < latest_ts:
+        cache.set(
+            cache_key,
+            {
+                'latitude': latest['latitude'],
+                'longitude': latest['longitude'],
+                'accuracy': latest.get('accuracy'),
+                'speed': latest.get('speed'),
+                'heading': latest.get('heading'),
+                'recorded_at': latest['recorded_at'].isoformat(),
+                'ts': latest_ts,
+            },
+            timeout=getattr(settings, 'RIDER_LOCATION_CACHE_TIMEOUT', 3600),
+        )
+
+    location_buffer.add(rows)
+    return len(rows)
+
+
+def get_rider_location(rider_id):
+    """Return the cached latest position of a rider, or None."""
+    if rider_id is None:
+        return None
+    return cache.get(RIDER_LOCATION_KEY.format(rider_id))
+
+
+def get_delivery_tracking(order_id):
+    """
+    Return the cached tracking summary for an order's delivery:
+    {'delivery_id', 'customer_id', 'rider_id', 'status'}, or None if the order has no delivery.
+    Only a cache miss touches the database.
+    """
+    cache_key = DELIVERY_TRACKING_KEY.format(order_id)
+    tracking = cache.get(cache_key)
+    if tracking is not None:
+        return tracking
+
+    row = (
+        Delivery.objects.filter(order_id=order_id)
+        .values('id', 'status', 'delivery_person_id', 'order__customer_id')
+        .first()
+    )
+    if row is None:
+        return None
+    tracking = {
+        'delivery_id': row['id'],
+        'customer_id': row['order__customer_id'],
+        'rider_id': row['delivery_person_id'],
+        'status': row['status'],
+    }
+    cache.set(cache_key, tracking, timeout=getattr(settings, 'RIDER_LOCATION_CACHE_TIMEOUT', 3600))
+    return tracking
+
+
+def invalidate_delivery_tracking(*order_ids):
+    """Drop the cached tracking summaries so the next read picks up a new rider or status."""
+    cache.delete_many([DELIVERY_TRACKING_KEY.format(order_id) for order_id in order_ids])
@@ -0,0 +1,131 @@
+import logging
+from django.db import transaction
+from django.utils import timezone
+from orders.events import publish_order_event
+from orders.models import Order
+from .manifests import invalidate_rider_manifest
+from .models import Delivery, DeliveryEvent, DeliverySLA, STATUS_TRANSITIONS
+from .routing import remove_stops
+from .slots import release_slot
+from .tracking import invalidate_delivery_tracking
+from users.stats import adjust_dashboard_counter, counter_delta
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ('delivered', 'cancelled')
+
+
+def bulk_transition(delivery_ids, new_status):
+    """
+    Move many deliveries to new_status at once.
+    Rows are locked and validated against STATUS_TRANSITIONS in memory, then deliveries
+    and (for 'delivered') their orders are updated with one UPDATE each. Event log rows,
+    SLA facts, cache invalidation, order events and route updates that save() signals
+    would do are applied in bulk.
+    Args:
+        delivery_ids: Ids to transition; duplicates are ignored.
+        new_status: Target status.
+    Returns:
+        Dict with 'updated' (count) and 'results': [{'id', 'ok', 'error'?}, ...] in request order.
+    """
+    delivery_ids = list(dict.fromkeys(delivery_ids))
+    allowed_from = {status for status, targets in STATUS_TRANSITIONS.items() if new_status in targets}
+    now = timezone.now()
+
+    with transaction.atomic():
+        rows = {
+            row['id']: row
+            for row in Delivery.objects.select_for_update(of=('self',)).filter(id__in=delivery_ids).order_by().values(
+                'id', 'status', 'order_id', 'delivery_person_id', 'created_at',
+                'order__branch_id', 'order__payment_status', 'slot_start',
+            )
+        }
+        results, valid = [], []
+        for delivery_id in delivery_ids:
+            row = rows.get(delivery_id)
+            if row is None:
+                results.append({'id': delivery_id, 'ok': False, 'error': 'Delivery not found'})
+            elif row['status'] not in allowed_from:
+                results.append({
+                    'id': delivery_id, 'ok': False,
+                    'error': f"Cannot transition from {row['status']} to {new_status}",
+                })
+            else:
+                results.append({'id': delivery_id, 'ok': True})
+                valid.append(row)
+
+        if valid:
+            valid_ids = [row['id'] for row in valid]
+            changes = {'status': new_status, 'updated_at': now}
+            if new_status == 'delivered':
+                changes['actual_delivery_time'] = now
+            Delivery.objects.filter(id__in=valid_ids).update(**changes)
+            if new_status == 'delivered':
+                Order.objects.filter(id__in=[row['order_id'] for row in valid]).update(
+                    status='delivered', updated_at=now
+                )
+            _record_events(valid, new_status, now)
+            adjust_dashboard_counter(
+                'pending_deliveries', sum(counter_delta('pending', row['status'], new_status) for row in valid)
+            )
+            transaction.on_commit(lambda: _after_commit(valid, new_status))
+            for row in valid:
+                publish_order_event(row['order_id'], 'delivery', delivery_id=row['id'], status=new_status)
+                if new_status == 'delivered':
+                    publish_order_event(
+                        row['order_id'], 'order', status='delivered', payment_status=row['order__payment_status']
+                    )
+
+    logger.info(f"Bulk transition to {new_status}: {len(valid)} of {len(delivery_ids)} deliveries updated")
+    return {'updated': len(valid), 'results': results}
+
+
+def _record_events(rows, new_status, now):
+    DeliveryEvent.objects.bulk_create([
+        DeliveryEvent(
+            delivery_id=row['id'],
+            from_status=row['status'],
+            to_status=new_status,
+            rider_id=row['delivery_person_id'],
+            branch_id=row['order__branch_id'],
+            created_at=now,
+        )
+        for row in rows
+    ])
+    if new_status != 'delivered':
+        return
+    reached = {}
+    for delivery_id, to_status, created_at in DeliveryEvent.objects.filter(
+        delivery_id__in=[row['id'] for row in rows]
+    ).order_by('created_at').values_list('delivery_id', 'to_status', 'created_at'):
+        reached.setdefault(delivery_id, {})[to_status] = created_at
+    DeliverySLA.objects.bulk_create([
+        DeliverySLA(
+            delivery_id=row['id'],
+            branch_id=row['order__branch_id'],
+            rider_id=row['delivery_person_id'],
+            delivered_at=now,
+            **DeliverySLA.stage_durations(row['created_at'], reached.get(row['id'], {}), now),
+        )
+        for row in rows
+    ], ignore_conflicts=True)
+
+
+def _after_commit(rows, new_status):
+    try:
+        invalidate_delivery_tracking(*[row['order_id'] for row in rows])
+        riders = {}
+        for row in rows:
+            if row['delivery_person_id']:
+                riders.setdefault(row['delivery_person_id'], []).append(row['id'])
+        invalidate_rider_manifest(*riders)
+        if new_status in FINISHED_STATUSES:
+            for rider_id, delivery_ids in riders.items():
+                remove_stops(rider_id, delivery_ids)
+        if new_status == 'cancelled':
+            for row in rows:
+                if row['slot_start'] is not None and row['order__branch_id'] is not None:
+                    release_slot(row['order__branch_id'], row['slot_start'])
+    except Exception as e:
+        # Caches expire on their own; never fail the committed transition
+        logger.error(f"Post-transition cache refresh failed: {str(e)}")
@@ -6,6 +6,10 @@ from .views import (
     DeliveryDetailView,
     DeliveryAdminViewSet,
     DeliveryPersonViewSet,  # New
+    RiderLocationView,
+    DeliveryTrackingView,
+    RiderManifestView,
+    DeliverySlotView,
 )
 
 router = DefaultRouter()
@@ -17,6 +21,11 @@ urlpatterns = [
     path('delivery/tasks/', DeliveryListView.as_view(), name='delivery-tasks-list'),
     path('delivery/tasks/<int:pk>/update/', DeliveryUpdateView.as_view(), name='delivery-tasks-update'),
     path('delivery/tasks/<int:pk>/detail/', DeliveryDetailView.as_view(), name='delivery-tasks-detail'),
+    path('delivery/location/', RiderLocationView.as_view(), name='delivery-location'),
+    path('delivery/manifest/', RiderManifestView.as_view(), name='delivery-manifest'),
+    # Customer Endpoints
+    path('delivery/track/<int:order_id>/', DeliveryTrackingView.as_view(), name='delivery-track'),
+    path('delivery/slots/<int:branch_id>/', DeliverySlotView.as_view(), name='delivery-slots'),
     # Admin and Delivery Person Endpoints
     path('', include(router.urls)),
 ]
\ No newline at end of file
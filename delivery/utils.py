@@ -3,7 +3,9 @@ from ortools.constraint_solver import pywrapcp
 from geopy.distance import geodesic
 import requests
 import logging
+from itertools import permutations
 from time import sleep
+from django.conf import settings
 from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
@@ -42,28 +44,100 @@ def geocode_address(address):
                 sleep(1)
     return None
 
-def compute_shortest_route(start_location, locations):
+def coordinate_key(point):
+    """Round a (lat, lng) point to ROUTE_COORDINATE_PRECISION decimals for use in cache keys."""
+    precision = getattr(settings, 'ROUTE_COORDINATE_PRECISION', 5)
+    return f"{round(point[0], precision):.{precision}f},{round(point[1], precision):.{precision}f}"
+
+class GeodesicBackend:
+    """Straight-line (WGS-84 geodesic) distances; symmetric and needs no data files."""
+    name = 'geodesic'
+    symmetric = True
+
+    def distances(self, points, pairs):
+        return {(i, j): int(geodesic(points[i], points[j]).meters) for i, j in pairs}
+
+def get_distance_backend():
     """
-    Compute shortest route starting and ending at start_location through locations.
+    Return the distance backend selected by ROUTE_DISTANCE_BACKEND ('geodesic' or 'road').
+    The road backend falls back to geodesic distances when no road graph is available.
+    """
+    if getattr(settings, 'ROUTE_DISTANCE_BACKEND', 'geodesic') == 'road':
+        from .road_network import RoadNetworkBackend, get_road_graph
+        graph = get_road_graph()
+        if graph is not None:
+            return RoadNetworkBackend(graph)
+        logger.warning("Road network unavailable, using geodesic distances")
+    return GeodesicBackend()
+
+def build_distance_matrix(points, backend=None):
+    """
+    Build a pairwise distance matrix (integer meters) for a list of (lat, lng) points.
+    Pair distances are cached per backend by rounded coordinates, so repeated
+    optimizations over mostly the same stops only compute the new pairs.
     Args:
-        start_location: Tuple (lat, lng)
-        locations: List of tuples [(lat, lng), ...]
+        points: List of tuples [(lat, lng), ...]
+        backend: Distance backend (defaults to get_distance_backend()).
     Returns:
-        List of [lat, lng] representing the route, or None if failed.
+        n x n list of lists of ints; matrix[i][j] is the distance from i to j.
     """
-    if not locations or not start_location:
-        logger.warning("Empty locations or invalid start_location provided")
-        return None
-
-    all_locations = [start_location] + locations
-    n = len(all_locations)
+    if backend is None:
+        backend = get_distance_backend()
+    n = len(points)
+    keys = [coordinate_key(point) for point in points]
+    matrix = [[0] * n for _ in range(n)]
 
-    # Create distance matrix (meters)
-    distance_matrix = [[0] * n for _ in range(n)]
+    pair_keys = {}
     for i in range(n):
-        for j in range(n):
-            if i != j:
-                distance_matrix[i][j] = int(geodesic(all_locations[i], all_locations[j]).meters)
+        for j in range(i + 1 if backend.symmetric else 0, n):
+            if keys[i] != keys[j]:
+                a, b = sorted((keys[i], keys[j])) if backend.symmetric else (keys[i], keys[j])
+                pair_keys.setdefault(f"route_dist_{backend.name}_{a}_{b}", []).append((i, j))
+
+    cached = cache.get_many(list(pair_keys)) if pair_keys else {}
+    to_compute = {cache_key: pairs[0] for cache_key, pairs in pair_keys.items() if cache_key not in cached}
+    computed = backend.distances(points, to_compute.values()) if to_compute else {}
+    missing = {cache_key: computed[pair] for cache_key, pair in to_compute.items()}
+    for cache_key, pairs in pair_keys.items():
+        distance = cached[cache_key] if cache_key in cached else missing[cache_key]
+        for i, j in pairs:
+            matrix[i][j] = distance
+            if backend.symmetric:
+                matrix[j][i] = distance
+
+    if missing:
+        cache.set_many(missing, timeout=getattr(settings, 'ROUTE_DISTANCE_CACHE_TIMEOUT', 86400))
+    logger.debug(
+        f"{backend.name} distance matrix for {n} points: {len(pair_keys) - len(missing)} cached, {len(missing)} computed"
+    )
+    return matrix
+
+def route_length(order, distance_matrix):
+    """Length of the closed tour 0 -> order -> 0 over the matrix."""
+    length, previous = 0, 0
+    for node in order:
+        length += distance_matrix[previous][node]
+        previous = node
+    return length + distance_matrix[previous][0]
+
+def solve_route_order(distance_matrix, initial_order=None, time_limit=None):
+    """
+    Find a short closed tour from node 0 through every other node.
+    Small problems are solved exactly; larger ones use OR-Tools guided local search,
+    warm-started from initial_order when one is given.
+    Args:
+        distance_matrix: n x n matrix with node 0 as the start.
+        initial_order: Optional list of nodes 1..n-1 to start the search from.
+        time_limit: Search time in seconds (defaults to ROUTE_SOLVER_SECONDS).
+    Returns:
+        List of nodes 1..n-1 in visiting order, or None if failed.
+    """
+    n = len(distance_matrix)
+    stops = list(range(1, n))
+    if n <= 2:
+        return stops
+    if n - 1 <= getattr(settings, 'ROUTE_EXACT_MAX_STOPS', 7):
+        return list(min(permutations(stops), key=lambda order: route_length(order, distance_matrix)))
 
     # Initialize routing model
     manager = pywrapcp.RoutingIndexManager(n, 1, 0)  # 1 vehicle, start at index 0
@@ -85,23 +159,51 @@ def compute_shortest_route(start_location, locations):
     search_parameters.local_search_metaheuristic = (
         routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
     )
-    search_parameters.time_limit.seconds = 10  # Limit computation time
+    if time_limit is None:
+        time_limit = getattr(settings, 'ROUTE_SOLVER_SECONDS', 10)
+    search_parameters.time_limit.FromMilliseconds(int(time_limit * 1000))  # Limit computation time
 
     # Solve
     try:
-        solution = routing.SolveWithParameters(search_parameters)
+        if initial_order:
+            routing.CloseModelWithParameters(search_parameters)
+            initial_solution = routing.ReadAssignmentFromRoutes([list(initial_order)], True)
+            if initial_solution is None:
+                logger.warning("Initial route rejected by solver, starting cold")
+                solution = routing.SolveWithParameters(search_parameters)
+            else:
+                solution = routing.SolveFromAssignmentWithParameters(initial_solution, search_parameters)
+        else:
+            solution = routing.SolveWithParameters(search_parameters)
         if solution:
-            route = []
-            index = routing.Start(0)
+            order = []
+            index = solution.Value(routing.NextVar(routing.Start(0)))
             while not routing.IsEnd(index):
-                node = manager.IndexToNode(index)
-                route.append(list(all_locations[node]))  # Convert tuple to list [lat, lng]
+                order.append(manager.IndexToNode(index))
                 index = solution.Value(routing.NextVar(index))
-            route.append(list(all_locations[0]))  # Return to start
             logger.info(f"Computed route with {n} locations")
-            return route
+            return order
         logger.warning("No solution found for route computation")
         return None
     except Exception as e:
         logger.error(f"Route computation failed: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+def compute_shortest_route(start_location, locations):
+    """
+    Compute shortest route starting and ending at start_location through locations.
+    Args:
+        start_location: Tuple (lat, lng)
+        locations: List of tuples [(lat, lng), ...]
+    Returns:
+        List of [lat, lng] representing the route, or None if failed.
+    """
+    if not locations or not start_location:
+        logger.warning("Empty locations or invalid start_location provided")
+        return None
+
+    all_locations = [tuple(start_location)] + [tuple(location) for location in locations]
+    order = solve_route_order(build_distance_matrix(all_locations))
+    if order is None:
+        return None
+    return [list(all_locations[0])] + [list(all_locations[node]) for node in order] + [list(all_locations[0])]
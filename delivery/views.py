@@ -2,16 +2,34 @@ from rest_framework import status, viewsets
 from rest_framework.generics import GenericAPIView
 from rest_framework.mixins import ListModelMixin, UpdateModelMixin, RetrieveModelMixin
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from users.permissions import IsAdminUser, IsDeliveryUser
 from users.models import CustomUser 
 from .models import Delivery
-from .serializers import DeliverySerializer, RouteOptimizationSerializer  # Fixed import
+from .serializers import DeliverySerializer, RouteOptimizationSerializer, LocationBatchSerializer  # Fixed import
+from .serializers import DeliveryClusterQuerySerializer, BulkDeliveryStatusSerializer
 import logging
-from .utils import compute_shortest_route, geocode_address
+from .utils import geocode_address
+from .routing import plan_delivery_route, get_rider_route
+from .geo import encode_polyline
+from .road_network import route_geometry
+from .tracking import record_locations, get_rider_location, get_delivery_tracking, TRACKABLE_STATUSES
+from .manifests import get_rider_manifest
+from .dispatch import auto_assign_deliveries
+from .analytics import sla_percentiles
+from .clustering import cluster_deliveries
+from .transitions import bulk_transition
+from .slots import slot_availability
+from orders.models import ArchivedOrder, Branch
+from orders.exports import ExportMixin, archived_json_rows
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+import gzip
 from django.core.exceptions import ValidationError
 
 logger = logging.getLogger(__name__)
@@ -39,8 +57,11 @@ class DeliveryPersonViewSet(viewsets.ModelViewSet):
         delivery_ids = serializer.validated_data['delivery_ids']
 
         # Fetch deliveries
-        deliveries = Delivery.objects.filter(id__in=delivery_ids, delivery_person=request.user)
-        if len(deliveries) != len(delivery_ids):
+        deliveries = {
+            delivery.id: delivery
+            for delivery in Delivery.objects.filter(id__in=delivery_ids, delivery_person=request.user)
+        }
+        if len(deliveries) != len(set(delivery_ids)):
             logger.error(f"Invalid delivery IDs for user {request.user.username}: {delivery_ids}")
             return Response(
                 {"error": "Some delivery IDs are invalid or not assigned to you"},
@@ -48,8 +69,9 @@ class DeliveryPersonViewSet(viewsets.ModelViewSet):
             )
 
         # Collect locations and validate coordinates
-        locations = []
-        for delivery in deliveries:
+        stops = []
+        for delivery_id in dict.fromkeys(delivery_ids):
+            delivery = deliveries[delivery_id]
             if delivery.latitude is None or delivery.longitude is None:
                 coords = geocode_address(delivery.delivery_address)
                 if coords:
@@ -61,19 +83,39 @@ class DeliveryPersonViewSet(viewsets.ModelViewSet):
                         {"error": f"Unable to geocode address for delivery {delivery.id}"},
                         status=status.HTTP_400_BAD_REQUEST
                     )
-            locations.append((delivery.latitude, delivery.longitude))
+            stops.append((delivery.id, (delivery.latitude, delivery.longitude)))
 
         # Compute route
         try:
-            route = compute_shortest_route(start_location, locations)
-            if route:
-                logger.info(f"Route computed for user {request.user.username} with {len(delivery_ids)} deliveries")
-                # Map route points to delivery IDs for clarity
-                route_data = [
-                    {"lat": lat, "lng": lng, "delivery_id": delivery_ids[i - 1] if 0 < i < len(route) - 1 else None}
-                    for i, (lat, lng) in enumerate(route)
-                ]
-                return Response({"optimized_route": route_data})
+            plan = plan_delivery_route(request.user.id, start_location, stops)
+            if plan:
+                logger.info(f"Route computed for user {request.user.username} with {len(stops)} deliveries")
+                locations = dict(stops)
+                route_points = (
+                    [start_location]
+                    + [locations[delivery_id] for delivery_id in plan["delivery_ids"]]
+                    + [start_location]
+                )
+                if serializer.validated_data.get('route_format') == 'polyline':
+                    payload = {
+                        "polyline": encode_polyline(route_points),
+                        "stop_order": plan["delivery_ids"],
+                    }
+                else:
+                    payload = {
+                        "optimized_route": [
+                            {"lat": lat, "lng": lng, "delivery_id": delivery_id}
+                            for (lat, lng), delivery_id in zip(
+                                route_points, [None] + plan["delivery_ids"] + [None]
+                            )
+                        ],
+                    }
+                if serializer.validated_data.get('geometry'):
+                    path = route_geometry(route_points)
+                    payload["geometry"] = encode_polyline(path) if path else None
+                payload["total_distance_m"] = plan["distance_m"]
+                payload["cached"] = plan["cached"]
+                return Response(payload)
             logger.error(f"Route computation failed for user {request.user.username}")
             return Response(
                 {"error": "Unable to compute route"},
@@ -86,6 +128,21 @@ class DeliveryPersonViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'], url_path='current-route')
+    def current_route(self, request):
+        """The rider's live route, kept up to date as deliveries are assigned and completed."""
+        route = get_rider_route(request.user.id)
+        if route is None:
+            return Response({"error": "No route planned yet"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "start": {"lat": route['start'][0], "lng": route['start'][1]},
+            "stops": [
+                {"delivery_id": delivery_id, "lat": lat, "lng": lng}
+                for delivery_id, (lat, lng) in route['stops']
+            ],
+            "total_distance_m": route['distance_m'],
+        })
+
 class DeliveryListView(GenericAPIView, ListModelMixin):
     serializer_class = DeliverySerializer
     permission_classes = [IsAuthenticated]
@@ -163,7 +220,112 @@ class DeliveryDetailView(GenericAPIView, RetrieveModelMixin):
             logger.error(f"Failed to retrieve delivery {kwargs.get('pk')}: {str(e)}")
             return Response({"error": f"Failed to retrieve delivery: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class DeliveryAdminViewSet(viewsets.ModelViewSet):
+class RiderLocationView(APIView):
+    """
+    Accepts batched GPS pings from a delivery person.
+    Pings are buffered and bulk-written; the newest one becomes the rider's cached position.
+    """
+    permission_classes = [IsAuthenticated, IsDeliveryUser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = LocationBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            accepted = record_locations(request.user.id, serializer.validated_data['points'])
+            return Response({"accepted": accepted}, status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            logger.error(f"Failed to record locations for {request.user.username}: {str(e)}")
+            return Response(
+                {"error": f"Failed to record locations: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class DeliveryTrackingView(APIView):
+    """
+    "Where is my delivery" for the customer who placed the order.
+    Served entirely from the cache: the JWT is verified without loading the user,
+    and the order/rider mapping and rider position are cached.
+    """
+    authentication_classes = [JWTStatelessUserAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, order_id, *args, **kwargs):
+        tracking = get_delivery_tracking(order_id)
+        if tracking is None:
+            return self.archived_delivery(request, order_id)
+        if str(tracking['customer_id']) != str(request.user.id):
+            return Response({"error": "Delivery not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        location = None
+        if tracking['status'] in TRACKABLE_STATUSES:
+            location = get_rider_location(tracking['rider_id'])
+            if location is not None:
+                location = {k: v for k, v in location.items() if k != 'ts'}
+        return Response({
+            "order_id": order_id,
+            "delivery_id": tracking['delivery_id'],
+            "status": tracking['status'],
+            "location": location,
+        })
+
+    def archived_delivery(self, request, order_id):
+        # Deliveries of archived orders are finished; only their final status is left to show
+        delivery = ArchivedOrder.objects.filter(id=order_id, customer_id=request.user.id).values_list(
+            'delivery', flat=True
+        ).first()
+        if not delivery:
+            return Response({"error": "Delivery not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "order_id": order_id,
+            "delivery_id": delivery['id'],
+            "status": delivery['status'],
+            "location": None,
+        })
+
+class DeliverySlotView(APIView):
+    """
+    Delivery windows of a branch for the coming days with their remaining capacity.
+    Served from one cached document per branch. Accessible by any user.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, branch_id, *args, **kwargs):
+        # By id, not from branch_index: branches without coordinates still take bookings
+        if not Branch.objects.filter(id=branch_id, is_active=True).exists():
+            return Response({"error": "Branch not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"branch_id": branch_id, "slots": slot_availability(branch_id)})
+
+class RiderManifestView(APIView):
+    """
+    The rider's precomputed day: stops in route order with contacts and item summaries.
+    The stored gzipped document is sent as-is; If-None-Match returns 304.
+    """
+    permission_classes = [IsAuthenticated, IsDeliveryUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            manifest = get_rider_manifest(request.user.id)
+        except Exception as e:
+            logger.error(f"Failed to build manifest for {request.user.username}: {str(e)}")
+            return Response(
+                {"error": f"Failed to build manifest: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        if request.headers.get('If-None-Match') == manifest['etag']:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(manifest['body'], content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(gzip.decompress(manifest['body']), content_type='application/json')
+        response['ETag'] = manifest['etag']
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Accept-Encoding', 'Authorization'))
+        return response
+
+class DeliveryAdminViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Delivery.objects.select_related('order', 'delivery_person').all()
     serializer_class = DeliverySerializer
     permission_classes = [IsAdminUser]
@@ -172,6 +334,24 @@ class DeliveryAdminViewSet(viewsets.ModelViewSet):
     search_fields = ['delivery_address', 'order__id']
     ordering_fields = ['created_at', 'updated_at', 'estimated_delivery_time']
     ordering = ['-created_at']
+    export_filename = 'deliveries'
+    export_columns = [
+        ('id', 'id'),
+        ('order_id', 'order_id'),
+        ('created_at', 'created_at'),
+        ('status', 'status'),
+        ('rider', 'delivery_person__username'),
+        ('branch', 'order__branch__name'),
+        ('delivery_address', 'delivery_address'),
+        ('latitude', 'latitude'),
+        ('longitude', 'longitude'),
+        ('slot_start', 'slot_start'),
+        ('estimated_delivery_time', 'estimated_delivery_time'),
+        ('actual_delivery_time', 'actual_delivery_time'),
+    ]
+
+    def export_archived_rows(self, params, chunk_size):
+        return archived_json_rows(Delivery, self.export_columns, params, chunk_size)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -231,6 +411,78 @@ class DeliveryAdminViewSet(viewsets.ModelViewSet):
             logger.error(f"Error assigning delivery person: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'], url_path='auto-assign')
+    def auto_assign(self, request):
+        delivery_ids = request.data.get('delivery_ids')
+        if delivery_ids is not None and (
+            not isinstance(delivery_ids, list) or not all(isinstance(i, int) for i in delivery_ids)
+        ):
+            return Response(
+                {"error": "delivery_ids must be a list of integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            result = auto_assign_deliveries(delivery_ids=delivery_ids)
+            logger.info(
+                f"Admin {request.user.username} auto-assigned {len(result['assigned'])} deliveries, "
+                f"{len(result['unassigned'])} left without a rider"
+            )
+            return Response(result)
+        except Exception as e:
+            logger.error(f"Auto-assignment failed: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        """Transition many deliveries in one request; returns a per-id outcome."""
+        serializer = BulkDeliveryStatusSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = bulk_transition(
+                serializer.validated_data['delivery_ids'], serializer.validated_data['status']
+            )
+            logger.info(
+                f"Admin {request.user.username} moved {result['updated']} deliveries "
+                f"to {serializer.validated_data['status']}"
+            )
+            return Response(result)
+        except Exception as e:
+            logger.error(f"Bulk status update failed: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['get'], url_path='clusters')
+    def clusters(self, request):
+        """Map clusters for ?bbox=min_lat,min_lng,max_lat,max_lng&zoom=12[&status=pending,assigned]."""
+        serializer = DeliveryClusterQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            return Response(cluster_deliveries(*data['bbox'], data['zoom'], statuses=data.get('status')))
+        except Exception as e:
+            logger.error(f"Failed to cluster deliveries: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['get'], url_path='sla')
+    def sla(self, request):
+        """Stage-duration percentiles, e.g. ?metric=assigned_to_delivered_seconds&days=30&group_by=branch."""
+        params = request.query_params
+        try:
+            days = int(params.get('days', 30))
+            branch_id = int(params['branch']) if params.get('branch') else None
+            rider_id = int(params['rider']) if params.get('rider') else None
+            results = sla_percentiles(
+                metric=params.get('metric', 'assigned_to_delivered_seconds'),
+                days=days,
+                branch_id=branch_id,
+                rider_id=rider_id,
+                group_by=params.get('group_by') or None,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"days": days, "results": results})
+
     @action(detail=True, methods=['patch'], url_path='update-status')
     def update_delivery_status(self, request, pk=None):
         delivery = self.get_object()
@@ -1,11 +1,14 @@
 # orders/admin.py
 from django.contrib import admin
-from .models import Order, OrderItem
+from .models import Order, OrderItem, DeliveryZone, ArchivedOrder
+from .search import search_orders
+from .transitions import bulk_order_action
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
-    readonly_fields = ('product', 'quantity', 'price')
+    fields = ('product_name', 'product_category', 'product_price', 'quantity', 'price')
+    readonly_fields = fields
     can_delete = False
 
 @admin.register(Order)
@@ -19,18 +22,29 @@ class OrderAdmin(admin.ModelAdmin):
     inlines = [OrderItemInline]
     ordering = ('-created_at',)
     list_per_page = 25
-    actions = ['mark_as_shipped', 'mark_as_delivered', 'mark_as_paid']
+    actions = ['mark_as_shipped', 'mark_as_delivered', 'mark_as_cancelled', 'mark_as_paid']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Indexed id / phone / request UUID / username lookups instead of icontains over every field
+        return search_orders(queryset, search_term), False
 
     def mark_as_shipped(self, request, queryset):
-        queryset.update(status='shipped')
-        self.message_user(request, "Selected orders marked as shipped.")
+        result = bulk_order_action(list(queryset.values_list('id', flat=True)), 'ship')
+        self.message_user(request, f"{result['updated']} of the selected orders marked as shipped.")
     mark_as_shipped.short_description = "Mark as Shipped"
 
     def mark_as_delivered(self, request, queryset):
-        queryset.update(status='delivered')
-        self.message_user(request, "Selected orders marked as delivered.")
+        result = bulk_order_action(list(queryset.values_list('id', flat=True)), 'deliver')
+        self.message_user(request, f"{result['updated']} of the selected orders marked as delivered.")
     mark_as_delivered.short_description = "Mark as Delivered"
 
+    def mark_as_cancelled(self, request, queryset):
+        result = bulk_order_action(list(queryset.values_list('id', flat=True)), 'cancel')
+        self.message_user(
+            request, f"{result['updated']} of the selected orders cancelled, {result['restocked']} units restocked."
+        )
+    mark_as_cancelled.short_description = "Cancel and Restock"
+
     def mark_as_paid(self, request, queryset):
         queryset.update(payment_status='paid')
         self.message_user(request, "Selected orders marked as paid.")
@@ -38,8 +52,32 @@ class OrderAdmin(admin.ModelAdmin):
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ('id', 'order', 'product', 'quantity', 'price')
-    search_fields = ('order__id', 'product__name')
+    list_display = ('id', 'order_id', 'product_name', 'product_category', 'quantity', 'price')
+    search_fields = ('order__id', 'product_name')
     list_filter = ('order__status',)
-    readonly_fields = ('order', 'product', 'quantity', 'price')
-    ordering = ('order__created_at',)
\ No newline at end of file
+    readonly_fields = ('order', 'product', 'quantity', 'price') + OrderItem.SNAPSHOT_FIELDS
+    ordering = ('order__created_at',)
+
+@admin.register(DeliveryZone)
+class DeliveryZoneAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'branch', 'is_active', 'updated_at')
+    search_fields = ('name', 'branch__name')
+    list_filter = ('is_active', 'branch')
+    list_editable = ('is_active',)
+    readonly_fields = ('min_latitude', 'max_latitude', 'min_longitude', 'max_longitude', 'created_at', 'updated_at')
+    fields = ('branch', 'name', 'polygon', 'is_active', 'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude', 'created_at', 'updated_at')
+    ordering = ('branch', 'name')
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'customer', 'total_amount', 'status', 'payment_status', 'created_at', 'archived_at')
+    search_fields = ('id', 'request_id')
+    list_filter = ('status', 'payment_status')
+    ordering = ('-created_at',)
+    list_per_page = 25
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,131 @@
+"""
+Archival of closed orders.
+
+Orders delivered or cancelled more than ORDER_ARCHIVE_MONTHS months ago are
+moved into ArchivedOrder in batches of ORDER_ARCHIVE_BATCH_SIZE, together with
+their items, payment and delivery (including its event log and SLA facts), and
+deleted from the hot tables, so the indexes on Order, OrderItem, Payment and
+Delivery only cover recent orders. DeliverySLA rows stay in place (detached
+from the deleted delivery) for the SLA percentiles. Archived orders keep their
+ids; the customer's order history and the admin exports include the archive,
+and detail APIs look an id up in it when it is no longer in Order.
+Run with the `archive_orders` command.
+"""
+import logging
+from collections import defaultdict
+from contextvars import ContextVar
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from delivery.models import Delivery, DeliveryEvent, DeliverySLA
+from payment.models import Payment
+from products.models import Product
+from .models import Order, OrderItem, ArchivedOrder
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ('delivered', 'cancelled')
+OPEN_DELIVERY_STATUSES = ('pending', 'assigned', 'in_transit')
+ORDER_FIELDS = (
+    'id', 'customer_id', 'branch_id', 'total_amount', 'delivery_fee', 'status', 'payment_status',
+    'payment_phone_number', 'request_id', 'created_at', 'updated_at',
+)
+ITEM_FIELDS = ('id', 'order_id', 'product_id', 'quantity', 'price') + OrderItem.SNAPSHOT_FIELDS
+
+_archiving = ContextVar('archiving_orders', default=False)
+
+
+def is_archiving():
+    """
+    True while archive_closed_orders deletes the rows it has archived. Receivers that keep
+    live state (dashboard order count, slot counters, rider routes) skip these deletes.
+    """
+    return _archiving.get()
+
+
+def archive_cutoff(months=None):
+    """Orders closed (last updated) before this time are archived."""
+    months = months if months is not None else getattr(settings, 'ORDER_ARCHIVE_MONTHS', 6)
+    return timezone.now() - relativedelta(months=months)
+
+
+def archivable_orders(cutoff):
+    return (
+        Order.objects.filter(status__in=CLOSED_STATUSES, updated_at__lt=cutoff)
+        .exclude(delivery__status__in=OPEN_DELIVERY_STATUSES)
+        .exclude(payment__status='pending')
+    )
+
+
+def _by(rows, field):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row[field]].append(row)
+    return grouped
+
+
+def _archived_orders(order_ids):
+    """Build the ArchivedOrder rows for a batch with one query per table."""
+    items = list(OrderItem.objects.filter(order_id__in=order_ids).order_by('id').values(*ITEM_FIELDS))
+    # Items from before product snapshots were recorded are filled from the live product
+    missing = {item['product_id'] for item in items if not item['product_name']}
+    if missing:
+        products = Product.objects.select_related('category').in_bulk(missing)
+        for item in items:
+            if not item['product_name'] and item['product_id'] in products:
+                item.update(OrderItem.snapshot(products[item['product_id']]))
+    items = _by(items, 'order_id')
+    payments = {row['order_id']: row for row in Payment.objects.filter(order_id__in=order_ids).values()}
+    deliveries = {row['order_id']: row for row in Delivery.objects.filter(order_id__in=order_ids).values()}
+    delivery_ids = [row['id'] for row in deliveries.values()]
+    events = _by(DeliveryEvent.objects.filter(delivery_id__in=delivery_ids).order_by('created_at').values(), 'delivery_id')
+    slas = {row['delivery_id']: row for row in DeliverySLA.objects.filter(delivery_id__in=delivery_ids).values()}
+    for delivery in deliveries.values():
+        delivery['events'] = events.get(delivery['id'], [])
+        delivery['sla'] = slas.get(delivery['id'])
+
+    return [
+        ArchivedOrder(
+            **order,
+            items=items.get(order['id'], []),
+            payment=payments.get(order['id']),
+            delivery=deliveries.get(order['id']),
+        )
+        for order in Order.objects.filter(id__in=order_ids).values(*ORDER_FIELDS)
+    ]
+
+
+def archive_closed_orders(months=None, batch_size=None, max_batches=None):
+    """
+    Move closed orders older than the cutoff into the archive.
+    Each batch is copied and deleted in its own transaction; rows locked by other
+    transactions are skipped and picked up by a later run.
+    Args:
+        months: Archive orders closed more than this many months ago (default ORDER_ARCHIVE_MONTHS).
+        batch_size: Orders per transaction (default ORDER_ARCHIVE_BATCH_SIZE).
+        max_batches: Stop after this many batches (default: until none are left).
+    Returns:
+        Number of orders archived.
+    """
+    batch_size = batch_size or getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 500)
+    candidates = archivable_orders(archive_cutoff(months))
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            order_ids = list(
+                candidates.select_for_update(skip_locked=True, of=('self',))
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not order_ids:
+                break
+            ArchivedOrder.objects.bulk_create(_archived_orders(order_ids))
+            token = _archiving.set(True)
+            try:
+                Order.objects.filter(id__in=order_ids).delete()  # Cascades to items, payment and delivery, not SLA facts
+            finally:
+                _archiving.reset(token)
+        archived += len(order_ids)
+        batches += 1
+        logger.info(f"Archived {len(order_ids)} orders ({archived} so far)")
+    return archived
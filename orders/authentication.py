@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.core import signing
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from .events import read_stream_token
+
+User = get_user_model()
+
+
+class OrderEventTokenAuthentication(BaseAuthentication):
+    """
+    Authenticates ?token= order event stream tokens (see orders.events.make_stream_token).
+    request.auth is the token payload, so the view can check the token's order.
+    Requests without a token fall through to the next authentication class.
+    """
+
+    def authenticate(self, request):
+        token = request.query_params.get('token')
+        if not token:
+            return None
+        try:
+            payload = read_stream_token(token)
+        except signing.BadSignature:
+            raise AuthenticationFailed('Invalid or expired stream token.')
+        user = User.objects.filter(id=payload['user'], is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed('Invalid or expired stream token.')
+        return user, payload
@@ -0,0 +1,86 @@
+import json
+import logging
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENT_SEQ_KEY = "order_event_seq_{}"
+ORDER_EVENT_KEY = "order_event_{}_{}"
+STREAM_TOKEN_SALT = "orders.events.stream"
+
+
+def _events_timeout():
+    return getattr(settings, 'ORDER_EVENTS_CACHE_TIMEOUT', 3600)
+
+
+def publish_order_event(order_id, event_type, **data):
+    """
+    Publish a compact status-change event for an order once the current transaction commits.
+    Each event is stored under its own key with a per-order sequence number,
+    so concurrent publishers never overwrite each other.
+    Args:
+        order_id: ID of the order the event belongs to.
+        event_type: 'order', 'payment' or 'delivery'.
+        data: Status fields to include, e.g. status='paid'.
+    """
+    def _publish():
+        try:
+            seq_key = ORDER_EVENT_SEQ_KEY.format(order_id)
+            timeout = _events_timeout()
+            cache.add(seq_key, 0, timeout=timeout)
+            event_id = cache.incr(seq_key)
+            cache.touch(seq_key, timeout=timeout)
+            event = {'id': event_id, 'type': event_type, 'at': timezone.now().isoformat(), **data}
+            cache.set(ORDER_EVENT_KEY.format(order_id, event_id), event, timeout=timeout)
+        except Exception as e:
+            # Events are best-effort; never break the write path that triggered them
+            logger.error(f"Failed to publish {event_type} event for order {order_id}: {str(e)}")
+
+    transaction.on_commit(_publish)
+
+
+def get_order_events(order_id, after=0):
+    """
+    Return events for an order with id greater than `after`, oldest first.
+    Events that already expired from the cache are skipped.
+    """
+    last_id = cache.get(ORDER_EVENT_SEQ_KEY.format(order_id)) or 0
+    if last_id < after:
+        # Sequence expired and restarted; replay what we have
+        after = 0
+    if last_id <= after:
+        return []
+    keys = [ORDER_EVENT_KEY.format(order_id, event_id) for event_id in range(after + 1, last_id + 1)]
+    found = cache.get_many(keys)
+    return [found[key] for key in keys if key in found]
+
+
+def format_sse(event):
+    """Serialize an event as a Server-Sent Events message."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+def stream_token_seconds():
+    return getattr(settings, 'ORDER_EVENTS_TOKEN_SECONDS', 900)
+
+
+def make_stream_token(user_id, order_id):
+    """
+    Signed, short-lived token letting a browser EventSource (which cannot send an
+    Authorization header) read one order's event stream as this user.
+    """
+    return signing.dumps({'user': user_id, 'order': order_id}, salt=STREAM_TOKEN_SALT, compress=True)
+
+
+def read_stream_token(token):
+    """
+    Returns:
+        Dict with 'user' and 'order' ids.
+    Raises:
+        signing.BadSignature: The token was tampered with or has expired (SignatureExpired).
+    """
+    return signing.loads(token, salt=STREAM_TOKEN_SALT, max_age=stream_token_seconds())
@@ -0,0 +1,60 @@
+"""
+Expiry of abandoned checkouts.
+
+An order whose STK push is never completed stays pending while holding its
+reserved stock, delivery slot and pending payment. `expire_pending_orders`
+(run with the `expire_pending_orders` command, e.g. every few minutes) cancels
+pending orders older than ORDER_PENDING_TTL_MINUTES in batches and releases
+what they hold. Batches are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so
+several workers can sweep at once without waiting on or double-processing
+each other's rows, and orders being paid right now are skipped.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .events import publish_order_event
+from .models import Order
+from .transitions import release_cancelled_orders
+
+logger = logging.getLogger(__name__)
+
+
+def expired_orders(cutoff):
+    # Served by the partial index on pending orders (order_pending_created_idx)
+    return Order.objects.filter(status='pending', created_at__lt=cutoff).exclude(payment__status='successful')
+
+
+def expire_pending_orders(minutes=None, batch_size=None, max_batches=None):
+    """
+    Cancel pending orders created more than `minutes` ago and release their stock,
+    pending payments and delivery slots.
+    Args:
+        minutes: Age after which a pending order expires (default ORDER_PENDING_TTL_MINUTES).
+        batch_size: Orders per transaction (default ORDER_EXPIRY_BATCH_SIZE).
+        max_batches: Stop after this many batches (default: until none are left).
+    Returns:
+        Number of orders cancelled.
+    """
+    minutes = minutes or getattr(settings, 'ORDER_PENDING_TTL_MINUTES', 30)
+    batch_size = batch_size or getattr(settings, 'ORDER_EXPIRY_BATCH_SIZE', 500)
+    candidates = expired_orders(timezone.now() - timedelta(minutes=minutes))
+    expired = batches = 0
+    while max_batches is None or batches < max_batches:
+        now = timezone.now()
+        with transaction.atomic():
+            rows = list(
+                candidates.select_for_update(skip_locked=True, of=('self',))
+                .order_by('created_at').values('id', 'payment_status')[:batch_size]
+            )
+            if not rows:
+                break
+            Order.objects.filter(id__in=[row['id'] for row in rows]).update(status='cancelled', updated_at=now)
+            release_cancelled_orders(rows, now)
+            for row in rows:
+                publish_order_event(row['id'], 'order', status='cancelled', payment_status=row['payment_status'])
+        expired += len(rows)
+        batches += 1
+        logger.info(f"Expired {len(rows)} pending orders ({expired} so far)")
+    return expired
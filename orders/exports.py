@@ -0,0 +1,184 @@
+"""
+Streaming CSV / NDJSON exports for admin reports.
+
+Rows are read with values_list() and QuerySet.iterator(), so no model
+instances or serializers are built, and are written to a
+StreamingHttpResponse in chunks; memory stays flat however many rows match.
+Admin viewsets opt in with ExportMixin and a list of (column, field) pairs.
+Rows of archived orders (see orders/archive.py) come first, then the live ones.
+"""
+import csv
+from itertools import chain
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from users.permissions import IsAdminUser
+from users.models import CustomUser
+from .models import ArchivedOrder
+from .serializers import ExportQuerySerializer
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Echo:
+    """File-like object whose write() returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _day_start(day):
+    return datetime.combine(day, time.min, tzinfo=timezone.get_current_timezone())
+
+
+def filter_export(queryset, params, date_field='created_at', status_field='status'):
+    """
+    Apply the date range (inclusive days in the current time zone) and status filters.
+    Days are turned into datetime bounds so an index on date_field can be used.
+    """
+    if params.get('date_from'):
+        queryset = queryset.filter(**{f'{date_field}__gte': _day_start(params['date_from'])})
+    if params.get('date_to'):
+        queryset = queryset.filter(**{f'{date_field}__lt': _day_start(params['date_to'] + timedelta(days=1))})
+    if params.get('status'):
+        queryset = queryset.filter(**{f'{status_field}__in': params['status']})
+    return queryset
+
+
+def archived_json_rows(model, columns, params, chunk_size):
+    """
+    Export rows for the payments or deliveries of archived orders, read from the archive's
+    JSON copy of them (the ArchivedOrder field named after the model).
+    Args:
+        model: Payment or Delivery.
+        columns: The live export's (column, field lookup) pairs. 'order__...' lookups are read
+            from the archived order, 'delivery_person__username' from the rider, others are
+            keys of the JSON copy, converted back with the model field.
+        params: Validated ExportQuerySerializer data, matched against the JSON copy.
+        chunk_size: Archived orders fetched per database round trip.
+    Yields:
+        Row tuples in column order.
+    """
+    part = model._meta.model_name
+    archived = ArchivedOrder.objects.filter(**{f'{part}__isnull': False})
+    if params.get('date_to'):
+        # Payments and deliveries are created with or after their order
+        archived = archived.filter(created_at__lt=_day_start(params['date_to'] + timedelta(days=1)))
+    order_fields = [field.removeprefix('order__') for _, field in columns if field.startswith('order__')]
+    riders = {}
+
+    def value(record, order, field):
+        if field.startswith('order__'):
+            return order[field.removeprefix('order__')]
+        if field == 'delivery_person__username':
+            rider_id = record['delivery_person_id']
+            if rider_id is not None and rider_id not in riders:
+                riders[rider_id] = CustomUser.objects.filter(id=rider_id).values_list('username', flat=True).first()
+            return riders.get(rider_id)
+        return model._meta.get_field(field).to_python(record[field])
+
+    rows = archived.order_by('pk').values_list(part, *order_fields).iterator(chunk_size=chunk_size)
+    for record, *order in rows:
+        created_at = timezone.localtime(parse_datetime(record['created_at'])).date()
+        if params.get('date_from') and created_at < params['date_from']:
+            continue
+        if params.get('date_to') and created_at > params['date_to']:
+            continue
+        if params.get('status') and record['status'] not in params['status']:
+            continue
+        order = dict(zip(order_fields, order))
+        yield tuple(value(record, order, field) for _, field in columns)
+
+
+def stream_rows(queryset, columns, file_format, chunk_size, archived_rows=()):
+    """
+    Yield the export body in chunks of chunk_size rows.
+    Args:
+        queryset: Filtered queryset; rows are read in primary key order.
+        columns: List of (column name, field lookup) pairs.
+        file_format: 'csv' or 'ndjson'.
+        chunk_size: Rows fetched per database round trip and per yielded chunk.
+        archived_rows: Row tuples of archived orders, written before the queryset's rows.
+    """
+    names = [name for name, _ in columns]
+    rows = chain(
+        archived_rows,
+        queryset.order_by('pk').values_list(*[field for _, field in columns]).iterator(chunk_size=chunk_size),
+    )
+    if file_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        encode = writer.writerow
+    else:
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+        def encode(row):
+            return encoder.encode(dict(zip(names, row))) + '\n'
+    chunk = []
+    for row in rows:
+        chunk.append(encode(row))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def export_response(queryset, columns, file_format, filename, archived_rows=()):
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    response = StreamingHttpResponse(
+        stream_rows(queryset, columns, file_format, chunk_size, archived_rows),
+        content_type=EXPORT_CONTENT_TYPES[file_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}-{timezone.now():%Y%m%d-%H%M%S}.{file_format}"'
+    )
+    return response
+
+
+class ExportMixin:
+    """
+    Adds GET .../export/?file_format=csv|ndjson&date_from=&date_to=&status=a,b to an admin viewset.
+    Set export_columns ([(column, field lookup), ...]) and export_filename;
+    override export_queryset() to narrow the rows and export_archived_rows() to add
+    the rows of archived orders.
+    """
+    export_columns = ()
+    export_filename = 'export'
+    export_date_field = 'created_at'
+    export_status_field = 'status'
+
+    def export_queryset(self):
+        return self.queryset.model._default_manager.all()
+
+    def export_archived_rows(self, params, chunk_size):
+        """Row tuples (in export_columns order) of archived orders matching params; none by default."""
+        return ()
+
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[IsAdminUser])
+    def export(self, request):
+        model = self.queryset.model
+        serializer = ExportQuerySerializer(
+            data=request.query_params,
+            context={'status_choices': model._meta.get_field(self.export_status_field).choices},
+        )
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        queryset = filter_export(
+            self.export_queryset(), params,
+            date_field=self.export_date_field, status_field=self.export_status_field,
+        )
+        return export_response(
+            queryset, self.export_columns, params['file_format'], self.export_filename,
+            archived_rows=self.export_archived_rows(params, getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)),
+        )
@@ -0,0 +1,104 @@
+import logging
+import zlib
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from delivery.utils import build_distance_matrix
+from .models import Branch
+from .spatial import branch_index, nearest_serviceable_branches
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_FEE_QUOTE_KEY = "delivery_fee_{}_{}_{}"  # branch, coordinate cell, tier table version
+DEFAULT_FEE_TIERS = ((3, 100), (7, 200), (12, 350), (None, 500))
+
+
+def fee_tiers(branch_id=None):
+    """Return the (max_km, fee) tier table for a branch; a max_km of None covers any distance."""
+    overrides = getattr(settings, 'DELIVERY_FEE_BRANCH_TIERS', {})
+    if branch_id in overrides:
+        return overrides[branch_id]
+    return getattr(settings, 'DELIVERY_FEE_TIERS', DEFAULT_FEE_TIERS)
+
+
+def fee_for_distance(distance_km, tiers):
+    """
+    Price a delivery distance against a tier table.
+    Returns:
+        Tuple (fee as Decimal, tier index), or None when the distance is beyond the last tier.
+    """
+    for index, (max_km, fee) in enumerate(tiers):
+        if max_km is None or distance_km <= max_km:
+            return Decimal(str(fee)).quantize(Decimal('0.01')), index
+    return None
+
+
+def _coordinate_cell(latitude, longitude):
+    precision = getattr(settings, 'DELIVERY_FEE_COORDINATE_PRECISION', 3)
+    return round(latitude, precision), round(longitude, precision)
+
+
+def _unlocated_branch_quote(branch_id):
+    """
+    Quote for an active branch that branch_index skips because it has no coordinates: the
+    distance cannot be measured, so the last (widest) tier of its table applies.
+    Returns None if the branch does not exist or is inactive.
+    """
+    branch = Branch.objects.filter(id=branch_id, is_active=True).values('id', 'name').first()
+    if branch is None:
+        return None
+    tiers = fee_tiers(branch['id'])
+    return {
+        'branch_id': branch['id'],
+        'branch_name': branch['name'],
+        'distance_km': None,
+        'fee': Decimal(str(tiers[-1][1])).quantize(Decimal('0.01')),
+        'tier': len(tiers) - 1,
+    }
+
+
+def quote_delivery_fee(latitude, longitude, branch_id=None):
+    """
+    Quote the delivery fee from a branch to the customer coordinates.
+    The coordinates are rounded to a DELIVERY_FEE_COORDINATE_PRECISION cell and the quote is
+    memoized per (branch, cell), so repeated quotes and the checkout that follows them are a
+    single cache read. The distance itself comes from the shared route distance cache.
+    Args:
+        latitude, longitude: Customer coordinates.
+        branch_id: Delivering branch (defaults to the nearest serviceable branch).
+    Returns:
+        Dict with 'branch_id', 'branch_name', 'distance_km', 'fee' (Decimal) and 'tier',
+        or None if no branch can deliver there or the distance is beyond the tier table.
+        A branch without coordinates is quoted its last tier with a distance_km of None.
+    """
+    if branch_id is None:
+        nearest = nearest_serviceable_branches(latitude, longitude)
+        if not nearest:
+            return None
+        branch = nearest[0]
+    else:
+        branch = branch_index.get(branch_id)
+        if branch is None:
+            return _unlocated_branch_quote(branch_id)
+
+    tiers = fee_tiers(branch['id'])
+    cell = _coordinate_cell(latitude, longitude)
+    # Changing the tier table changes the key, so stale quotes are never served
+    version = zlib.crc32(repr(tiers).encode())
+    key = DELIVERY_FEE_QUOTE_KEY.format(branch['id'], f"{cell[0]},{cell[1]}", version)
+    quote = cache.get(key)
+    if quote is not None:
+        return quote or None  # An empty dict records an out-of-range cell
+
+    distance_m = build_distance_matrix([(branch['latitude'], branch['longitude']), cell])[0][1]
+    distance_km = round(distance_m / 1000, 3)
+    priced = fee_for_distance(distance_km, tiers)
+    quote = {
+        'branch_id': branch['id'],
+        'branch_name': branch['name'],
+        'distance_km': distance_km,
+        'fee': priced[0],
+        'tier': priced[1],
+    } if priced else {}
+    cache.set(key, quote, timeout=getattr(settings, 'DELIVERY_FEE_CACHE_TIMEOUT', 86400))
+    return quote or None
@@ -0,0 +1,105 @@
+"""
+Idempotent checkout keyed by the client's Idempotency-Key header.
+
+The first request with a key inserts an IdempotencyKey row inside the checkout
+transaction and stores its final response there before committing. A retry
+with the same key inserts the same (user, key) pair: on PostgreSQL that insert
+waits on the unique index until the first request's transaction ends, then
+fails, and the retry is answered with the stored response without creating an
+order or sending another STK push. If the first request rolled back, the retry
+runs as a new request. Keys expire after IDEMPOTENCY_KEY_TTL_HOURS: an expired
+key is claimed afresh by the next request that uses it, and
+`purge_idempotency_keys` deletes the ones nobody reuses.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(data):
+    """SHA-256 of the request body with keys sorted, so key order does not matter."""
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def idempotency_key_expiry():
+    """Keys created before this time have expired."""
+    return timezone.now() - timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def claim_idempotency_key(user, key, data):
+    """
+    Claim a key for this request; must be called inside the checkout transaction.
+    Returns:
+        Tuple (record, None) if the request should run, or (None, response) with the response
+        to send instead: the stored one for a completed duplicate, or an error.
+    """
+    if len(key) > MAX_KEY_LENGTH:
+        return None, Response(
+            {"error": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    fingerprint = request_fingerprint(data)
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, fingerprint=fingerprint), None
+    except IntegrityError:
+        pass  # Used before; the request that holds it has finished
+
+    record = IdempotencyKey.objects.select_for_update().filter(user=user, key=key).first()
+    if record is None:
+        return claim_idempotency_key(user, key, data)  # Purged in the meantime
+    if record.created_at < idempotency_key_expiry():
+        # Expired but not purged yet: this request takes the key over. The row lock makes
+        # a concurrent retry wait and then find the fresh claim.
+        record.fingerprint = fingerprint
+        record.response_status = None
+        record.response_body = None
+        record.created_at = timezone.now()
+        record.save()
+        return record, None
+    if record.fingerprint != fingerprint:
+        return None, Response(
+            {"error": f"{IDEMPOTENCY_HEADER} was already used with a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.response_status is None:
+        return None, Response(
+            {"error": f"A request with this {IDEMPOTENCY_HEADER} is still in progress."},
+            status=status.HTTP_409_CONFLICT,
+        )
+    logger.info(f"Replaying checkout response for idempotency key {key} of user {user.id}")
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return None, response
+
+
+def complete_idempotency_key(record, response):
+    """Store the final response of the request that claimed the key."""
+    record.response_status = response.status_code
+    record.response_body = response.data
+    record.save(update_fields=['response_status', 'response_body'])
+
+
+def purge_idempotency_keys(hours=None):
+    """
+    Delete keys older than IDEMPOTENCY_KEY_TTL_HOURS.
+    Returns:
+        Number of keys deleted.
+    """
+    expiry = timezone.now() - timedelta(hours=hours) if hours else idempotency_key_expiry()
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=expiry).delete()
+    return deleted
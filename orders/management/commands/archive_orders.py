@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from orders.archive import archive_closed_orders
+
+
+class Command(BaseCommand):
+    help = "Move delivered and cancelled orders older than ORDER_ARCHIVE_MONTHS into the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, help='Archive orders closed more than this many months ago.')
+        parser.add_argument('--batch-size', type=int, help='Orders moved per transaction.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches.')
+
+    def handle(self, *args, **options):
+        archived = archive_closed_orders(
+            months=options['months'], batch_size=options['batch_size'], max_batches=options['max_batches']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} orders."))
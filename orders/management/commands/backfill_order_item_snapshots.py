@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from orders.models import OrderItem
+
+
+class Command(BaseCommand):
+    help = "Fill the product snapshot of order items created before snapshots were captured."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id, filled = 0, 0
+        while True:
+            # Keyset pagination keeps every batch an index range scan
+            batch = list(
+                OrderItem.objects.filter(product_name='', id__gt=last_id)
+                .select_related('product__category').order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            for item in batch:
+                for field, value in OrderItem.snapshot(item.product).items():
+                    setattr(item, field, value)
+            with transaction.atomic():
+                OrderItem.objects.bulk_update(batch, OrderItem.SNAPSHOT_FIELDS)
+            last_id = batch[-1].id
+            filled += len(batch)
+            self.stdout.write(f"Backfilled {filled} order items...")
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {filled} order item snapshots."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from orders.expiry import expire_pending_orders
+
+
+class Command(BaseCommand):
+    help = "Cancel pending orders older than ORDER_PENDING_TTL_MINUTES and release their stock and slots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, help='Age after which a pending order expires.')
+        parser.add_argument('--batch-size', type=int, help='Orders cancelled per transaction.')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches.')
+
+    def handle(self, *args, **options):
+        expired = expire_pending_orders(
+            minutes=options['minutes'], batch_size=options['batch_size'], max_batches=options['max_batches']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} pending orders."))
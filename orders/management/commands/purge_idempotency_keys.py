@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from orders.idempotency import purge_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Delete checkout idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, help='Delete keys older than this many hours.')
+
+    def handle(self, *args, **options):
+        deleted = purge_idempotency_keys(hours=options['hours'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} idempotency keys."))
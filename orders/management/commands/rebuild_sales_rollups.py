@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from orders.archive import archive_cutoff
+from orders.rollups import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from paid orders (run nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help='Rebuild this many days up to and including today (default 2).')
+        parser.add_argument('--date-from', help='First local date (YYYY-MM-DD); overrides --days.')
+        parser.add_argument('--date-to', help='Last local date (YYYY-MM-DD), default today.')
+
+    def handle(self, *args, **options):
+        date_to = parse_date(options['date_to']) if options['date_to'] else timezone.localdate()
+        if options['date_from']:
+            date_from = parse_date(options['date_from'])
+        else:
+            date_from = date_to - timedelta(days=options['days'] - 1)
+        if date_from is None or date_to is None or date_from > date_to:
+            raise CommandError("Invalid date range.")
+        if date_from <= timezone.localdate(archive_cutoff()):
+            # Archived orders are no longer in Order; rebuilding would drop their sales
+            raise CommandError(f"Orders before {timezone.localdate(archive_cutoff())} may be archived; pick a later date.")
+        result = rebuild_sales_rollups(date_from, date_to)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {date_from}..{date_to}: {result['orders']} orders, "
+            f"{result['branch_rows']} branch rows, {result['product_rows']} product rows."
+        ))
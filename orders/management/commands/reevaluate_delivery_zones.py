@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from orders.spatial import reevaluate_open_deliveries
+
+
+class Command(BaseCommand):
+    help = "Re-check pending deliveries against the current delivery zones and reroute out-of-zone orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, action='append', dest='branches',
+                            help='Only re-check orders of this branch (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        result = reevaluate_open_deliveries(branch_ids=options['branches'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {result['checked']} deliveries, rerouted {result['rerouted']}, "
+            f"{len(result['unserviceable'])} outside every zone."
+        ))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-19 07:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_alter_branch_options_alter_order_branch_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('polygon', models.JSONField(help_text='List of [latitude, longitude] vertices.')),
+                ('is_active', models.BooleanField(default=True)),
+                ('min_latitude', models.FloatField(default=0.0, editable=False)),
+                ('max_latitude', models.FloatField(default=0.0, editable=False)),
+                ('min_longitude', models.FloatField(default=0.0, editable=False)),
+                ('max_longitude', models.FloatField(default=0.0, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='zones', to='orders.branch')),
+            ],
+            options={
+                'ordering': ['branch', 'name'],
+                'indexes': [models.Index(fields=['branch', 'is_active'], name='orders_deli_branch__37457f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_deliveryzone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivery_fee',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=10),
+        ),
+    ]
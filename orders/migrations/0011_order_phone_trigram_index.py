@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-19 07:58
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_orderitem_product_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0005_username_trigram_index'),  # Creates the pg_trgm extension
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['payment_phone_number'], name='order_phone_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
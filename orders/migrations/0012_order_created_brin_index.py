@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-19 07:59
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_order_phone_trigram_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='order_created_brin_idx'),
+        ),
+    ]
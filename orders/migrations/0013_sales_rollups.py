@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-19 08:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_order_created_brin_index'),
+        ('products', '0010_delete_branch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='sales_recorded_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='DailyBranchSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('delivery_fees', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='orders.branch')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['branch', 'date'], name='orders_dail_branch__1b1def_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'branch'), name='unique_daily_branch_sales', nulls_distinct=False)],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_product_sales', to='orders.branch')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='products.category')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date', 'category'], name='orders_dail_date_c25621_idx'), models.Index(fields=['product', 'date'], name='orders_dail_product_f371d1_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'branch', 'product'), name='unique_daily_product_sales', nulls_distinct=False)],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-19 08:08
+
+import django.contrib.postgres.indexes
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_sales_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('delivery_fee', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(max_length=20)),
+                ('payment_status', models.CharField(max_length=20)),
+                ('payment_phone_number', models.CharField(blank=True, max_length=15, null=True)),
+                ('request_id', models.CharField(db_index=True, max_length=36)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('items', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('payment', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('delivery', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('branch', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.branch')),
+                ('customer', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['customer', '-created_at'], name='orders_arch_custome_405e35_idx'), django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='archived_order_created_brin_idx')],
+            },
+        ),
+    ]
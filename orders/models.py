@@ -1,7 +1,11 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from products.models import Product
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
+from products.models import Product, Category
+from decimal import Decimal
 import uuid
 
 User = get_user_model()
@@ -27,9 +31,62 @@ class Branch(models.Model):
         ]
 
 
+class DeliveryZone(models.Model):
+    """Area a branch delivers to, stored as a polygon of [latitude, longitude] vertices."""
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='zones')
+    name = models.CharField(max_length=100)
+    polygon = models.JSONField(help_text='List of [latitude, longitude] vertices.')
+    is_active = models.BooleanField(default=True)
+    min_latitude = models.FloatField(editable=False, default=0.0)
+    max_latitude = models.FloatField(editable=False, default=0.0)
+    min_longitude = models.FloatField(editable=False, default=0.0)
+    max_longitude = models.FloatField(editable=False, default=0.0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.branch.name})"
+
+    def clean(self):
+        if not isinstance(self.polygon, list) or len(self.polygon) < 3:
+            raise ValidationError({'polygon': 'A zone needs at least 3 [latitude, longitude] vertices.'})
+        for vertex in self.polygon:
+            if (
+                not isinstance(vertex, (list, tuple)) or len(vertex) != 2
+                or not all(isinstance(value, (int, float)) for value in vertex)
+                or not (-90 <= vertex[0] <= 90 and -180 <= vertex[1] <= 180)
+            ):
+                raise ValidationError({'polygon': f'Invalid vertex {vertex}.'})
+
+    def save(self, *args, **kwargs):
+        # Keep the bounding box in step with the polygon
+        if self.polygon:
+            latitudes = [vertex[0] for vertex in self.polygon]
+            longitudes = [vertex[1] for vertex in self.polygon]
+            self.min_latitude, self.max_latitude = min(latitudes), max(latitudes)
+            self.min_longitude, self.max_longitude = min(longitudes), max(longitudes)
+        super().save(*args, **kwargs)
+
+    class Meta:
+        ordering = ['branch', 'name']
+        indexes = [
+            models.Index(fields=['branch', 'is_active']),
+        ]
+
+
+ORDER_STATUS_TRANSITIONS = {
+    'pending': ['processing', 'cancelled'],
+    'processing': ['shipped', 'delivered', 'cancelled'],
+    'shipped': ['delivered'],
+    'delivered': [],
+    'cancelled': []
+}
+
+
 class Order(models.Model):
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    delivery_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     branch = models.ForeignKey('Branch', on_delete=models.SET_NULL,null=True)
@@ -65,6 +122,7 @@ class Order(models.Model):
         ],
         default='unpaid'
     )
+    sales_recorded_at = models.DateTimeField(null=True, blank=True, editable=False)  # Counted in the sales rollups
     request_id = models.CharField(
         max_length=36,
         unique=True,
@@ -89,7 +147,7 @@ class Order(models.Model):
 
     def recalculate_total(self):
         total = sum(item.price * item.quantity for item in self.items.all())
-        self.total_amount = total
+        self.total_amount = total + self.delivery_fee
         self.save()
 
     class Meta:
@@ -100,17 +158,161 @@ class Order(models.Model):
             models.Index(fields=['payment_status']),
             models.Index(fields=['request_id']),
             models.Index(fields=['branch']),
+            # Substring search on phone numbers (pg_trgm, see orders/search.py)
+            GinIndex(fields=['payment_phone_number'], opclasses=['gin_trgm_ops'], name='order_phone_trgm_idx'),
+            # Date-range scans for exports; rows are appended in created_at order
+            BrinIndex(fields=['created_at'], name='order_created_brin_idx'),
+            # Only unpaid checkouts, for the expiry sweeper (orders/expiry.py)
+            models.Index(
+                fields=['status', 'created_at'], name='order_pending_created_idx', condition=models.Q(status='pending')
+            ),
         ]
 
 
 class OrderItem(models.Model):
+    SNAPSHOT_FIELDS = ('product_name', 'product_image', 'product_category', 'product_price')
+
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # The product as it was at checkout; history is rendered from these without joining products
+    product_name = models.CharField(max_length=200, blank=True, default='')
+    product_image = models.CharField(max_length=255, blank=True, default='')  # Cloudinary public_id
+    product_category = models.CharField(max_length=100, blank=True, default='')
+    product_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Discounted unit price
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name or self.product.name} in Order {self.order_id}"
+
+    @staticmethod
+    def snapshot(product):
+        """Return the snapshot field values for a product; load it with select_related('category')."""
+        return {
+            'product_name': product.name,
+            'product_image': str(product.image) if product.image else '',
+            'product_category': product.category.name,
+            'product_price': Decimal(product.discounted_price).quantize(Decimal('0.01')),
+        }
+
+    def save(self, *args, **kwargs):
+        if not self.product_name and self.product_id:
+            for field, value in self.snapshot(self.product).items():
+                setattr(self, field, value)
+        super().save(*args, **kwargs)
+
+    class Meta:
+        unique_together = ['order', 'product']
+
+
+class DailyBranchSales(models.Model):
+    """
+    Paid orders per branch and day (the order's local creation date).
+    Maintained incrementally when a payment succeeds and rebuilt nightly by `rebuild_sales_rollups`.
+    """
+    date = models.DateField()
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_sales')
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Order totals incl. delivery fees
+    delivery_fees = models.DecimalField(max_digits=14, decimal_places=2, default=0)
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.name} in Order {self.order.id}"
+        return f"{self.date} {self.branch_id}: {self.orders} orders, {self.revenue}"
 
     class Meta:
-        unique_together = ['order', 'product']
\ No newline at end of file
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'branch'], name='unique_daily_branch_sales', nulls_distinct=False
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['branch', 'date']),
+        ]
+
+
+class DailyProductSales(models.Model):
+    """Paid units and item revenue per product, branch and day; category totals are summed from these rows."""
+    date = models.DateField()
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_product_sales')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_sales')
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.date} {self.product_id}@{self.branch_id}: {self.units} units"
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'branch', 'product'], name='unique_daily_product_sales', nulls_distinct=False
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'category']),
+            models.Index(fields=['product', 'date']),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    """
+    A closed order moved out of the hot tables by `archive_orders`, under its original id.
+    Its items, payment and delivery (with the delivery's event log and SLA facts) are kept
+    as JSON documents of their field values.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='archived_orders',
+        db_index=False,  # Covered by the (customer, created_at) index
+    )
+    branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    delivery_fee = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20)
+    payment_status = models.CharField(max_length=20)
+    payment_phone_number = models.CharField(max_length=15, null=True, blank=True)
+    request_id = models.CharField(max_length=36, db_index=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    items = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    payment = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    delivery = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f"Archived Order {self.id}"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['customer', '-created_at']),
+            BrinIndex(fields=['created_at'], name='archived_order_created_brin_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied Idempotency-Key for checkout, with the request fingerprint and the final
+    response that retries with the same key get back (see orders/idempotency.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 of the request body
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key} of user {self.user_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+        indexes = [
+            BrinIndex(fields=['created_at'], name='idempotency_created_brin_idx'),  # Purging old keys
+        ]
@@ -0,0 +1,222 @@
+"""
+Daily sales rollups: revenue, orders and units by branch, category and product.
+
+An order is counted once, on its local creation date, when its payment
+succeeds (`record_order_sale`, claimed through Order.sales_recorded_at so
+retries and repeated callbacks never double count). The nightly
+`rebuild_sales_rollups` command recomputes recent days from the orders with
+pandas group-bys, which also corrects refunds and manual edits.
+Dashboards read only the rollup tables (`sales_timeseries`).
+"""
+import logging
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from .models import Order, OrderItem, DailyBranchSales, DailyProductSales
+
+logger = logging.getLogger(__name__)
+
+SALES_METRICS = ('revenue', 'orders', 'units')
+SALES_GROUPS = {
+    # group_by: (rollup model, key field, label field)
+    None: (DailyBranchSales, None, None),
+    'branch': (DailyBranchSales, 'branch_id', 'branch__name'),
+    'category': (DailyProductSales, 'category_id', 'category__name'),
+    'product': (DailyProductSales, 'product_id', 'product__name'),
+}
+SALES_INTERVALS = {'day': None, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def _increment(model, keys, deltas, **create_fields):
+    """Add deltas to the rollup row identified by keys, creating it if needed."""
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**keys).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **create_fields, **deltas)
+    except IntegrityError:  # Created concurrently
+        model.objects.filter(**keys).update(**changes)
+
+
+def record_order_sale(order_id):
+    """
+    Add a paid order to the daily rollups, at most once per order.
+    Returns:
+        True if the order was counted now, False if it already was.
+    """
+    with transaction.atomic():
+        claimed = Order.objects.filter(id=order_id, sales_recorded_at__isnull=True).update(
+            sales_recorded_at=timezone.now()
+        )
+        if not claimed:
+            return False
+        order = Order.objects.values('created_at', 'branch_id', 'total_amount', 'delivery_fee').get(id=order_id)
+        day = timezone.localdate(order['created_at'])
+        items = list(
+            OrderItem.objects.filter(order_id=order_id).values_list(
+                'product_id', 'product__category_id', 'quantity', 'price'
+            )
+        )
+        _increment(
+            DailyBranchSales,
+            {'date': day, 'branch_id': order['branch_id']},
+            {
+                'orders': 1,
+                'units': sum(quantity for _, _, quantity, _ in items),
+                'revenue': order['total_amount'],
+                'delivery_fees': order['delivery_fee'],
+            },
+        )
+        for product_id, category_id, quantity, price in items:
+            _increment(
+                DailyProductSales,
+                {'date': day, 'branch_id': order['branch_id'], 'product_id': product_id},
+                {'orders': 1, 'units': quantity, 'revenue': price * quantity},
+                category_id=category_id,
+            )
+    return True
+
+
+def _day_bounds(date_from, date_to):
+    zone = timezone.get_current_timezone()
+    return (
+        datetime.combine(date_from, time.min, tzinfo=zone),
+        datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=zone),
+    )
+
+
+def _cents(values):
+    return [int(value * 100) for value in values]
+
+
+def _amount(cents):
+    return Decimal(int(cents)) / 100
+
+
+def _key(value):
+    # pandas turns missing foreign keys into NaN
+    return None if value != value else int(value)
+
+
+def rebuild_sales_rollups(date_from, date_to):
+    """
+    Recompute the rollups for the local dates date_from..date_to (inclusive) from paid orders.
+    Orders and items are read with one flat query each and aggregated with pandas; the
+    days' rollup rows are then replaced in one transaction.
+    Returns:
+        Dict with the number of 'orders' counted and 'branch_rows' / 'product_rows' written.
+    """
+    import pandas as pd  # Only the nightly rebuild needs pandas
+
+    start, end = _day_bounds(date_from, date_to)
+    paid = Order.objects.filter(created_at__gte=start, created_at__lt=end, payment__status='successful')
+    orders = pd.DataFrame.from_records(
+        list(paid.values_list('id', 'created_at', 'branch_id', 'total_amount', 'delivery_fee')),
+        columns=['order_id', 'created_at', 'branch_id', 'total_amount', 'delivery_fee'],
+    )
+    items = pd.DataFrame.from_records(
+        list(
+            OrderItem.objects.filter(order__in=paid).values_list(
+                'order_id', 'product_id', 'product__category_id', 'quantity', 'price'
+            )
+        ),
+        columns=['order_id', 'product_id', 'category_id', 'quantity', 'price'],
+    )
+
+    branch_rows, product_rows = [], []
+    if not orders.empty:
+        # Money is summed in integer cents to stay exact
+        orders['date'] = pd.to_datetime(orders['created_at'], utc=True).dt.tz_convert(
+            timezone.get_current_timezone()
+        ).dt.date
+        orders['revenue'] = _cents(orders['total_amount'])
+        orders['delivery_fees'] = _cents(orders['delivery_fee'])
+        items['revenue'] = _cents(items['price'] * items['quantity']) if not items.empty else []
+        units = items.groupby('order_id')['quantity'].sum()
+        orders['units'] = orders['order_id'].map(units).fillna(0).astype(int)
+
+        by_branch = orders.groupby(['date', 'branch_id'], dropna=False).agg(
+            orders=('order_id', 'count'),
+            units=('units', 'sum'),
+            revenue=('revenue', 'sum'),
+            delivery_fees=('delivery_fees', 'sum'),
+        ).reset_index()
+        branch_rows = [
+            DailyBranchSales(
+                date=row.date, branch_id=_key(row.branch_id), orders=int(row.orders), units=int(row.units),
+                revenue=_amount(row.revenue), delivery_fees=_amount(row.delivery_fees),
+            )
+            for row in by_branch.itertuples(index=False)
+        ]
+
+        if not items.empty:
+            lines = items.merge(orders[['order_id', 'date', 'branch_id']], on='order_id')
+            by_product = lines.groupby(['date', 'branch_id', 'product_id'], dropna=False).agg(
+                category_id=('category_id', 'first'),
+                orders=('order_id', 'nunique'),
+                units=('quantity', 'sum'),
+                revenue=('revenue', 'sum'),
+            ).reset_index()
+            product_rows = [
+                DailyProductSales(
+                    date=row.date, branch_id=_key(row.branch_id), product_id=int(row.product_id),
+                    category_id=_key(row.category_id), orders=int(row.orders), units=int(row.units),
+                    revenue=_amount(row.revenue),
+                )
+                for row in by_product.itertuples(index=False)
+            ]
+
+    with transaction.atomic():
+        DailyBranchSales.objects.filter(date__gte=date_from, date__lte=date_to).delete()
+        DailyProductSales.objects.filter(date__gte=date_from, date__lte=date_to).delete()
+        DailyBranchSales.objects.bulk_create(branch_rows, batch_size=2000)
+        DailyProductSales.objects.bulk_create(product_rows, batch_size=2000)
+        # Payments that succeed later must not be counted a second time
+        paid.filter(sales_recorded_at__isnull=True).update(sales_recorded_at=timezone.now())
+
+    logger.info(
+        f"Rebuilt sales rollups {date_from}..{date_to}: {len(orders)} orders, "
+        f"{len(branch_rows)} branch rows, {len(product_rows)} product rows"
+    )
+    return {'orders': len(orders), 'branch_rows': len(branch_rows), 'product_rows': len(product_rows)}
+
+
+def sales_timeseries(metric, date_from, date_to, group_by=None, interval='day', branch_id=None):
+    """
+    Time series of a sales metric read from the rollup tables.
+    Args:
+        metric: 'revenue', 'orders' or 'units'.
+        date_from, date_to: Inclusive local dates.
+        group_by: None for totals, or 'branch', 'category' or 'product'.
+        interval: 'day', 'week' or 'month'.
+        branch_id: Only this branch.
+    For categories, 'orders' counts order lines: an order with two products of a category counts twice.
+    Returns:
+        List of series dicts: {'key', 'label', 'points': [{'date', 'value'}, ...]}, one per group.
+    """
+    model, key_field, label_field = SALES_GROUPS[group_by]
+    rows = model.objects.filter(date__gte=date_from, date__lte=date_to)
+    if branch_id is not None:
+        rows = rows.filter(branch_id=branch_id)
+    trunc = SALES_INTERVALS[interval]
+    period = trunc('date') if trunc else F('date')
+    fields = [field for field in (key_field, label_field) if field]
+    rows = (
+        rows.annotate(period=period).values('period', *fields)
+        .annotate(value=Sum(metric)).order_by(*fields, 'period')
+    )
+
+    series = {}
+    for row in rows:
+        key = row[key_field] if key_field else None
+        entry = series.setdefault(key, {
+            'key': key,
+            'label': row[label_field] if label_field else 'total',
+            'points': [],
+        })
+        entry['points'].append({'date': row['period'], 'value': row['value']})
+    return list(series.values())
@@ -0,0 +1,49 @@
+import uuid
+from users.models import CustomUser
+
+MIN_SUBSTRING_LENGTH = 3  # Trigram indexes cannot narrow shorter substrings
+MIN_PHONE_DIGITS = 10  # Shorter numbers are order ids
+
+
+def _national_number(digits):
+    # Stored numbers are +2547XXXXXXXX; match local (07...) and international (2547...) input alike
+    if digits.startswith('254'):
+        return digits[3:]
+    if digits.startswith('0'):
+        return digits[1:]
+    return digits
+
+
+def search_orders(queryset, term):
+    """
+    Filter orders by an admin search term, choosing a lookup each input can use an index for:
+    - order id (digits): primary key lookup;
+    - phone number (10+ digits, or digits with a leading +): trigram substring search on the payment phone;
+    - request UUID: the unique request_id index;
+    - anything else: trigram substring search on the customer's username (exact match below 3 characters).
+    Args:
+        queryset: Order queryset to filter.
+        term: Raw search input.
+    Returns:
+        The filtered queryset (unchanged for a blank term).
+    """
+    term = (term or '').strip()
+    if not term:
+        return queryset
+
+    digits = term[1:] if term.startswith('+') else term
+    if digits.isdigit():
+        if term.startswith('+') or len(digits) >= MIN_PHONE_DIGITS:
+            return queryset.filter(payment_phone_number__contains=_national_number(digits))
+        return queryset.filter(id=int(digits))
+
+    try:
+        return queryset.filter(request_id=str(uuid.UUID(term)))
+    except ValueError:
+        pass
+
+    if len(term) < MIN_SUBSTRING_LENGTH:
+        return queryset.filter(customer__username__iexact=term)
+    # Resolved as a subquery so the customer FK index is used instead of a join over every order
+    customers = CustomUser.objects.filter(username__icontains=term).values('id')
+    return queryset.filter(customer_id__in=customers)
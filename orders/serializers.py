@@ -9,9 +9,16 @@ from .models import Branch
 
 from rest_framework import serializers
 from .models import Order, OrderItem, Branch
-from products.serializers import ProductSerializer
+from products.serializers import CategorySerializer, ProductSerializer
 from products.models import Product
 from users.serializers import CustomUserSerializer
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from .models import DeliveryZone, ArchivedOrder
+from .spatial import nearest_serviceable_branches, is_serviceable
+from delivery.slots import is_bookable_slot
+from cloudinary import CloudinaryImage
 
 class BranchSerializer(serializers.ModelSerializer):
     class Meta:
@@ -24,8 +31,55 @@ class BranchSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("A branch with this name already exists.")
         return value
 
+class DeliveryZoneSerializer(serializers.ModelSerializer):
+    branch = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all())
+
+    class Meta:
+        model = DeliveryZone
+        fields = [
+            'id', 'branch', 'name', 'polygon', 'is_active',
+            'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = [
+            'id', 'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude',
+            'created_at', 'updated_at'
+        ]
+
+    def validate_polygon(self, value):
+        if not isinstance(value, list) or len(value) < 3:
+            raise serializers.ValidationError("A zone needs at least 3 [latitude, longitude] vertices.")
+        vertices = []
+        for vertex in value:
+            try:
+                latitude, longitude = float(vertex[0]), float(vertex[1])
+            except (TypeError, ValueError, IndexError, KeyError):
+                raise serializers.ValidationError(f"Invalid vertex {vertex}.")
+            if len(vertex) != 2 or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise serializers.ValidationError(f"Invalid vertex {vertex}.")
+            vertices.append([latitude, longitude])
+        return vertices
+
+def snapshot_product(product_id, name, image, price, category):
+    """
+    The product representation of an order item, built from its checkout snapshot.
+    It has the keys of ProductSerializer (and CategorySerializer for 'category'); 'price' and
+    'discounted_price' are the unit price paid at checkout, and keys the snapshot does not
+    record (description, stock, ...) are None.
+    """
+    price = str(price) if price is not None else None
+    return {
+        **dict.fromkeys(ProductSerializer.Meta.fields),
+        'id': product_id,
+        'name': name,
+        'price': price,
+        'category': {**dict.fromkeys(CategorySerializer.Meta.fields), 'name': category},
+        'image': CloudinaryImage(image).build_url() if image else None,
+        'discounted_price': price,
+    }
+
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+    product = serializers.SerializerMethodField()
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), write_only=True
     )
@@ -34,6 +88,14 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'product', 'product_id', 'quantity', 'price']
 
+    def get_product(self, obj):
+        # Rendered from the checkout snapshot; rows not yet backfilled fall back to the live product
+        if not obj.product_name:
+            return ProductSerializer(obj.product).data
+        return snapshot_product(
+            obj.product_id, obj.product_name, obj.product_image, obj.product_price, obj.product_category
+        )
+
     def validate(self, attrs):
         # Map product_id to product during validation
         if 'product_id' in attrs:
@@ -54,11 +116,11 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = [
-            'id', 'customer', 'total_amount', 'status', 'payment_status',
+            'id', 'customer', 'total_amount', 'delivery_fee', 'status', 'payment_status',
             'payment_phone_number', 'created_at', 'updated_at', 'items',
             'request_id', 'branch', 'branch_id'
         ]
-        read_only_fields = ['total_amount', 'created_at', 'updated_at', 'payment_status', 'request_id']
+        read_only_fields = ['total_amount', 'delivery_fee', 'created_at', 'updated_at', 'payment_status', 'request_id']
 
     def validate_items(self, value):
         if value is not None and not value:
@@ -173,12 +235,91 @@ class CartItemSerializer(serializers.Serializer):
         return value
 
 
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """Renders an archived order in the same shape as OrderSerializer, plus archived_at."""
+    customer = CustomUserSerializer(read_only=True)
+    branch = serializers.StringRelatedField(read_only=True)
+    items = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = [
+            'id', 'customer', 'total_amount', 'delivery_fee', 'status', 'payment_status',
+            'payment_phone_number', 'created_at', 'updated_at', 'items',
+            'request_id', 'branch', 'archived_at'
+        ]
+
+    def get_items(self, obj):
+        return [
+            {
+                'id': item['id'],
+                'product': snapshot_product(
+                    item['product_id'], item['product_name'], item['product_image'],
+                    item['product_price'], item['product_category'],
+                ),
+                'quantity': item['quantity'],
+                'price': item['price'],
+            }
+            for item in obj.items
+        ]
+
+
+class OrderHistorySerializer(serializers.ModelSerializer):
+    """
+    Light order representation for the customer's order history.
+    Expects orders annotated with item_count / item_quantity and with a prefetched
+    preview_items slice (see OrderListView); full detail is on OrderDetailView.
+    """
+    branch = serializers.StringRelatedField(read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+    item_quantity = serializers.IntegerField(read_only=True)
+    thumbnails = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'total_amount', 'delivery_fee', 'status', 'payment_status', 'created_at',
+            'branch', 'item_count', 'item_quantity', 'thumbnails'
+        ]
+
+    def get_thumbnails(self, obj):
+        return [
+            CloudinaryImage(item.product_image).build_url()
+            for item in obj.preview_items if item.product_image
+        ]
+
+
+class ArchivedOrderHistorySerializer(serializers.ModelSerializer):
+    """OrderHistorySerializer's representation of an archived order, computed from its items document."""
+    branch = serializers.StringRelatedField(read_only=True)
+    item_count = serializers.SerializerMethodField()
+    item_quantity = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = OrderHistorySerializer.Meta.fields
+
+    def get_item_count(self, obj):
+        return len(obj.items)
+
+    def get_item_quantity(self, obj):
+        return sum(item['quantity'] for item in obj.items)
+
+    def get_thumbnails(self, obj):
+        return [
+            CloudinaryImage(item['product_image']).build_url()
+            for item in obj.items[:getattr(settings, 'ORDER_HISTORY_THUMBNAILS', 3)] if item['product_image']
+        ]
+
+
 class CheckoutSerializer(serializers.Serializer):
     cart_items = serializers.ListField(child=CartItemSerializer(), min_length=1)
     phone_number = serializers.CharField(max_length=15)
     latitude = serializers.FloatField()
     longitude = serializers.FloatField()
-    branch_id = serializers.IntegerField()  
+    branch_id = serializers.IntegerField(required=False)
+    delivery_slot = serializers.DateTimeField(required=False)  # Start of the chosen delivery window
 
     def validate_phone_number(self, value):
         value = value.strip()
@@ -191,4 +332,91 @@ class CheckoutSerializer(serializers.Serializer):
     def validate_cart_items(self, value):
         if not value:
             raise serializers.ValidationError("Cart cannot be empty.")
-        return value
\ No newline at end of file
+        return value
+
+    def validate_delivery_slot(self, value):
+        if not is_bookable_slot(value):
+            raise serializers.ValidationError("This is not an available delivery slot.")
+        return value
+
+    def validate(self, data):
+        latitude, longitude = data['latitude'], data['longitude']
+        branch_id = data.get('branch_id')
+        if branch_id and is_serviceable(branch_id, latitude, longitude):
+            return data
+        if branch_id and not getattr(settings, 'DELIVERY_ZONE_REROUTE', True):
+            raise serializers.ValidationError({"branch_id": "This branch does not deliver to the selected location."})
+        # Default (or reroute) to the nearest branch that serves the delivery coordinates
+        nearest = nearest_serviceable_branches(latitude, longitude)
+        if not nearest:
+            raise serializers.ValidationError({"branch_id": "No branch serves this delivery location."})
+        data['branch_id'] = nearest[0]['id']
+        return data
+
+
+class NearestBranchQuerySerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90.0, max_value=90.0)
+    longitude = serializers.FloatField(min_value=-180.0, max_value=180.0)
+    limit = serializers.IntegerField(min_value=1, max_value=20, default=1)
+    max_distance_km = serializers.FloatField(min_value=0.0, required=False)
+
+class DeliveryFeeQuerySerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90.0, max_value=90.0)
+    longitude = serializers.FloatField(min_value=-180.0, max_value=180.0)
+    branch_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        branch_id = data.get('branch_id')
+        if branch_id and not is_serviceable(branch_id, data['latitude'], data['longitude']):
+            raise serializers.ValidationError({"branch_id": "This branch does not deliver to the selected location."})
+        return data
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    file_format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    status = serializers.CharField(required=False, help_text='Comma-separated statuses')
+
+    def validate_status(self, value):
+        statuses = [status.strip() for status in value.split(',') if status.strip()]
+        valid = {choice for choice, _ in self.context.get('status_choices', ())}
+        invalid = set(statuses) - valid
+        if invalid:
+            raise serializers.ValidationError(f"Unknown status: {', '.join(sorted(invalid))}.")
+        return statuses
+
+    def validate(self, data):
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError({"date_to": "Must not be before date_from."})
+        return data
+
+
+class SalesAnalyticsQuerySerializer(serializers.Serializer):
+    metric = serializers.ChoiceField(choices=['revenue', 'orders', 'units'], default='revenue')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=['branch', 'category', 'product'], required=False)
+    interval = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+    branch_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        data.setdefault('date_to', timezone.localdate())
+        data.setdefault('date_from', data['date_to'] - timedelta(days=29))
+        if data['date_from'] > data['date_to']:
+            raise serializers.ValidationError({"date_to": "Must not be before date_from."})
+        max_days = getattr(settings, 'SALES_ANALYTICS_MAX_DAYS', 731)
+        if (data['date_to'] - data['date_from']).days >= max_days:
+            raise serializers.ValidationError({"date_from": f"At most {max_days} days per request."})
+        return data
+
+
+class BulkOrderActionSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(child=serializers.IntegerField(), min_length=1)
+    action = serializers.ChoiceField(choices=['ship', 'deliver', 'cancel'])
+
+    def validate_order_ids(self, value):
+        max_batch = getattr(settings, 'ORDER_BULK_MAX', 5000)
+        if len(value) > max_batch:
+            raise serializers.ValidationError(f"At most {max_batch} orders can be updated per request.")
+        return value
@@ -0,0 +1,52 @@
+# orders/signals.py
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from .models import Order, Branch, DeliveryZone
+from .archive import is_archiving
+from .events import publish_order_event
+from .spatial import invalidate_branch_index, zone_index, reevaluate_open_deliveries
+from users.stats import adjust_dashboard_counter
+
+def _status_snapshot(instance):
+    # __dict__ avoids loading deferred fields
+    return (instance.__dict__.get('status'), instance.__dict__.get('payment_status'))
+
+@receiver(post_init, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    instance._status_snapshot = _status_snapshot(instance)
+
+@receiver(post_save, sender=Order)
+def publish_order_status(sender, instance, created, **kwargs):
+    snapshot = _status_snapshot(instance)
+    if created or snapshot != instance._status_snapshot:
+        publish_order_event(
+            instance.id, 'order',
+            status=instance.status,
+            payment_status=instance.payment_status,
+        )
+    instance._status_snapshot = snapshot
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def count_orders(sender, instance, created=False, **kwargs):
+    if is_archiving():
+        return  # Archived orders still count on the dashboard
+    if created or kwargs.get('signal') is post_delete:
+        adjust_dashboard_counter('orders', 1 if created else -1)
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+def rebuild_branch_index(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_branch_index)
+
+@receiver(post_save, sender=DeliveryZone)
+@receiver(post_delete, sender=DeliveryZone)
+def reindex_delivery_zones(sender, instance, **kwargs):
+    branch_id = instance.branch_id
+
+    def _reindex():
+        zone_index.invalidate()
+        reevaluate_open_deliveries(branch_ids=[branch_id])
+
+    transaction.on_commit(_reindex)
@@ -0,0 +1,214 @@
+import abc
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from delivery.geo import KDTree, PolygonGridIndex
+from .models import Branch, DeliveryZone
+
+logger = logging.getLogger(__name__)
+
+BRANCH_INDEX_VERSION_KEY = "branch_index_version"
+ZONE_INDEX_VERSION_KEY = "zone_index_version"
+BRANCH_FIELDS = ('id', 'name', 'address', 'city', 'latitude', 'longitude')
+
+
+class VersionedIndex(abc.ABC):
+    """
+    Process-local index rebuilt from the database when a shared cache version changes.
+    The version is checked at most every BRANCH_INDEX_REFRESH_SECONDS, so
+    lookups normally touch neither the cache nor the database.
+    """
+    version_key = None
+
+    def __init__(self):
+        self._built = False
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh_interval(self):
+        return getattr(settings, 'BRANCH_INDEX_REFRESH_SECONDS', 5)
+
+    def _ensure_current(self):
+        now = time.monotonic()
+        if self._built and now - self._checked_at < self._refresh_interval():
+            return
+        with self._lock:
+            version = cache.get(self.version_key)
+            if not self._built or version != self._version:
+                self._build()
+                self._built = True
+                self._version = version
+                logger.info(f"{type(self).__name__} rebuilt (version {version})")
+            self._checked_at = now
+
+    @abc.abstractmethod
+    def _build(self):
+        """Load the index from the database."""
+
+    def reset(self):
+        """Force a rebuild on the next lookup in this process."""
+        with self._lock:
+            self._built = False
+
+    def invalidate(self):
+        """Bump the shared version so every process rebuilds this index."""
+        cache.add(self.version_key, 0, timeout=None)
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, timeout=None)
+        self.reset()
+
+
+class BranchIndex(VersionedIndex):
+    """KD-tree over active branches with coordinates, for nearest-branch lookups without a table scan."""
+    version_key = BRANCH_INDEX_VERSION_KEY
+
+    def _build(self):
+        self._branches = {
+            row['id']: row
+            for row in Branch.objects.filter(
+                is_active=True, latitude__isnull=False, longitude__isnull=False
+            ).values(*BRANCH_FIELDS)
+        }
+        self._tree = KDTree((row['latitude'], row['longitude'], row['id']) for row in self._branches.values())
+
+    def get(self, branch_id):
+        """Return the indexed branch dict for an id, or None if it is inactive or has no coordinates."""
+        self._ensure_current()
+        return self._branches.get(branch_id)
+
+    def nearest(self, latitude, longitude, limit=1, max_distance_km=None, predicate=None):
+        """
+        Find the nearest branches to a point.
+        Args:
+            latitude, longitude: Customer coordinates.
+            limit: Maximum number of branches to return.
+            max_distance_km: Optional radius; defaults to BRANCH_SERVICE_RADIUS_KM (0 means no limit).
+            predicate: Optional callable(branch_id) -> bool to filter candidates.
+        Returns:
+            List of branch dicts with an added 'distance_km', nearest first.
+        """
+        self._ensure_current()
+        if max_distance_km is None:
+            max_distance_km = getattr(settings, 'BRANCH_SERVICE_RADIUS_KM', 0) or None
+        max_distance_m = max_distance_km * 1000 if max_distance_km else None
+        branches = self._branches
+        return [
+            {**branches[branch_id], 'distance_km': round(distance_m / 1000, 3)}
+            for branch_id, distance_m in self._tree.nearest(
+                latitude, longitude, k=limit, max_distance_m=max_distance_m, predicate=predicate
+            )
+        ]
+
+
+class ZoneIndex(VersionedIndex):
+    """
+    Grid index over active delivery zones of active branches.
+    A branch without any active zone is treated as unrestricted.
+    """
+    version_key = ZONE_INDEX_VERSION_KEY
+
+    def _build(self):
+        zones = DeliveryZone.objects.filter(is_active=True, branch__is_active=True).values_list(
+            'id', 'branch_id', 'polygon'
+        )
+        self._zone_branch = {}
+        polygons = []
+        for zone_id, branch_id, polygon in zones:
+            self._zone_branch[zone_id] = branch_id
+            polygons.append((zone_id, polygon))
+        self._grid = PolygonGridIndex(
+            polygons, cell_size=getattr(settings, 'DELIVERY_ZONE_GRID_DEGREES', 0.01)
+        )
+        self.zoned_branches = frozenset(self._zone_branch.values())
+
+    def zones_at(self, latitude, longitude):
+        """Return ids of active zones containing the point."""
+        self._ensure_current()
+        return self._grid.lookup(latitude, longitude)
+
+    def branches_serving(self, latitude, longitude):
+        """Return ids of branches with a zone containing the point."""
+        return {self._zone_branch[zone_id] for zone_id in self.zones_at(latitude, longitude)}
+
+    def serviceability(self, latitude, longitude):
+        """Return a callable(branch_id) -> bool telling whether that branch can deliver to the point."""
+        serving = self.branches_serving(latitude, longitude)
+        zoned = self.zoned_branches
+        return lambda branch_id: branch_id in serving or branch_id not in zoned
+
+
+branch_index = BranchIndex()
+zone_index = ZoneIndex()
+
+
+def invalidate_branch_index():
+    branch_index.invalidate()
+    # Zones of deactivated branches drop out of the zone index too
+    zone_index.invalidate()
+
+
+def nearest_serviceable_branches(latitude, longitude, limit=1, max_distance_km=None):
+    """Nearest active branches whose delivery zones (if any) contain the point."""
+    return branch_index.nearest(
+        latitude,
+        longitude,
+        limit=limit,
+        max_distance_km=max_distance_km,
+        predicate=zone_index.serviceability(latitude, longitude),
+    )
+
+
+def is_serviceable(branch_id, latitude, longitude):
+    """Whether the branch can deliver to the point."""
+    return zone_index.serviceability(latitude, longitude)(branch_id)
+
+
+def reevaluate_open_deliveries(branch_ids=None, batch_size=2000):
+    """
+    Re-check pending deliveries against the current zones in bulk.
+    Deliveries that fell outside their branch's zones are moved to the nearest
+    serviceable branch with one UPDATE per target branch; the rest are reported.
+    Args:
+        branch_ids: Only re-check orders of these branches (all branches if None).
+    Returns:
+        Dict with 'checked', 'rerouted' and 'unserviceable' (list of delivery ids).
+    """
+    from delivery.models import Delivery  # delivery depends on orders; import lazily
+    from .models import Order
+
+    deliveries = Delivery.objects.filter(
+        status='pending', latitude__isnull=False, longitude__isnull=False, order__branch__isnull=False
+    )
+    if branch_ids is not None:
+        deliveries = deliveries.filter(order__branch_id__in=branch_ids)
+
+    checked = 0
+    moves = {}
+    unserviceable = []
+    rows = deliveries.values_list('id', 'order_id', 'order__branch_id', 'latitude', 'longitude')
+    for delivery_id, order_id, branch_id, latitude, longitude in rows.iterator(chunk_size=batch_size):
+        checked += 1
+        if is_serviceable(branch_id, latitude, longitude):
+            continue
+        nearest = nearest_serviceable_branches(latitude, longitude)
+        if nearest:
+            moves.setdefault(nearest[0]['id'], []).append(order_id)
+        else:
+            unserviceable.append(delivery_id)
+
+    rerouted = 0
+    for target_branch_id, order_ids in moves.items():
+        for start in range(0, len(order_ids), batch_size):
+            rerouted += Order.objects.filter(id__in=order_ids[start:start + batch_size]).update(
+                branch_id=target_branch_id
+            )
+
+    if unserviceable:
+        logger.warning(f"{len(unserviceable)} pending deliveries are outside every delivery zone: {unserviceable[:50]}")
+    logger.info(f"Zone re-evaluation checked {checked} deliveries, rerouted {rerouted}")
+    return {'checked': checked, 'rerouted': rerouted, 'unserviceable': unserviceable}
@@ -1,3 +1,967 @@
-from django.test import TestCase
+import csv
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.admin.sites import AdminSite
+from django.test import RequestFactory, TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from users.models import CustomUser
+from orders.models import (
+    Order, OrderItem, Branch, DeliveryZone, DailyBranchSales, DailyProductSales, ArchivedOrder, IdempotencyKey,
+)
+from orders.events import get_order_events, make_stream_token
+from orders.serializers import CheckoutSerializer, OrderSerializer
+from orders.spatial import branch_index, zone_index
+from orders.fees import quote_delivery_fee, fee_for_distance
+from orders.rollups import rebuild_sales_rollups
+from orders.archive import archive_closed_orders
+from users.stats import dashboard_stats
+from orders.expiry import expire_pending_orders
+from orders.transitions import reserve_stock
+from delivery.analytics import sla_percentiles
+from delivery.models import Delivery, DeliveryEvent, DeliverySLA
+from delivery.slots import slot_availability, upcoming_slots
+from payment.admin import PaymentAdmin
+from payment.models import Payment
+from products.models import Category, Product
+from products.serializers import ProductSerializer
 
-# Create your tests here.
+
+class OrderEventStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.customer = CustomUser.objects.create_user(
+            username='customer1',
+            password='pass123',
+            email='customer1@example.com',
+            role='customer'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order = Order.objects.create(
+                customer=self.customer, total_amount=100.00, status='pending', payment_status='pending'
+            )
+            self.payment = Payment.objects.create(
+                order=self.order, amount=100.00, phone_number='+254712345678', status='pending'
+            )
+
+    def test_status_changes_publish_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payment.status = 'successful'
+            self.payment.save()
+            self.payment.sync_order_status()
+        events = get_order_events(self.order.id)
+        self.assertEqual([event['type'] for event in events], ['order', 'payment', 'payment', 'order'])
+        self.assertEqual(events[-1]['status'], 'processing')
+        self.assertEqual(events[-1]['payment_status'], 'paid')
+        self.assertEqual(get_order_events(self.order.id, after=events[-1]['id']), [])
+
+    def test_unchanged_save_publishes_nothing(self):
+        before = get_order_events(self.order.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.save()
+        self.assertEqual(get_order_events(self.order.id), before)
+
+    def test_stream_starts_with_snapshot(self):
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.get(
+            reverse('order-events', args=[self.order.id]), HTTP_ACCEPT='text/event-stream'
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('event: snapshot', body)
+        self.assertIn('"payment":"pending"', body)
+
+    def test_resumed_stream_returns_new_events(self):
+        self.client.force_authenticate(user=self.customer)
+        last_event_id = get_order_events(self.order.id)[-1]['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.payment.status = 'successful'
+            self.payment.save()
+        response = self.client.get(
+            reverse('order-events', args=[self.order.id]),
+            HTTP_ACCEPT='text/event-stream', HTTP_LAST_EVENT_ID=str(last_event_id),
+        )
+        body = response.content.decode()
+        self.assertNotIn('event: snapshot', body)
+        self.assertIn('"status":"successful"', body)
+
+    @override_settings(ORDER_EVENTS_POLL_SECONDS=3)
+    def test_resumed_stream_returns_at_once_without_events(self):
+        self.client.force_authenticate(user=self.customer)
+        last_event_id = get_order_events(self.order.id)[-1]['id']
+        response = self.client.get(
+            reverse('order-events', args=[self.order.id]),
+            HTTP_ACCEPT='text/event-stream', HTTP_LAST_EVENT_ID=str(last_event_id),
+        )
+        self.assertEqual(response.content.decode(), 'retry: 3000\n\n')
+
+    def test_stream_requires_order_owner(self):
+        other = CustomUser.objects.create_user(
+            username='customer2',
+            password='pass123',
+            email='customer2@example.com',
+            role='customer'
+        )
+        self.client.force_authenticate(user=other)
+        response = self.client.get(reverse('order-events', args=[self.order.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_token_authenticates_eventsource(self):
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.post(reverse('order-events-token', args=[self.order.id]))
+        self.assertEqual(response.status_code, 200)
+        token = response.data['token']
+
+        # An EventSource sends no Authorization header, only the query string
+        eventsource = APIClient()
+        response = eventsource.get(
+            reverse('order-events', args=[self.order.id]), {'token': token}, HTTP_ACCEPT='text/event-stream'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('event: snapshot', response.content.decode())
+
+    def test_stream_token_is_bound_to_its_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            other_order = Order.objects.create(
+                customer=self.customer, total_amount=50.00, status='pending', payment_status='pending'
+            )
+        token = make_stream_token(self.customer.id, other_order.id)
+        response = APIClient().get(reverse('order-events', args=[self.order.id]), {'token': token})
+        self.assertEqual(response.status_code, 403)
+
+    def test_tampered_or_expired_stream_token_is_rejected(self):
+        token = make_stream_token(self.customer.id, self.order.id)
+        response = APIClient().get(reverse('order-events', args=[self.order.id]), {'token': token[:-2] + 'xx'})
+        self.assertEqual(response.status_code, 401)
+        with override_settings(ORDER_EVENTS_TOKEN_SECONDS=-1):
+            response = APIClient().get(reverse('order-events', args=[self.order.id]), {'token': token})
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_token_requires_order_owner(self):
+        other = CustomUser.objects.create_user(
+            username='customer3',
+            password='pass123',
+            email='customer3@example.com',
+            role='customer'
+        )
+        self.client.force_authenticate(user=other)
+        response = self.client.post(reverse('order-events-token', args=[self.order.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class NearestBranchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        branch_index.reset()
+        zone_index.reset()
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cbd = Branch.objects.create(name='CBD', latitude=-1.2864, longitude=36.8172)
+            self.westlands = Branch.objects.create(name='Westlands', latitude=-1.2676, longitude=36.8108)
+            self.karen = Branch.objects.create(name='Karen', latitude=-1.3190, longitude=36.7073)
+            Branch.objects.create(name='Closed', latitude=-1.2700, longitude=36.8100, is_active=False)
+
+    def test_nearest_branches_ordered_by_distance(self):
+        response = self.client.get(
+            reverse('branch-nearest'), {'latitude': -1.2650, 'longitude': 36.8050, 'limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([b['id'] for b in response.data['results']], [self.westlands.id, self.cbd.id])
+        self.assertLess(response.data['results'][0]['distance_km'], response.data['results'][1]['distance_km'])
+
+    def test_index_rebuilds_after_branch_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.westlands.is_active = False
+            self.westlands.save()
+        nearest = branch_index.nearest(-1.2650, 36.8050)
+        self.assertEqual(nearest[0]['id'], self.cbd.id)
+
+    def test_checkout_fills_nearest_branch(self):
+        category = Category.objects.create(name='Tools')
+        product = Product.objects.create(name='Hammer', price=500, stock=10, category=category)
+        serializer = CheckoutSerializer(data={
+            'cart_items': [{'product': {'id': product.id, 'price': '500.00'}, 'quantity': 1}],
+            'phone_number': '254712345678',
+            'latitude': -1.3200,
+            'longitude': 36.7100,
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['branch_id'], self.karen.id)
+
+
+class DeliveryZoneTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        branch_index.reset()
+        zone_index.reset()
+        self.customer = CustomUser.objects.create_user(
+            username='customer1',
+            password='pass123',
+            email='customer1@example.com',
+            role='customer'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cbd = Branch.objects.create(name='CBD', latitude=-1.2864, longitude=36.8172)
+            self.karen = Branch.objects.create(name='Karen', latitude=-1.3190, longitude=36.7073)
+            DeliveryZone.objects.create(
+                branch=self.cbd, name='CBD core',
+                polygon=[[-1.30, 36.80], [-1.30, 36.84], [-1.27, 36.84], [-1.27, 36.80]]
+            )
+
+    def test_zone_lookup(self):
+        self.assertTrue(zone_index.zones_at(-1.285, 36.82))
+        self.assertFalse(zone_index.zones_at(-1.32, 36.71))
+
+    def test_checkout_reroutes_out_of_zone_branch(self):
+        category = Category.objects.create(name='Tools')
+        product = Product.objects.create(name='Hammer', price=500, stock=10, category=category)
+        serializer = CheckoutSerializer(data={
+            'cart_items': [{'product': {'id': product.id, 'price': '500.00'}, 'quantity': 1}],
+            'phone_number': '254712345678',
+            'latitude': -1.2600,
+            'longitude': 36.8000,
+            'branch_id': self.cbd.id,
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['branch_id'], self.karen.id)
+
+    def test_zone_change_reroutes_pending_deliveries(self):
+        order = Order.objects.create(customer=self.customer, total_amount=100.00, branch=self.cbd)
+        Delivery.objects.create(order=order, delivery_address='Kenyatta Avenue', latitude=-1.2900, longitude=36.8100)
+        zone = self.cbd.zones.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            zone.polygon = [[-1.30, 36.82], [-1.30, 36.84], [-1.27, 36.84], [-1.27, 36.82]]
+            zone.save()
+        order.refresh_from_db()
+        self.assertEqual(order.branch_id, self.karen.id)
+
+
+@override_settings(DELIVERY_FEE_TIERS=((3, 100), (7, 200), (None, 500)))
+class DeliveryFeeQuoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        branch_index.reset()
+        zone_index.reset()
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cbd = Branch.objects.create(name='CBD', latitude=-1.2864, longitude=36.8172)
+            self.karen = Branch.objects.create(name='Karen', latitude=-1.3190, longitude=36.7073)
+
+    def test_fee_for_distance(self):
+        tiers = ((3, 100), (7, 200))
+        self.assertEqual(fee_for_distance(2.5, tiers), (Decimal('100.00'), 0))
+        self.assertEqual(fee_for_distance(3.1, tiers), (Decimal('200.00'), 1))
+        self.assertIsNone(fee_for_distance(7.5, tiers))
+
+    def test_quote_from_nearest_branch(self):
+        quote = quote_delivery_fee(-1.2870, 36.8180)
+        self.assertEqual(quote['branch_id'], self.cbd.id)
+        self.assertEqual(quote['fee'], Decimal('100.00'))
+        self.assertLess(quote['distance_km'], 3)
+
+    def test_quote_from_given_branch(self):
+        quote = quote_delivery_fee(-1.2870, 36.8180, branch_id=self.karen.id)
+        self.assertEqual(quote['branch_id'], self.karen.id)
+        self.assertEqual(quote['fee'], Decimal('500.00'))
+
+    def test_quote_is_memoized_per_cell(self):
+        first = quote_delivery_fee(-1.28701, 36.81801)
+        with self.assertNumQueries(0), patch('orders.fees.build_distance_matrix') as matrix:
+            second = quote_delivery_fee(-1.28704, 36.81798)
+        matrix.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_branch_without_coordinates_gets_last_tier(self):
+        westlands = Branch.objects.create(name='Westlands')
+        quote = quote_delivery_fee(-1.2870, 36.8180, branch_id=westlands.id)
+        self.assertEqual((quote['branch_id'], quote['fee'], quote['tier']), (westlands.id, Decimal('500.00'), 2))
+        self.assertIsNone(quote['distance_km'])
+        Branch.objects.filter(id=westlands.id).update(is_active=False)
+        self.assertIsNone(quote_delivery_fee(-1.2870, 36.8180, branch_id=westlands.id))
+
+    def test_beyond_last_tier_is_not_quoted(self):
+        with self.settings(DELIVERY_FEE_TIERS=((1, 100),)):
+            self.assertIsNone(quote_delivery_fee(-1.2700, 36.8000, branch_id=self.cbd.id))
+
+    def test_quote_endpoint(self):
+        response = self.client.get(reverse('delivery-fee-quote'), {'latitude': -1.2870, 'longitude': 36.8180})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['branch_id'], self.cbd.id)
+        self.assertEqual(Decimal(response.data['fee']), Decimal('100.00'))
+
+        response = self.client.get(reverse('delivery-fee-quote'), {'latitude': 120, 'longitude': 36.8180})
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderHistoryQueryTests(TestCase):
+    def setUp(self):
+        self.customer = CustomUser.objects.create_user(
+            username='customer3', password='pass123', email='customer3@example.com', role='customer'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.branch = Branch.objects.create(name='CBD', latitude=-1.2864, longitude=36.8172)
+        category = Category.objects.create(name='Tools')
+        self.products = [
+            Product.objects.create(name=f'Tool {i}', price=100, stock=10, category=category, image=f'tool_{i}')
+            for i in range(5)
+        ]
+
+    def _order(self, items):
+        order = Order.objects.create(customer=self.customer, branch=self.branch, total_amount=100)
+        for product in self.products[:items]:
+            OrderItem.objects.create(order=order, product=product, quantity=2, price=product.price)
+        return order
+
+    def test_list_costs_constant_queries(self):
+        self._order(5)
+        # count, page of live and archived ids, orders with item counts, preview items
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.status_code, 200)
+        first = response.data['results'][0]
+        self.assertEqual((first['item_count'], first['item_quantity']), (5, 10))
+        self.assertEqual(len(first['thumbnails']), 3)
+        self.assertNotIn('items', first)
+
+        for items in (1, 2, 3, 4, 5, 1, 2):
+            self._order(items)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('order-list'))
+        self.assertEqual(len(response.data['results']), 8)
+        self.assertEqual(len(response.data['results'][0]['thumbnails']), 2)
+
+    def test_detail_costs_constant_queries(self):
+        order = self._order(5)
+        with self.assertNumQueries(2):  # order with customer and branch, items with products and categories
+            response = self.client.get(reverse('order-detail', args=[order.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['items']), 5)
+        self.assertEqual(response.data['items'][0]['product']['category']['name'], 'Tools')
+
+
+class OrderItemSnapshotTests(TestCase):
+    def setUp(self):
+        self.customer = CustomUser.objects.create_user(
+            username='customer4', password='pass123', email='customer4@example.com', role='customer'
+        )
+        category = Category.objects.create(name='Tools')
+        self.product = Product.objects.create(
+            name='Hammer', price=500, stock=10, category=category, image='hammer', discount_percentage=10
+        )
+        self.order = Order.objects.create(customer=self.customer, total_amount=450)
+
+    def test_snapshot_is_captured_and_kept(self):
+        item = OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=450)
+        self.assertEqual(
+            (item.product_name, item.product_image, item.product_category, item.product_price),
+            ('Hammer', 'hammer', 'Tools', Decimal('450.00')),
+        )
+        Product.objects.filter(id=self.product.id).update(name='Claw Hammer', price=900)
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        response = client.get(reverse('order-detail', args=[self.order.id]))
+        product = response.data['items'][0]['product']
+        self.assertEqual((product['name'], product['discounted_price']), ('Hammer', '450.00'))
+
+    def test_snapshot_keeps_product_response_shape(self):
+        item = OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=450)
+        live = ProductSerializer(self.product).data
+        snapshot = OrderSerializer(self.order).data['items'][0]['product']
+        self.assertEqual(list(snapshot), list(live))
+        self.assertEqual(list(snapshot['category']), list(live['category']))
+        self.assertEqual((snapshot['price'], snapshot['stock']), ('450.00', None))
+        OrderItem.objects.filter(id=item.id).update(product_name='')  # Not backfilled: the live product
+        self.assertEqual(OrderSerializer(self.order).data['items'][0]['product'], live)
+
+    def test_backfill_command(self):
+        item = OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=450)
+        OrderItem.objects.filter(id=item.id).update(product_name='', product_category='', product_price=None)
+        call_command('backfill_order_item_snapshots', batch_size=1, stdout=StringIO())
+        item.refresh_from_db()
+        self.assertEqual((item.product_name, item.product_category), ('Hammer', 'Tools'))
+
+
+class AdminOrderSearchTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(
+            username='admin1', password='pass123', email='admin1@example.com', role='admin'
+        )
+        self.alice = CustomUser.objects.create_user(
+            username='alice.wanjiru', password='pass123', email='alice@example.com', role='customer'
+        )
+        self.bob = CustomUser.objects.create_user(
+            username='bob', password='pass123', email='bob@example.com', role='customer'
+        )
+        self.alice_order = Order.objects.create(
+            customer=self.alice, total_amount=100, payment_phone_number='+254712345678'
+        )
+        self.bob_order = Order.objects.create(
+            customer=self.bob, total_amount=200, payment_phone_number='+254798765432'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _search(self, term):
+        response = self.client.get(reverse('admin-orders-list'), {'search': term})
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        return [order['id'] for order in results]
+
+    def test_numeric_term_is_an_id_lookup(self):
+        self.assertEqual(self._search(str(self.bob_order.id)), [self.bob_order.id])
+
+    def test_phone_numbers_in_any_format(self):
+        for term in ('0712345678', '254712345678', '+254712345678', '+345678'):
+            self.assertEqual(self._search(term), [self.alice_order.id], term)
+
+    def test_request_uuid(self):
+        self.assertEqual(self._search(self.bob_order.request_id), [self.bob_order.id])
+
+    def test_username_substring(self):
+        self.assertEqual(self._search('WANJ'), [self.alice_order.id])
+        self.assertEqual(self._search('bob'), [self.bob_order.id])
+        self.assertEqual(self._search('bo'), [])
+
+
+class AdminExportTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(
+            username='admin2', password='pass123', email='admin2@example.com', role='admin'
+        )
+        self.customer = CustomUser.objects.create_user(
+            username='customer5', password='pass123', email='customer5@example.com', role='customer'
+        )
+        self.branch = Branch.objects.create(name='CBD', latitude=-1.2864, longitude=36.8172)
+        self.orders = [
+            Order.objects.create(customer=self.customer, branch=self.branch, total_amount=100 * (i + 1), status=status)
+            for i, status in enumerate(['pending', 'processing', 'processing'])
+        ]
+        Order.objects.filter(id=self.orders[0].id).update(created_at=timezone.now() - timedelta(days=40))
+        Payment.objects.create(order=self.orders[1], amount=200, phone_number='+254712345678', status='successful')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _body(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_orders_csv_with_filters(self):
+        response = self.client.get(reverse('admin-orders-export'), {
+            'status': 'processing,pending',
+            'date_from': (timezone.localdate() - timedelta(days=7)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(StringIO(self._body(response))))
+        self.assertEqual(rows[0][:5], ['id', 'created_at', 'status', 'payment_status', 'customer'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], [self.orders[1].id, self.orders[2].id])
+        self.assertEqual(rows[1][7], 'CBD')
+
+    def test_payments_ndjson(self):
+        response = self.client.get(reverse('admin-payments-export'), {'file_format': 'ndjson', 'status': 'successful'})
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in self._body(response).splitlines()]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual((lines[0]['order_id'], lines[0]['amount'], lines[0]['order_status']),
+                         (self.orders[1].id, '200.00', 'processing'))
+
+    def test_deliveries_export_streams_empty_body(self):
+        response = self.client.get(reverse('delivery-admin-export'))
+        self.assertEqual(self._body(response).splitlines()[0].split(',')[:2], ['id', 'order_id'])
+
+    def test_invalid_status_and_permissions(self):
+        response = self.client.get(reverse('admin-orders-export'), {'status': 'lost'})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get(reverse('admin-orders-export')).status_code, 403)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(
+            username='admin3', password='pass123', email='admin3@example.com', role='admin'
+        )
+        self.customer = CustomUser.objects.create_user(
+            username='customer6', password='pass123', email='customer6@example.com', role='customer'
+        )
+        self.branch = Branch.objects.create(name='CBD', latitude=-1.2864, longitude=36.8172)
+        self.tools = Category.objects.create(name='Tools')
+        self.paint = Category.objects.create(name='Paint')
+        self.hammer = Product.objects.create(name='Hammer', price=500, stock=10, category=self.tools)
+        self.brush = Product.objects.create(name='Brush', price=150, stock=10, category=self.paint)
+        self.orders = [
+            self._order([(self.hammer, 2), (self.brush, 1)], delivery_fee=100),
+            self._order([(self.hammer, 1)], delivery_fee=0),
+        ]
+
+    def _order(self, lines, delivery_fee):
+        order = Order.objects.create(
+            customer=self.customer, branch=self.branch, total_amount=0, delivery_fee=delivery_fee
+        )
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        order.recalculate_total()
+        return order
+
+    def _pay(self, order):
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = Payment.objects.create(
+                order=order, amount=order.total_amount, phone_number='+254712345678', status='pending'
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.status = 'successful'
+            payment.save()
+        return payment
+
+    def _snapshot(self):
+        return (
+            list(DailyBranchSales.objects.values_list('date', 'branch_id', 'orders', 'units', 'revenue', 'delivery_fees')),
+            sorted(DailyProductSales.objects.values_list('product_id', 'category_id', 'orders', 'units', 'revenue')),
+        )
+
+    def test_successful_payment_is_counted_once(self):
+        payment = self._pay(self.orders[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.save()  # Repeated callback
+        self._pay(self.orders[1])
+
+        branch_rows, product_rows = self._snapshot()
+        self.assertEqual(branch_rows, [
+            (timezone.localdate(), self.branch.id, 2, 4, Decimal('1750.00'), Decimal('100.00')),
+        ])
+        self.assertEqual(product_rows, sorted([
+            (self.hammer.id, self.tools.id, 2, 3, Decimal('1500.00')),
+            (self.brush.id, self.paint.id, 1, 1, Decimal('150.00')),
+        ]))
+
+    def test_admin_mark_as_successful_records_sales(self):
+        payments = [
+            Payment.objects.create(order=order, amount=order.total_amount, phone_number='+254712345678', status='pending')
+            for order in self.orders
+        ]
+        request = RequestFactory().post('/')
+        request.user = self.admin
+        admin = PaymentAdmin(Payment, AdminSite())
+        with patch.object(admin, 'message_user'), self.captureOnCommitCallbacks(execute=True):
+            admin.mark_as_successful(request, Payment.objects.filter(id__in=[payment.id for payment in payments]))
+
+        branch_rows, _ = self._snapshot()
+        self.assertEqual(branch_rows, [
+            (timezone.localdate(), self.branch.id, 2, 4, Decimal('1750.00'), Decimal('100.00')),
+        ])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for order in self.orders:
+            self._pay(order)
+        incremental = self._snapshot()
+
+        DailyBranchSales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        result = rebuild_sales_rollups(timezone.localdate(), timezone.localdate())
+
+        self.assertEqual(result, {'orders': 2, 'branch_rows': 1, 'product_rows': 2})
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_analytics_by_category(self):
+        for order in self.orders:
+            self._pay(order)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        with self.assertNumQueries(1):
+            response = client.get(reverse('admin-sales-analytics'), {'metric': 'units', 'group_by': 'category'})
+        self.assertEqual(response.status_code, 200)
+        series = {entry['label']: entry['points'] for entry in response.data['series']}
+        self.assertEqual(series, {
+            'Tools': [{'date': timezone.localdate(), 'value': 3}],
+            'Paint': [{'date': timezone.localdate(), 'value': 1}],
+        })
+
+    def test_analytics_requires_admin(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        self.assertEqual(client.get(reverse('admin-sales-analytics')).status_code, 403)
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = CustomUser.objects.create_user(
+            username='customer7', password='pass123', email='customer7@example.com', role='customer'
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='admin4', password='pass123', email='admin4@example.com', role='admin'
+        )
+        self.branch = Branch.objects.create(name='CBD', latitude=-1.2864, longitude=36.8172)
+        category = Category.objects.create(name='Tools')
+        self.product = Product.objects.create(name='Hammer', price=500, stock=10, category=category)
+        self.old = self._order('delivered', days_ago=400)
+        self.recent = self._order('delivered', days_ago=10)
+        self.open = self._order('processing', days_ago=400)
+
+    def _order(self, order_status, days_ago):
+        order = Order.objects.create(
+            customer=self.customer, branch=self.branch, total_amount=1000, status=order_status, payment_status='paid'
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, price=500)
+        Payment.objects.create(order=order, amount=1000, phone_number='+254712345678', status='successful')
+        delivery_status = 'delivered' if order_status == 'delivered' else 'pending'
+        delivery = Delivery.objects.create(order=order, delivery_address='Moi Avenue', status=delivery_status)
+        DeliveryEvent.objects.create(delivery=delivery, to_status=delivery_status)
+        Order.objects.filter(id=order.id).update(updated_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def test_archives_only_old_closed_orders(self):
+        self.assertEqual(archive_closed_orders(batch_size=1), 1)
+
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {self.recent.id, self.open.id})
+        self.assertFalse(OrderItem.objects.filter(order_id=self.old.id).exists())
+        self.assertFalse(Delivery.objects.filter(order_id=self.old.id).exists())
+        archived = ArchivedOrder.objects.get(id=self.old.id)
+        self.assertEqual(archived.request_id, self.old.request_id)
+        self.assertEqual(archived.items[0]['product_name'], 'Hammer')
+        self.assertEqual(archived.payment['status'], 'successful')
+        self.assertEqual(archived.delivery['events'][0]['to_status'], 'delivered')
+
+    def test_read_apis_fall_back_to_archive(self):
+        expected = OrderSerializer(
+            Order.objects.select_related('customer', 'branch').prefetch_related('items').get(id=self.old.id)
+        ).data
+        archive_closed_orders()
+        client = APIClient()
+
+        client.force_authenticate(self.customer)
+        response = client.get(reverse('order-detail', args=[self.old.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data.pop('archived_at'))
+        self.assertEqual(json.loads(json.dumps(response.data, cls=DjangoJSONEncoder)),
+                         json.loads(json.dumps(expected, cls=DjangoJSONEncoder)))
+        self.assertEqual(client.get(reverse('order-detail', args=[999999])).status_code, 404)
+        tracking = client.get(reverse('delivery-track', args=[self.old.id]))
+        self.assertEqual((tracking.status_code, tracking.data['status']), (200, 'delivered'))
+
+        client.force_authenticate(self.admin)
+        response = client.get(reverse('admin-orders-detail', args=[self.old.id]))
+        self.assertEqual((response.status_code, response.data['id']), (200, self.old.id))
+
+
+    def test_history_and_exports_include_archive(self):
+        archive_closed_orders()
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        response = client.get(reverse('order-list'))
+        self.assertEqual(response.data['count'], 3)
+        archived = next(order for order in response.data['results'] if order['id'] == self.old.id)
+        self.assertEqual((archived['item_count'], archived['item_quantity'], archived['branch']), (1, 2, 'CBD'))
+
+        client.force_authenticate(self.admin)
+        orders = list(csv.DictReader(StringIO(b''.join(client.get(reverse('admin-orders-export')).streaming_content).decode())))
+        self.assertEqual([int(row['id']) for row in orders], [self.old.id, self.recent.id, self.open.id])
+        payments = [
+            json.loads(line) for line in b''.join(
+                client.get(reverse('admin-payments-export'), {'file_format': 'ndjson'}).streaming_content
+            ).decode().splitlines()
+        ]
+        self.assertEqual(len(payments), 3)
+        self.assertEqual(
+            (payments[0]['order_id'], payments[0]['amount'], payments[0]['order_status']), (self.old.id, '1000.00', 'delivered')
+        )
+        deliveries = b''.join(
+            client.get(reverse('delivery-admin-export'), {'status': 'pending'}).streaming_content
+        ).decode().splitlines()
+        self.assertEqual(len(deliveries), 2)  # Header and the open order's delivery
+
+    def test_archival_leaves_live_counters_alone(self):
+        Delivery.objects.filter(order=self.old).update(slot_start=timezone.now() - timedelta(days=400))
+        orders_before = dashboard_stats()['orders']
+        with patch('delivery.signals.release_slot') as release, self.captureOnCommitCallbacks(execute=True):
+            archive_closed_orders()
+        release.assert_not_called()
+        self.assertEqual(dashboard_stats()['orders'], orders_before)
+
+    def test_sla_facts_outlive_archived_delivery(self):
+        recorded = sla_percentiles('total_seconds')[0]['count']
+        self.assertEqual(recorded, 2)  # Recorded by the 'delivered' events of the delivered orders
+        archive_closed_orders()
+        self.assertEqual(sla_percentiles('total_seconds')[0]['count'], recorded)
+        self.assertEqual(DeliverySLA.objects.filter(delivery__isnull=True).count(), 1)
+
+
+class BulkOrderActionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_user(
+            username='admin5', password='pass123', email='admin5@example.com', role='admin'
+        )
+        self.customer = CustomUser.objects.create_user(
+            username='customer8', password='pass123', email='customer8@example.com', role='customer'
+        )
+        category = Category.objects.create(name='Tools')
+        self.hammer = Product.objects.create(name='Hammer', price=500, stock=10, category=category)
+        self.nails = Product.objects.create(name='Nails', price=50, stock=100, category=category)
+        self.orders = [self._order(status) for status in ('pending', 'pending', 'processing', 'delivered')]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _order(self, order_status):
+        order = Order.objects.create(
+            customer=self.customer, total_amount=600, status=order_status, payment_status='pending'
+        )
+        OrderItem.objects.create(order=order, product=self.hammer, quantity=1, price=500)
+        OrderItem.objects.create(order=order, product=self.nails, quantity=2, price=50)
+        Payment.objects.create(order=order, amount=600, phone_number='+254712345678', status='pending')
+        Delivery.objects.create(order=order, delivery_address='Moi Avenue')
+        return order
+
+    def test_cancel_restocks_in_one_transaction(self):
+        ids = [order.id for order in self.orders] + [999999]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin-orders-bulk'), {'order_ids': ids, 'action': 'cancel'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['restocked']), (3, 9))
+        self.assertEqual([result['ok'] for result in response.data['results']], [True, True, True, False, False])
+        self.assertEqual(response.data['results'][3]['error'], 'Cannot transition from delivered to cancelled')
+        self.hammer.refresh_from_db()
+        self.nails.refresh_from_db()
+        self.assertEqual((self.hammer.stock, self.nails.stock), (13, 106))
+        cancelled = Order.objects.filter(status='cancelled')
+        self.assertEqual(cancelled.count(), 3)
+        self.assertEqual(set(cancelled.values_list('payment_status', flat=True)), {'unpaid'})
+        self.assertEqual(Payment.objects.filter(status='cancelled').count(), 3)
+        self.assertEqual(Delivery.objects.filter(status='cancelled').count(), 3)
+
+    def test_ship_validates_transitions(self):
+        response = self.client.post(
+            reverse('admin-orders-bulk'), {'order_ids': [self.orders[0].id, self.orders[2].id], 'action': 'ship'},
+            format='json',
+        )
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(Order.objects.get(id=self.orders[2].id).status, 'shipped')
+        self.assertEqual(Order.objects.get(id=self.orders[0].id).status, 'pending')
+        self.hammer.refresh_from_db()
+        self.assertEqual(self.hammer.stock, 10)
+
+    def test_cancel_refuses_paid_orders(self):
+        Order.objects.filter(id=self.orders[2].id).update(payment_status='paid')
+        response = self.client.post(
+            reverse('admin-orders-bulk'), {'order_ids': [self.orders[2].id], 'action': 'cancel'}, format='json'
+        )
+        self.assertEqual(response.data['updated'], 0)
+        self.assertEqual(response.data['results'][0]['error'], 'Paid orders must be refunded before cancelling')
+        self.assertEqual(Order.objects.get(id=self.orders[2].id).status, 'processing')
+        self.hammer.refresh_from_db()
+        self.assertEqual(self.hammer.stock, 10)
+
+    def test_deliver_moves_in_transit_deliveries(self):
+        shipped = self._order('shipped')
+        Delivery.objects.filter(order=shipped).update(status='in_transit')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('admin-orders-bulk'), {'order_ids': [shipped.id, self.orders[2].id], 'action': 'deliver'},
+                format='json',
+            )
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['results'][1]['error'], 'Delivery is pending, not in transit')
+        delivery = Delivery.objects.get(order=shipped)
+        self.assertEqual(delivery.status, 'delivered')
+        self.assertIsNotNone(delivery.actual_delivery_time)
+        self.assertEqual(Order.objects.get(id=shipped.id).status, 'delivered')
+        self.assertEqual(Order.objects.get(id=self.orders[2].id).status, 'processing')
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(
+            reverse('admin-orders-bulk'), {'order_ids': [self.orders[0].id], 'action': 'cancel'}, format='json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class PendingOrderExpiryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = CustomUser.objects.create_user(
+            username='customer9', password='pass123', email='customer9@example.com', role='customer'
+        )
+        category = Category.objects.create(name='Tools')
+        self.hammer = Product.objects.create(name='Hammer', price=500, stock=10, category=category)
+
+    def _checkout(self, quantity, minutes_ago, payment_status='pending'):
+        self.assertEqual(reserve_stock({self.hammer.id: quantity}), [])
+        order = Order.objects.create(
+            customer=self.customer, total_amount=500 * quantity, status='pending', payment_status='pending'
+        )
+        OrderItem.objects.create(order=order, product=self.hammer, quantity=quantity, price=500)
+        Payment.objects.create(order=order, amount=500 * quantity, phone_number='+254712345678', status=payment_status)
+        Delivery.objects.create(order=order, delivery_address='Moi Avenue')
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return order
+
+    def test_reserve_stock_refuses_short_products(self):
+        self.assertEqual(reserve_stock({self.hammer.id: 11}), [self.hammer.id])
+        self.assertEqual(reserve_stock({self.hammer.id: 4}), [])
+        self.hammer.refresh_from_db()
+        self.assertEqual(self.hammer.stock, 6)
+
+    def test_expires_old_pending_orders(self):
+        expired = [self._checkout(2, minutes_ago=90), self._checkout(1, minutes_ago=60)]
+        recent = self._checkout(3, minutes_ago=5)
+        paid = self._checkout(1, minutes_ago=90, payment_status='successful')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_pending_orders(minutes=30, batch_size=1), 2)
+
+        statuses = dict(Order.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[order.id] for order in expired], ['cancelled', 'cancelled'])
+        self.assertEqual((statuses[recent.id], statuses[paid.id]), ('pending', 'pending'))
+        self.assertEqual(
+            set(Payment.objects.filter(order__in=expired).values_list('status', flat=True)), {'cancelled'}
+        )
+        self.assertEqual(
+            set(Delivery.objects.filter(order__in=expired).values_list('status', flat=True)), {'cancelled'}
+        )
+        self.hammer.refresh_from_db()
+        self.assertEqual(self.hammer.stock, 10 - 3 - 1)
+        self.assertEqual(expire_pending_orders(minutes=30), 0)
+
+
+@override_settings(MPESA_CALLBACK_URL='https://example.com/payment-callback/')
+class IdempotentCheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        branch_index.reset()
+        zone_index.reset()
+        self.customer = CustomUser.objects.create_user(
+            username='customer10', password='pass123', email='customer10@example.com', role='customer'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.branch = Branch.objects.create(name='CBD', latitude=-1.2864, longitude=36.8172)
+        category = Category.objects.create(name='Tools')
+        self.product = Product.objects.create(name='Hammer', price=500, stock=10, category=category)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        self.body = {
+            'cart_items': [{'product': {'id': self.product.id, 'price': '500.00'}, 'quantity': 2}],
+            'phone_number': '254712345678',
+            'latitude': -1.2870,
+            'longitude': 36.8180,
+        }
+        cache.set('geocode_-1.287_36.818', 'Moi Avenue, Nairobi')  # No reverse geocoding request
+
+    def _checkout(self, body, key):
+        return self.client.post(reverse('checkout'), body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    @patch('orders.views.MpesaService')
+    def test_retry_replays_first_response(self, mpesa):
+        mpesa.return_value.stk_push.return_value = {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1'}
+        first = self._checkout(self.body, 'retry-1')
+        self.assertEqual(first.status_code, 201, first.data)
+
+        second = self._checkout(self.body, 'retry-1')
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['order']['id'], first.data['order']['id'])
+        self.assertEqual(mpesa.return_value.stk_push.call_count, 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+        self.assertEqual(self._checkout(self.body, 'retry-2').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    @patch('orders.views.MpesaService')
+    def test_key_reused_with_different_body(self, mpesa):
+        mpesa.return_value.stk_push.return_value = {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1'}
+        self._checkout(self.body, 'retry-1')
+        self.body['cart_items'][0]['quantity'] = 3
+        response = self._checkout(self.body, 'retry-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @patch('orders.views.MpesaService')
+    def test_rolled_back_checkout_keeps_its_error(self, mpesa):
+        mpesa.return_value.stk_push.return_value = {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1'}
+        self.body['cart_items'][0]['quantity'] = 11
+        response = self._checkout(self.body, 'short-1')
+        self.assertEqual(response.status_code, 409, response.data)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        # The rollback also released the key, so the corrected retry goes through
+        self.body['cart_items'][0]['quantity'] = 2
+        self.assertEqual(self._checkout(self.body, 'short-1').status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @patch('orders.views.MpesaService')
+    def test_database_error_is_not_stored(self, mpesa):
+        mpesa.return_value.stk_push.return_value = {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1'}
+        self.body['cart_items'].append({'product': {'id': self.product.id, 'price': '500.00'}, 'quantity': 1})
+        response = self._checkout(self.body, 'duplicate-1')
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+
+    def test_unknown_product_creates_no_order(self):
+        self.body['cart_items'].append({'product': {'id': self.product.id + 100, 'price': '10.00'}, 'quantity': 1})
+        response = self.client.post(reverse('checkout'), self.body, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    @patch('orders.views.DeliverySerializer.save', side_effect=RuntimeError('Delivery signal failed'))
+    @patch('orders.views.MpesaService')
+    def test_failure_after_stk_push_keeps_order_and_payment(self, mpesa, save):
+        mpesa.return_value.stk_push.return_value = {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1'}
+        response = self._checkout(self.body, 'late-1')
+        self.assertEqual(response.status_code, 500)
+        payment = Payment.objects.get(checkout_request_id='ws_CO_1')
+        self.assertEqual((payment.order_id, payment.status), (response.data['order_id'], 'pending'))
+        self.assertIn('after the STK push', payment.error_message)
+        self.assertFalse(Delivery.objects.exists())
+
+        # The retry gets the stored error back instead of a second STK push
+        self.assertEqual(self._checkout(self.body, 'late-1').status_code, 500)
+        self.assertEqual(mpesa.return_value.stk_push.call_count, 1)
+
+    @patch('orders.views.OrderSerializer', side_effect=RuntimeError('Serialization failed'))
+    @patch('orders.views.MpesaService')
+    def test_rolled_back_delivery_gives_its_slot_back(self, mpesa, serializer):
+        mpesa.return_value.stk_push.return_value = {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1'}
+        slot = upcoming_slots()[0]
+        self.body['delivery_slot'] = slot.isoformat()
+        self.assertEqual(self._checkout(self.body, 'slot-1').status_code, 500)
+        self.assertFalse(Delivery.objects.exists())
+        booked = next(entry['booked'] for entry in slot_availability(self.branch.id) if entry['start'] == slot)
+        self.assertEqual(booked, 0)
+
+    @patch('orders.views.MpesaService')
+    def test_checkout_from_branch_without_coordinates(self, mpesa):
+        mpesa.return_value.stk_push.return_value = {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1'}
+        westlands = Branch.objects.create(name='Westlands')
+        self.body['branch_id'] = westlands.id
+        response = self.client.post(reverse('checkout'), self.body, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Order.objects.get().branch_id, westlands.id)
+
+    @patch('orders.views.MpesaService')
+    def test_expired_key_runs_as_new_request(self, mpesa):
+        mpesa.return_value.stk_push.return_value = {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1'}
+        self.assertEqual(self._checkout(self.body, 'old-1').status_code, 201)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(hours=25))
+
+        self.body['cart_items'][0]['quantity'] = 1
+        response = self._checkout(self.body, 'old-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(self._checkout(self.body, 'old-1')['Idempotent-Replayed'], 'true')
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
@@ -0,0 +1,176 @@
+import logging
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from delivery.models import Delivery
+from delivery.transitions import bulk_transition
+from payment.models import Payment
+from products.models import Product
+from users.stats import adjust_dashboard_counter
+from .events import publish_order_event
+from .models import Order, OrderItem, ORDER_STATUS_TRANSITIONS
+
+logger = logging.getLogger(__name__)
+
+ORDER_BULK_ACTIONS = {
+    'ship': 'shipped',
+    'deliver': 'delivered',
+    'cancel': 'cancelled',
+}
+
+
+def reserve_stock(quantities):
+    """
+    Take units out of stock with one conditional UPDATE stock = stock - n per product.
+    Products are updated in id order so concurrent checkouts cannot deadlock. Nothing is
+    undone here: call it inside a transaction and roll back when products are short.
+    Args:
+        quantities: Dict {product_id: units}.
+    Returns:
+        List of product ids that did not have enough stock.
+    """
+    short = []
+    for product_id, units in sorted(quantities.items()):
+        if not Product.objects.filter(id=product_id, stock__gte=units).update(stock=F('stock') - units):
+            short.append(product_id)
+    return short
+
+
+def restock_orders(order_ids):
+    """
+    Return the items of orders to stock with one UPDATE stock = stock + n per product.
+    Products are updated in id order so concurrent restocks cannot deadlock.
+    Returns:
+        Dict {product_id: units returned}.
+    """
+    quantities = dict(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('product_id').annotate(units=Sum('quantity')).order_by('product_id')
+        .values_list('product_id', 'units')
+    )
+    for product_id, units in quantities.items():
+        Product.objects.filter(id=product_id).update(stock=F('stock') + units)
+    return quantities
+
+
+def bulk_order_action(order_ids, action):
+    """
+    Ship, deliver or cancel many orders at once.
+    Rows are locked and validated against ORDER_STATUS_TRANSITIONS in memory, then updated with
+    one UPDATE; everything is written in a single transaction. Cancelling also returns the items
+    to stock (see restock_orders), cancels pending payments and cancels open deliveries; paid
+    orders are refused, as they need a refund first. Delivering moves in-transit deliveries
+    through delivery.transitions.bulk_transition and refuses orders whose delivery is not
+    in transit yet.
+    Args:
+        order_ids: Ids to change; duplicates are ignored.
+        action: Key of ORDER_BULK_ACTIONS.
+    Returns:
+        Dict with 'updated' (count), 'restocked' (units returned to stock) and
+        'results': [{'id', 'ok', 'error'?}, ...] in request order.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    new_status = ORDER_BULK_ACTIONS[action]
+    allowed_from = {status for status, targets in ORDER_STATUS_TRANSITIONS.items() if new_status in targets}
+    now = timezone.now()
+    restocked = {}
+
+    with transaction.atomic():
+        rows = {
+            row['id']: row
+            for row in Order.objects.select_for_update(of=('self',)).filter(id__in=order_ids).order_by().values(
+                'id', 'status', 'payment_status', 'delivery__id', 'delivery__status'
+            )
+        }
+        results = {}
+        for order_id in order_ids:
+            row = rows.get(order_id)
+            if row is None:
+                results[order_id] = {'id': order_id, 'ok': False, 'error': 'Order not found'}
+            elif row['status'] not in allowed_from:
+                results[order_id] = {
+                    'id': order_id, 'ok': False,
+                    'error': f"Cannot transition from {row['status']} to {new_status}",
+                }
+            elif new_status == 'cancelled' and row['payment_status'] == 'paid':
+                results[order_id] = {'id': order_id, 'ok': False, 'error': 'Paid orders must be refunded before cancelling'}
+            elif new_status == 'delivered' and row['delivery__status'] not in (None, 'in_transit', 'delivered'):
+                results[order_id] = {
+                    'id': order_id, 'ok': False,
+                    'error': f"Delivery is {row['delivery__status']}, not in transit",
+                }
+            else:
+                results[order_id] = {'id': order_id, 'ok': True}
+
+        valid = [rows[order_id] for order_id, result in results.items() if result['ok']]
+        if new_status == 'delivered':
+            valid = _deliver_in_transit(valid, results)
+        if valid:
+            valid_ids = [row['id'] for row in valid]
+            Order.objects.filter(id__in=valid_ids).update(status=new_status, updated_at=now)
+            if new_status == 'cancelled':
+                restocked = release_cancelled_orders(valid, now)
+            for row in valid:
+                publish_order_event(row['id'], 'order', status=new_status, payment_status=row['payment_status'])
+
+    updated = sum(result['ok'] for result in results.values())
+    logger.info(
+        f"Bulk {action}: {updated} of {len(order_ids)} orders updated, "
+        f"{sum(restocked.values())} units restocked"
+    )
+    return {'updated': updated, 'restocked': sum(restocked.values()), 'results': list(results.values())}
+
+
+def _deliver_in_transit(rows, results):
+    """
+    Deliver the in-transit deliveries of rows with bulk_transition, which also marks their orders
+    delivered; a refused transition is copied into results.
+    Returns:
+        The rows without an in-transit delivery, whose orders are still to be updated.
+    """
+    in_transit = {row['delivery__id']: row['id'] for row in rows if row['delivery__status'] == 'in_transit'}
+    if in_transit:
+        for result in bulk_transition(list(in_transit), 'delivered')['results']:
+            if not result['ok']:
+                results[in_transit[result['id']]].update(ok=False, error=result['error'])
+    return [row for row in rows if row['delivery__status'] != 'in_transit']
+
+
+def release_cancelled_orders(rows, now):
+    """
+    Give back what orders just cancelled in the current transaction were holding: their stock,
+    pending payments and open deliveries (with their delivery slots).
+    Args:
+        rows: Dicts with 'id' and 'payment_status'; payment_status is updated in place.
+    Returns:
+        Dict {product_id: units returned}.
+    """
+    order_ids = [row['id'] for row in rows]
+    restocked = restock_orders(order_ids)
+    _cancel_pending_payments(rows, now)
+    open_deliveries = list(
+        Delivery.objects.filter(order_id__in=order_ids)
+        .exclude(status__in=('delivered', 'cancelled')).values_list('id', flat=True)
+    )
+    if open_deliveries:
+        bulk_transition(open_deliveries, 'cancelled')
+    return restocked
+
+
+def _cancel_pending_payments(rows, now):
+    """Cancel the pending payments of cancelled orders; updates rows' payment_status in place."""
+    order_ids = list(
+        Payment.objects.filter(order_id__in=[row['id'] for row in rows], status='pending')
+        .values_list('order_id', flat=True)
+    )
+    if not order_ids:
+        return
+    Payment.objects.filter(order_id__in=order_ids).update(status='cancelled', updated_at=now)
+    # As Payment.sync_order_status does for a cancelled payment
+    Order.objects.filter(id__in=order_ids).update(payment_status='unpaid')
+    adjust_dashboard_counter('pending_payments', -len(order_ids))
+    cancelled = set(order_ids)
+    for row in rows:
+        if row['id'] in cancelled:
+            row['payment_status'] = 'unpaid'
+            publish_order_event(row['id'], 'payment', status='cancelled')
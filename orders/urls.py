@@ -1,6 +1,6 @@
 from django.urls import path,include
 from rest_framework.routers import DefaultRouter
-from .views import OrderListView, OrderDetailView,CheckoutView,PaymentCallbackView,AdminOrderViewSet,BranchListView,BranchUpdateView,BranchDetailView,BranchCreateListView
+from .views import OrderListView, OrderDetailView,CheckoutView,PaymentCallbackView,AdminOrderViewSet,BranchListView,BranchUpdateView,BranchDetailView,BranchCreateListView,OrderEventStreamView,OrderEventTokenView,NearestBranchView,DeliveryFeeQuoteView,SalesAnalyticsView,DeliveryZoneListCreateView,DeliveryZoneDetailView
 
 router = DefaultRouter()
 router.register(r'orders', AdminOrderViewSet, basename='admin-orders')
@@ -8,11 +8,18 @@ urlpatterns = [
     path('manage/', include(router.urls)),
     path('orders-list/', OrderListView.as_view(), name='order-list'),
     path('orders-details/<int:id>/', OrderDetailView.as_view(), name='order-detail'),
+    path('orders/<int:id>/events/', OrderEventStreamView.as_view(), name='order-events'),
+    path('orders/<int:id>/events/token/', OrderEventTokenView.as_view(), name='order-events-token'),
     path('orders/checkout/', CheckoutView.as_view(), name='checkout'),
     path('payment-callback/', PaymentCallbackView.as_view(), name='payment-callback'),
     path('branches/', BranchListView.as_view(), name='branch-list'),
+    path('delivery-fee/quote/', DeliveryFeeQuoteView.as_view(), name='delivery-fee-quote'),
+    path('branches/nearest/', NearestBranchView.as_view(), name='branch-nearest'),
     path('branches/<int:pk>/', BranchDetailView.as_view(), name='branch-detail'),
     path('admin/branches/', BranchCreateListView.as_view(), name='admin-branch-list-create'),
     path('admin/branches/<int:pk>/', BranchUpdateView.as_view(), name='admin-branch-update'),
+    path('admin/zones/', DeliveryZoneListCreateView.as_view(), name='admin-zone-list-create'),
+    path('admin/analytics/sales/', SalesAnalyticsView.as_view(), name='admin-sales-analytics'),
+    path('admin/zones/<int:pk>/', DeliveryZoneDetailView.as_view(), name='admin-zone-detail'),
     ]
 
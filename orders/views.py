@@ -5,19 +5,41 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.filters import OrderingFilter
+from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from users.permissions import IsCustomerUser,IsAdminUser
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import BooleanField, Count, Sum, Prefetch, Value
 from django.conf import settings
+from django.http import HttpResponse, Http404
+import json
 import logging
 import traceback
 from products.permissions import IsAdminUser
-from orders.models import Order, OrderItem, Branch
-from orders.serializers import OrderSerializer, CheckoutSerializer, BranchSerializer
+from orders.models import Order, OrderItem, Branch, DeliveryZone, ArchivedOrder
+from orders.serializers import (
+    OrderSerializer, OrderHistorySerializer, ArchivedOrderHistorySerializer, CheckoutSerializer, BranchSerializer, NearestBranchQuerySerializer, DeliveryZoneSerializer,
+    DeliveryFeeQuerySerializer, SalesAnalyticsQuerySerializer, ArchivedOrderSerializer,
+    BulkOrderActionSerializer,
+)
+from orders.spatial import nearest_serviceable_branches
+from orders.fees import quote_delivery_fee
+from orders.search import search_orders
+from orders.exports import ExportMixin, filter_export
+from orders.rollups import sales_timeseries
+from orders.transitions import bulk_order_action, reserve_stock, restock_orders
+from orders.idempotency import IDEMPOTENCY_HEADER, claim_idempotency_key, complete_idempotency_key
+from users.permissions import IsAdminUser as IsAdminRole
+from orders.events import get_order_events, format_sse, make_stream_token, stream_token_seconds
+from orders.authentication import OrderEventTokenAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from delivery.models import Delivery
 from delivery.serializers import DeliverySerializer
+from delivery.slots import reserve_slot, release_slot, slot_length
 from payment.models import Payment
+from products.models import Product
 from payment.services import MpesaService
 
 
@@ -34,6 +56,47 @@ class BranchListView(generics.ListAPIView):
     serializer_class = BranchSerializer
 
 
+class NearestBranchView(APIView):
+    """
+    API view to find the nearest serviceable branches to a point.
+    Answered from the in-memory branch and delivery zone indexes. Accessible by any user.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        serializer = NearestBranchQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        branches = nearest_serviceable_branches(
+            params["latitude"],
+            params["longitude"],
+            limit=params["limit"],
+            max_distance_km=params.get("max_distance_km"),
+        )
+        return Response({"results": branches})
+
+
+class DeliveryFeeQuoteView(APIView):
+    """
+    API view to quote the delivery fee to a point, from the given or the nearest serviceable branch.
+    Quotes are memoized per branch and coordinate cell. Accessible by any user.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        serializer = DeliveryFeeQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        quote = quote_delivery_fee(params["latitude"], params["longitude"], branch_id=params.get("branch_id"))
+        if quote is None:
+            return Response(
+                {"error": "Delivery is not available to this location."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(quote)
+
+
 class BranchCreateListView(generics.ListCreateAPIView):
     """
     API view to list all branches or create a new branch.
@@ -63,6 +126,29 @@ class BranchUpdateView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAdminUser]
 
 
+class DeliveryZoneListCreateView(generics.ListCreateAPIView):
+    """
+    API view to list or create delivery zones.
+    Accessible only by admin users for creation.
+    """
+    queryset = DeliveryZone.objects.select_related("branch").all()
+    serializer_class = DeliveryZoneSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["branch", "is_active"]
+
+
+class DeliveryZoneDetailView(generics.RetrieveUpdateDestroyAPIView):
+    """
+    API view to retrieve, update, or delete a delivery zone.
+    Saving or deleting a zone re-evaluates that branch's pending deliveries.
+    Accessible only by admin users.
+    """
+    queryset = DeliveryZone.objects.select_related("branch").all()
+    serializer_class = DeliveryZoneSerializer
+    permission_classes = [IsAdminUser]
+
+
 class CheckoutView(APIView):
     """
     Handles the checkout process, including order creation, payment initiation (M-Pesa STK Push),
@@ -71,11 +157,45 @@ class CheckoutView(APIView):
     """
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request):
         """
-        Processes the checkout request.
+        Processes the checkout request. With an Idempotency-Key header, retries of a request
+        get its response back instead of creating another order and STK push.
         """
+        self.reserved_slot = None  # (branch_id, slot start) taken in the cache by checkout()
+        self.order_id = None
+        try:
+            with transaction.atomic():
+                key = request.headers.get(IDEMPOTENCY_HEADER)
+                if not key:
+                    return self.checkout(request)
+                record, replay = claim_idempotency_key(request.user, key, request.data)
+                if replay is not None:
+                    return replay
+                response = self.checkout(request)
+                if not transaction.get_rollback():
+                    # A rolled-back checkout also drops the claim, so a retry runs it again
+                    complete_idempotency_key(record, response)
+                return response
+        finally:
+            self.release_unused_slot()
+
+    def release_unused_slot(self):
+        """
+        Give back the slot place checkout() reserved unless a committed delivery now holds it;
+        runs after the transaction has ended, so early returns and rollbacks are both covered.
+        """
+        if self.reserved_slot is None:
+            return
+        branch_id, slot_start = self.reserved_slot
+        if self.order_id is None or not Delivery.objects.filter(order_id=self.order_id, slot_start=slot_start).exists():
+            release_slot(branch_id, slot_start)
+
+    def checkout(self, request):
+        """
+        Creates the order, its payment and delivery; runs in the transaction opened by post().
+        """
+        payment_requested = None  # Set once the customer has been sent the STK push
         try:
             user = request.user
             logger.info(f"Received checkout request data: {request.data}")
@@ -94,31 +214,76 @@ class CheckoutView(APIView):
             latitude = validated_data["latitude"]
             longitude = validated_data["longitude"]
 
-            # Step 2: Calculate total amount
+            # Step 2: Quote the delivery fee and calculate the total amount
+            quote = quote_delivery_fee(latitude, longitude, branch_id=validated_data["branch_id"])
+            if quote is None:
+                logger.error(f"No delivery fee quote for branch {validated_data['branch_id']} at ({latitude}, {longitude})")
+                return Response(
+                    {"error": "Delivery is not available to this location."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            delivery_fee = quote["fee"]
+
+            # Take a place in the chosen delivery window; given back below unless the delivery is created
+            delivery_slot = validated_data.get("delivery_slot")
+            if delivery_slot is not None:
+                if not reserve_slot(validated_data["branch_id"], delivery_slot):
+                    return Response(
+                        {"error": "The selected delivery slot is full."},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                self.reserved_slot = (validated_data["branch_id"], delivery_slot)
             total_amount = sum(
                 float(item["product"]["price"]) * int(item["quantity"])
                 for item in cart_items
+            ) + float(delivery_fee)
+
+            products = Product.objects.select_related("category").in_bulk(
+                [item["product"]["id"] for item in cart_items]
             )
+            missing = [item["product"]["id"] for item in cart_items if item["product"]["id"] not in products]
+            if missing:
+                logger.error(f"Checkout references unknown products: {missing}")
+                return Response(
+                    {"error": f"Products not found: {missing}"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
             # Step 3: Create the order
             order = Order.objects.create(
                 customer=user,
                 total_amount=total_amount,
+                delivery_fee=delivery_fee,
                 status="pending",
                 payment_status="pending",
                 payment_phone_number=phone_number,
                 branch_id=validated_data["branch_id"],
             )
+            self.order_id = order.id
             logger.info(f"Order created: ID {order.id} for user {user.username}")
 
-            # Step 4: Add order items
+            # Step 4: Add order items with a snapshot of each product
+            # Hold the units until the order is paid, cancelled or expires (see orders/expiry.py)
+            quantities = {}
             for item in cart_items:
-                OrderItem.objects.create(
+                quantities[item["product"]["id"]] = quantities.get(item["product"]["id"], 0) + int(item["quantity"])
+            short = reserve_stock(quantities)
+            if short:
+                transaction.set_rollback(True)  # Drops the order and any units already taken
+                return Response(
+                    {"error": f"Insufficient stock for: {', '.join(products[product_id].name for product_id in short)}"},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            OrderItem.objects.bulk_create([
+                OrderItem(
                     order=order,
                     product_id=item["product"]["id"],
                     quantity=item["quantity"],
                     price=item["product"]["price"],
+                    **OrderItem.snapshot(products[item["product"]["id"]]),
                 )
+                for item in cart_items
+            ])
 
             # Step 5: Initiate M-Pesa payment
             payment = Payment.objects.create(
@@ -153,6 +318,7 @@ class CheckoutView(APIView):
                 if response.get("ResponseCode") == "0":
                     payment.checkout_request_id = response.get("CheckoutRequestID")
                     payment.save()
+                    payment_requested = payment
                     logger.info(
                         f"M-Pesa payment initiated, CheckoutRequestID: {payment.checkout_request_id}"
                     )
@@ -165,6 +331,7 @@ class CheckoutView(APIView):
                     order.status = "cancelled"
                     order.payment_status = "failed"
                     order.save()
+                    restock_orders([order.id])
                     return Response(
                         {
                             "error": f"Failed to initiate M-Pesa payment: {error_desc}",
@@ -182,6 +349,7 @@ class CheckoutView(APIView):
                 order.status = "cancelled"
                 order.payment_status = "failed"
                 order.save()
+                restock_orders([order.id])
                 return Response(
                     {
                         "error": "Failed to connect to M-Pesa service",
@@ -190,40 +358,59 @@ class CheckoutView(APIView):
                     status=status.HTTP_502_BAD_GATEWAY,
                 )
 
-            # Step 6: Create the delivery
-            delivery_data = {
-                "order_id": order.id,
-                "latitude": latitude,
-                "longitude": longitude,
-            }
-            delivery_serializer = DeliverySerializer(data=delivery_data)
-            if not delivery_serializer.is_valid():
-                logger.error(
-                    f"Delivery validation failed: {delivery_serializer.errors}"
-                )
+            # Steps 6-7 run in a savepoint: if they fail, the order and payment the STK push
+            # refers to are still committed for the M-Pesa callback
+            with transaction.atomic():
+                # Step 6: Create the delivery
+                delivery_data = {
+                    "order_id": order.id,
+                    "latitude": latitude,
+                    "longitude": longitude,
+                }
+                if delivery_slot is not None:
+                    delivery_data["estimated_delivery_time"] = delivery_slot + slot_length()
+                delivery_serializer = DeliverySerializer(data=delivery_data)
+                if not delivery_serializer.is_valid():
+                    logger.error(
+                        f"Delivery validation failed: {delivery_serializer.errors}"
+                    )
+                    return Response(
+                        {"error": delivery_serializer.errors},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                delivery = delivery_serializer.save(slot_start=delivery_slot)
+                logger.info(f"Delivery created: ID {delivery.id} for Order {order.id}")
+
+                # Step 7: Serialize the response
+                order_serializer = OrderSerializer(order)
                 return Response(
-                    {"error": delivery_serializer.errors},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {
+                        "order": order_serializer.data,
+                        "delivery_id": delivery.id,
+                        "payment_status": payment.status,
+                        "message": "Checkout initiated. Please complete the payment on your phone.",
+                    },
+                    status=status.HTTP_201_CREATED,
                 )
-            delivery = delivery_serializer.save()
-            logger.info(f"Delivery created: ID {delivery.id} for Order {order.id}")
-
-            # Step 7: Serialize the response
-            order_serializer = OrderSerializer(order)
-            return Response(
-                {
-                    "order": order_serializer.data,
-                    "delivery_id": delivery.id,
-                    "payment_status": payment.status,
-                    "message": "Checkout initiated. Please complete the payment on your phone.",
-                },
-                status=status.HTTP_201_CREATED,
-            )
 
         except Exception as e:
             logger.error(
                 f"Checkout failed for user {request.user.username}: {str(e)}"
             )
+            if payment_requested is not None:
+                # The customer may already be paying: keep the order and payment, flagged for follow-up
+                Payment.objects.filter(id=payment_requested.id).update(
+                    error_message=f"Checkout failed after the STK push: {str(e)}"
+                )
+                return Response(
+                    {
+                        "error": "Checkout could not be completed after the payment request was sent.",
+                        "order_id": payment_requested.order_id,
+                        "details": str(e),
+                    },
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                )
+            transaction.set_rollback(True)  # Nothing was sent to M-Pesa; don't commit a half-created order
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -308,17 +495,59 @@ class StandardResultsSetPagination(PageNumberPagination):
 class OrderListView(GenericAPIView, ListModelMixin):
     """
     API view for listing orders belonging to the authenticated customer user.
-    Supports pagination.
+    Supports pagination. Orders are listed in the light history representation
+    (item counts and a few thumbnails) at a constant number of queries per page;
+    archived orders are listed with the live ones.
     """
-    serializer_class = OrderSerializer
+    serializer_class = OrderHistorySerializer
     permission_classes = [IsAuthenticated, IsCustomerUser]
     pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
         """
-        Returns orders belonging to the authenticated customer user.
+        Returns the ids and creation times of the customer's live and archived orders,
+        newest first; list() loads the orders of one page.
+        """
+        user = self.request.user
+        live = Order.objects.filter(customer=user).annotate(
+            archived=Value(False, output_field=BooleanField())
+        ).values("id", "created_at", "archived").order_by()
+        archived = ArchivedOrder.objects.filter(customer=user).annotate(
+            archived=Value(True, output_field=BooleanField())
+        ).values("id", "created_at", "archived").order_by()
+        return live.union(archived, all=True).order_by("-created_at", "-id")
+
+    def get_live_orders(self, ids):
+        """
+        Returns the live orders with these ids, with item counts annotated and the
+        first ORDER_HISTORY_THUMBNAILS items prefetched.
         """
-        return Order.objects.filter(customer=self.request.user)
+        preview_items = OrderItem.objects.only("order", "product_image").order_by("id")[
+            : getattr(settings, "ORDER_HISTORY_THUMBNAILS", 3)
+        ]
+        return (
+            Order.objects.filter(id__in=ids)
+            .select_related("branch")
+            .annotate(item_count=Count("items"), item_quantity=Sum("items__quantity"))
+            .prefetch_related(Prefetch("items", queryset=preview_items, to_attr="preview_items"))
+            .order_by()  # Meta.ordering does not apply to aggregate queries
+        )
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        live_ids = [row["id"] for row in page if not row["archived"]]
+        archived_ids = [row["id"] for row in page if row["archived"]]
+        orders = {}
+        if live_ids:
+            for order in self.get_serializer(self.get_live_orders(live_ids), many=True).data:
+                orders[order["id"]] = order
+        if archived_ids:
+            archived = ArchivedOrder.objects.select_related("branch").filter(id__in=archived_ids)
+            for order in ArchivedOrderHistorySerializer(
+                archived, many=True, context=self.get_serializer_context()
+            ).data:
+                orders[order["id"]] = order
+        return self.get_paginated_response([orders[row["id"]] for row in page])
 
     def get(self, request, *args, **kwargs):
         """
@@ -342,9 +571,27 @@ class OrderDetailView(RetrieveAPIView):
 
     def get_queryset(self):
         """
-        Returns orders belonging to the authenticated customer user.
+        Returns orders belonging to the authenticated customer user, with the customer,
+        branch and items loaded up front. Items render from their product snapshot.
         """
-        return Order.objects.filter(customer=self.request.user)
+        return (
+            Order.objects.filter(customer=self.request.user)
+            .select_related("customer", "branch")
+            .prefetch_related("items")
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # Closed orders are moved to the archive under the same id (see orders/archive.py)
+            archived = (
+                ArchivedOrder.objects.select_related("customer", "branch")
+                .filter(customer=request.user, id=kwargs["id"]).first()
+            )
+            if archived is None:
+                raise
+            return Response(ArchivedOrderSerializer(archived).data)
 
     def get(self, request, *args, **kwargs):
         """
@@ -352,7 +599,7 @@ class OrderDetailView(RetrieveAPIView):
         """
         try:
             return self.retrieve(request, *args, **kwargs)
-        except Order.DoesNotExist:
+        except (Order.DoesNotExist, Http404):
             return Response(
                 {"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND
             )
@@ -363,26 +610,48 @@ class OrderDetailView(RetrieveAPIView):
             )
 
 
-class AdminOrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all().select_related("customer").prefetch_related("items__product")
+class AdminOrderViewSet(ExportMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.all().select_related("customer").prefetch_related("items")
     serializer_class = OrderSerializer
     permission_classes = [IsAdminUser]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ["status", "payment_status"]
-    search_fields = ["customer__username", "id", "request_id"]
     ordering_fields = ["created_at", "total_amount", "id"]
     ordering = ["-created_at"]
+    export_filename = "orders"
+    export_columns = [
+        ("id", "id"),
+        ("created_at", "created_at"),
+        ("status", "status"),
+        ("payment_status", "payment_status"),
+        ("customer", "customer__username"),
+        ("customer_email", "customer__email"),
+        ("payment_phone_number", "payment_phone_number"),
+        ("branch", "branch__name"),
+        ("total_amount", "total_amount"),
+        ("delivery_fee", "delivery_fee"),
+        ("request_id", "request_id"),
+    ]
+
+    def export_archived_rows(self, params, chunk_size):
+        # Archived orders keep the columns the export reads
+        return (
+            filter_export(ArchivedOrder.objects.all(), params).order_by("pk")
+            .values_list(*[field for _, field in self.export_columns]).iterator(chunk_size=chunk_size)
+        )
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        search_query = self.request.query_params.get("search", None)
-        if search_query:
-            queryset = queryset.filter(
-                Q(customer__username__icontains=search_query)
-                | Q(id__icontains=search_query)
-                | Q(request_id__icontains=search_query)
-            )
-        return queryset
+        # ?search= is routed to an indexed lookup by search_orders (id, phone, request UUID or username)
+        return search_orders(super().get_queryset(), self.request.query_params.get("search"))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archived = ArchivedOrder.objects.select_related("customer", "branch").filter(id=kwargs["pk"]).first()
+            if archived is None:
+                raise
+            return Response(ArchivedOrderSerializer(archived).data)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -407,10 +676,150 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        for item in instance.items.all():
-            product = item.product
-            product.stock += item.quantity
-            product.save()
-        self.perform_destroy(instance)
+        with transaction.atomic():
+            restock_orders([instance.id])
+            self.perform_destroy(instance)
         logger.info(f"Order {instance.id} deleted successfully by user {request.user.username}")
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """Ship, deliver or cancel (with restock) many orders in one transaction; returns a per-id outcome."""
+        serializer = BulkOrderActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = bulk_order_action(
+                serializer.validated_data["order_ids"], serializer.validated_data["action"]
+            )
+            logger.info(
+                f"Admin {request.user.username} applied {serializer.validated_data['action']} "
+                f"to {result['updated']} orders"
+            )
+            return Response(result)
+        except Exception as e:
+            logger.error(f"Bulk order action failed: {str(e)}")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class SalesAnalyticsView(APIView):
+    """
+    Sales time series for dashboard charts, read from the daily rollup tables.
+    Accessible only by admin users.
+    """
+    permission_classes = [IsAdminRole]
+
+    def get(self, request):
+        serializer = SalesAnalyticsQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        params = serializer.validated_data
+        series = sales_timeseries(
+            params["metric"],
+            params["date_from"],
+            params["date_to"],
+            group_by=params.get("group_by"),
+            interval=params["interval"],
+            branch_id=params.get("branch_id"),
+        )
+        return Response({
+            "metric": params["metric"],
+            "interval": params["interval"],
+            "date_from": params["date_from"],
+            "date_to": params["date_to"],
+            "series": series,
+        })
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients negotiate text/event-stream; error bodies are still rendered as JSON."""
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, str)):
+            return data
+        return json.dumps(data)
+
+
+def visible_orders(user, order_id):
+    """The order with this id if the user may watch it: its customer, its rider or an admin."""
+    orders = Order.objects.filter(id=order_id)
+    if user.role == "delivery":
+        return orders.filter(delivery__delivery_person=user)
+    if user.role != "admin":
+        return orders.filter(customer=user)
+    return orders
+
+
+class OrderEventTokenView(APIView):
+    """
+    Issues the short-lived ?token= for OrderEventStreamView, since a browser EventSource
+    cannot send the JWT Authorization header. Fetch a new one when the stream returns 403.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, id, *args, **kwargs):
+        if not visible_orders(request.user, id).exists():
+            return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "token": make_stream_token(request.user.id, id),
+            "expires_in": stream_token_seconds(),
+        })
+
+
+class OrderEventStreamView(APIView):
+    """
+    Server-Sent Events feed of order, payment and delivery status changes for one order.
+    Every request answers at once and closes, so it holds a sync worker only for one cache
+    read: a fresh connection gets a snapshot, a resumed one (Last-Event-ID) the events since
+    then, possibly none. The retry field makes EventSource reconnect, i.e. poll, every
+    ORDER_EVENTS_POLL_SECONDS.
+    Browsers authenticate with ?token= from OrderEventTokenView; other clients may use the JWT.
+    Events are read from the cache only, so token-authenticated polls never touch the order tables.
+    """
+    authentication_classes = [JWTAuthentication, OrderEventTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    def get(self, request, id, *args, **kwargs):
+        if isinstance(request.auth, dict):
+            # Stream token: visibility was checked when it was issued for this order
+            if request.auth.get("order") != id:
+                return Response({"detail": "This stream token is for another order."}, status=status.HTTP_403_FORBIDDEN)
+        elif not visible_orders(request.user, id).exists():
+            return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
+        retry_ms = int(getattr(settings, "ORDER_EVENTS_POLL_SECONDS", 3.0) * 1000)
+        body = f"retry: {retry_ms}\n\n"
+        if last_event_id is None:
+            # Fresh connection: send the current state so the client needs no extra fetch
+            snapshot = visible_orders(request.user, id).values(
+                "status", "payment_status", "payment__status", "delivery__id", "delivery__status"
+            ).first()
+            if snapshot is None:
+                return Response({"detail": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+            history = get_order_events(id)
+            body += format_sse({
+                "id": history[-1]["id"] if history else 0,
+                "type": "snapshot",
+                "status": snapshot["status"],
+                "payment_status": snapshot["payment_status"],
+                "payment": snapshot["payment__status"],
+                "delivery_id": snapshot["delivery__id"],
+                "delivery": snapshot["delivery__status"],
+            })
+        else:
+            body += "".join(format_sse(event) for event in get_order_events(id, after=last_event_id))
+
+        response = HttpResponse(body, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        return response
+
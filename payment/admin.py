@@ -1,6 +1,10 @@
 # payments/admin.py
+from functools import partial
 from django.contrib import admin
+from django.db import transaction
+from users.stats import reconcile_dashboard_stats
 from .models import Payment
+from .signals import record_payment_sale
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
@@ -18,6 +22,9 @@ class PaymentAdmin(admin.ModelAdmin):
         queryset.update(status='successful')
         for payment in queryset:
             payment.sync_order_status()
+            # update() bypasses record_paid_order_sale; already recorded orders are skipped
+            transaction.on_commit(partial(record_payment_sale, payment.order_id, payment.amount))
+        reconcile_dashboard_stats(['pending_payments'])  # update() bypasses the counter signals
         self.message_user(request, "Selected payments marked as successful and order statuses updated.")
     mark_as_successful.short_description = "Mark as Successful"
 
@@ -25,5 +32,6 @@ class PaymentAdmin(admin.ModelAdmin):
         queryset.update(status='failed')
         for payment in queryset:
             payment.sync_order_status()
+        reconcile_dashboard_stats(['pending_payments'])  # update() bypasses the counter signals
         self.message_user(request, "Selected payments marked as failed and order statuses updated.")
     mark_as_failed.short_description = "Mark as Failed"
\ No newline at end of file
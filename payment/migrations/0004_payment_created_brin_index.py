@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 07:59
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_order_created_brin_index'),
+        ('payment', '0003_alter_payment_phone_number'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='payment_created_brin_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.core.validators import RegexValidator
+from django.contrib.postgres.indexes import BrinIndex
 from orders.models import Order
 
 class Payment(models.Model):
@@ -58,4 +59,5 @@ class Payment(models.Model):
         indexes = [
             models.Index(fields=['checkout_request_id']),
             models.Index(fields=['status']),
+            BrinIndex(fields=['created_at'], name='payment_created_brin_idx'),  # Date-range exports
         ]
\ No newline at end of file
@@ -0,0 +1,44 @@
+# payment/signals.py
+import logging
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from orders.events import publish_order_event
+from orders.rollups import record_order_sale
+from users.stats import adjust_dashboard_counter, counter_delta
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+@receiver(post_init, sender=Payment)
+def remember_payment_status(sender, instance, **kwargs):
+    instance._original_status = instance.__dict__.get('status')
+
+@receiver(post_save, sender=Payment)
+def record_paid_order_sale(sender, instance, created, **kwargs):
+    # Registered before publish_payment_status, which resets the status snapshot
+    if instance.status == 'successful' and (created or instance._original_status != 'successful'):
+        order_id, amount = instance.order_id, instance.amount
+        transaction.on_commit(lambda: record_payment_sale(order_id, amount))
+
+def record_payment_sale(order_id, amount):
+    """Record a paid order in the sales rollups and today's revenue; run after commit."""
+    try:
+        if record_order_sale(order_id):
+            adjust_dashboard_counter('revenue_today', amount)
+    except Exception as e:
+        # Picked up by the nightly rebuild_sales_rollups run
+        logger.error(f"Failed to record sale of order {order_id}: {str(e)}")
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def count_pending_payments(sender, instance, created=False, **kwargs):
+    old = None if created else instance._original_status
+    new = instance.status if kwargs.get('signal') is post_save else None
+    adjust_dashboard_counter('pending_payments', counter_delta('pending', old, new))
+
+@receiver(post_save, sender=Payment)
+def publish_payment_status(sender, instance, created, **kwargs):
+    if created or instance.status != instance._original_status:
+        publish_order_event(instance.order_id, 'payment', status=instance.status)
+    instance._original_status = instance.status
@@ -7,13 +7,14 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 from .models import Payment
 from .serializers import PaymentSerializer
 from rest_framework.response import Response
+from orders.exports import ExportMixin, archived_json_rows
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 12
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class AdminPaymentViewSet(viewsets.ModelViewSet):
+class AdminPaymentViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all().select_related('order', 'order__customer').order_by('-created_at')
     serializer_class = PaymentSerializer
     permission_classes = [IsAdminUser]
@@ -23,6 +24,21 @@ class AdminPaymentViewSet(viewsets.ModelViewSet):
     search_fields = ['order__id', 'phone_number']
     ordering_fields = ['created_at', 'amount', 'status']
     ordering = ['-created_at']
+    export_filename = 'payments'
+    export_columns = [
+        ('id', 'id'),
+        ('order_id', 'order_id'),
+        ('created_at', 'created_at'),
+        ('status', 'status'),
+        ('amount', 'amount'),
+        ('phone_number', 'phone_number'),
+        ('transaction_id', 'transaction_id'),
+        ('checkout_request_id', 'checkout_request_id'),
+        ('order_status', 'order__status'),
+    ]
+
+    def export_archived_rows(self, params, chunk_size):
+        return archived_json_rows(Payment, self.export_columns, params, chunk_size)
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -1,11 +1,18 @@
 # products/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.postgres.search import SearchVector
+from users.stats import adjust_dashboard_counter
 from .models import Product
 
 @receiver(post_save, sender=Product)
 def update_search_vector(sender, instance, **kwargs):
     Product.objects.filter(pk=instance.pk).update(
         search_vector=SearchVector('name', 'description')
-    )
\ No newline at end of file
+    )
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def count_products(sender, instance, created=False, **kwargs):
+    if created or kwargs.get('signal') is post_delete:
+        adjust_dashboard_counter('products', 1 if created else -1)
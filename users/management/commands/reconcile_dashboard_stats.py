@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from users.stats import DASHBOARD_COUNTERS, reconcile_dashboard_stats
+
+
+class Command(BaseCommand):
+    help = "Reset the cached admin dashboard counters to the database counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counter', action='append', choices=list(DASHBOARD_COUNTERS),
+                            help="Only this counter (repeatable)")
+
+    def handle(self, *args, **options):
+        values = reconcile_dashboard_stats(names=options['counter'])
+        self.stdout.write(self.style.SUCCESS(
+            "Reconciled dashboard counters: " + ", ".join(f"{name}={value}" for name, value in values.items())
+        ))
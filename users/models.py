@@ -1,6 +1,8 @@
 # yourapp/models.py
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
 
 class CustomUser(AbstractUser):
     ROLE_CHOICES = (
@@ -17,4 +19,8 @@ class CustomUser(AbstractUser):
         return self.username
 
     class Meta:
-        ordering = ['username']
\ No newline at end of file
+        ordering = ['username']
+        indexes = [
+            # Serves username__icontains (UPPER(username) LIKE UPPER('%term%')) in admin order search
+            GinIndex(OpClass(Upper('username'), name='gin_trgm_ops'), name='user_username_trgm_idx'),
+        ]
\ No newline at end of file
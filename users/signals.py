@@ -0,0 +1,17 @@
+# users/signals.py
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from .models import CustomUser
+from .stats import adjust_dashboard_counter, counter_delta
+
+@receiver(post_init, sender=CustomUser)
+def remember_user_role(sender, instance, **kwargs):
+    instance._original_role = instance.__dict__.get('role')
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def count_customers(sender, instance, created=False, **kwargs):
+    old = None if created else instance._original_role
+    new = instance.role if kwargs.get('signal') is post_save else None
+    adjust_dashboard_counter('customers', counter_delta('customer', old, new))
+    instance._original_role = instance.role
@@ -0,0 +1,154 @@
+"""
+Admin dashboard counters kept in the shared cache.
+
+Each counter is one cache key that the signal receivers of the affected
+models (and bulk code paths such as delivery.transitions.bulk_transition)
+adjust with atomic incr/decr after their transaction commits, so the
+dashboard never counts table rows. A missing counter is seeded from the
+database on the next read, and `reconcile_dashboard_stats` (see the
+`reconcile_dashboard_stats` command) resets every counter to the database
+count to correct any drift, e.g. from queryset.update() in the admin.
+"""
+import logging
+from datetime import datetime, time
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from delivery.models import Delivery
+from orders.models import Order, ArchivedOrder
+from payment.models import Payment
+from products.models import Product
+from .models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_COUNTER_KEY = "dashboard_{}"
+DASHBOARD_REVENUE_KEY = "dashboard_revenue_{}"  # local date; amount in cents
+DASHBOARD_AS_OF_KEY = "dashboard_as_of"
+REVENUE_TODAY = 'revenue_today'
+
+
+def _count_customers():
+    return CustomUser.objects.filter(role='customer').count()
+
+
+def _count_products():
+    return Product.objects.count()
+
+
+def _count_orders():
+    return Order.objects.count() + ArchivedOrder.objects.count()
+
+
+def _count_pending_deliveries():
+    return Delivery.objects.filter(status='pending').count()
+
+
+def _count_pending_payments():
+    return Payment.objects.filter(status='pending').count()
+
+
+def _revenue_today_cents():
+    # Orders whose sale was recorded today, i.e. paid today (see orders.rollups.record_order_sale)
+    start = datetime.combine(timezone.localdate(), time.min, tzinfo=timezone.get_current_timezone())
+    total = Payment.objects.filter(
+        status='successful', order__sales_recorded_at__gte=start
+    ).aggregate(total=Sum('amount'))['total']
+    return int((total or 0) * 100)
+
+
+# Counter name: function computing it from the database
+DASHBOARD_COUNTERS = {
+    'customers': _count_customers,
+    'products': _count_products,
+    'orders': _count_orders,
+    'pending_deliveries': _count_pending_deliveries,
+    'pending_payments': _count_pending_payments,
+    REVENUE_TODAY: _revenue_today_cents,
+}
+
+
+def _key(name):
+    if name == REVENUE_TODAY:
+        return DASHBOARD_REVENUE_KEY.format(timezone.localdate().isoformat())
+    return DASHBOARD_COUNTER_KEY.format(name)
+
+
+def _timeout(name):
+    # Each day starts a new revenue key; the previous one only needs to outlive the day
+    if name == REVENUE_TODAY:
+        return 2 * 86400
+    return getattr(settings, 'DASHBOARD_STATS_TIMEOUT', None)
+
+
+def counter_delta(counted, old, new):
+    """+1 when a row enters the counted state, -1 when it leaves it (old/new None: created/deleted)."""
+    return (new == counted) - (old == counted)
+
+
+def _adjust(name, delta):
+    key = _key(name)
+    try:
+        if delta >= 0:
+            cache.incr(key, delta)
+        else:
+            cache.decr(key, -delta)
+    except ValueError:
+        return  # No counter yet; seeded from the database on the next read
+    cache.set(DASHBOARD_AS_OF_KEY, timezone.now(), timeout=None)
+
+
+def adjust_dashboard_counter(name, delta):
+    """
+    Add delta to a dashboard counter once the current transaction commits.
+    Args:
+        name: Key of DASHBOARD_COUNTERS.
+        delta: Change in rows, or in money (Decimal) for 'revenue_today'.
+    """
+    if name == REVENUE_TODAY:
+        delta = int(Decimal(delta) * 100)
+    if delta:
+        transaction.on_commit(lambda: _adjust(name, delta))
+
+
+def reconcile_dashboard_stats(names=None):
+    """
+    Reset dashboard counters to the database count.
+    Args:
+        names: Only these counters (all if None).
+    Returns:
+        Dict of the counter values written.
+    """
+    names = list(names or DASHBOARD_COUNTERS)
+    values = {name: DASHBOARD_COUNTERS[name]() for name in names}
+    for name, value in values.items():
+        cache.set(_key(name), value, timeout=_timeout(name))
+    cache.set(DASHBOARD_AS_OF_KEY, timezone.now(), timeout=None)
+    logger.info(f"Reconciled dashboard counters: {values}")
+    return values
+
+
+def dashboard_stats():
+    """
+    Current dashboard counters, read from the cache in one round trip.
+    Returns:
+        Dict with one entry per counter ('revenue_today' as Decimal) and 'as_of',
+        the time of the last change or reconciliation.
+    """
+    keys = {_key(name): name for name in DASHBOARD_COUNTERS}
+    cached = cache.get_many([*keys, DASHBOARD_AS_OF_KEY])
+    missing = [name for key, name in keys.items() if key not in cached]
+    if missing:
+        for name in missing:
+            cache.add(_key(name), DASHBOARD_COUNTERS[name](), timeout=_timeout(name))
+        cached.update(cache.get_many([_key(name) for name in missing]))
+        cached.setdefault(DASHBOARD_AS_OF_KEY, timezone.now())
+        cache.add(DASHBOARD_AS_OF_KEY, cached[DASHBOARD_AS_OF_KEY], timeout=None)
+
+    stats = {name: cached.get(key, 0) for key, name in keys.items()}
+    stats[REVENUE_TODAY] = (Decimal(stats[REVENUE_TODAY]) / 100).quantize(Decimal('0.01'))
+    stats['as_of'] = cached.get(DASHBOARD_AS_OF_KEY)
+    return stats
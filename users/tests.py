@@ -1,3 +1,76 @@
+from decimal import Decimal
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from delivery.models import Delivery
+from delivery.transitions import bulk_transition
+from orders.models import Order
+from payment.models import Payment
+from products.models import Category, Product
+from users.models import CustomUser
+from users.stats import dashboard_stats, reconcile_dashboard_stats
 
-# Create your tests here.
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_user(
+            username='admin', password='pass123', email='admin@example.com', role='admin'
+        )
+        self.customer = CustomUser.objects.create_user(
+            username='customer', password='pass123', email='customer@example.com', role='customer'
+        )
+        self.category = Category.objects.create(name='Tools')
+        Product.objects.create(name='Hammer', price=500, stock=10, category=self.category)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _create_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer=self.customer, total_amount=250)
+            payment = Payment.objects.create(order=order, amount=250, phone_number='+254712345678')
+            delivery = Delivery.objects.create(order=order, delivery_address='Moi Avenue')
+        return order, payment, delivery
+
+    def test_counters_follow_writes(self):
+        self.assertEqual(dashboard_stats()['orders'], 0)  # Seeds the counters
+        order, payment, delivery = self._create_order()
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.create_user(
+                username='customer2', password='pass123', email='customer2@example.com', role='customer'
+            )
+            CustomUser.objects.create_user(
+                username='rider', password='pass123', email='rider@example.com', role='delivery'
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.status = 'successful'
+            payment.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_transition([delivery.id], 'cancelled')
+
+        with self.assertNumQueries(0):
+            stats = dashboard_stats()
+        self.assertEqual(
+            {name: stats[name] for name in ('customers', 'products', 'orders', 'pending_deliveries', 'pending_payments')},
+            {'customers': 2, 'products': 1, 'orders': 1, 'pending_deliveries': 0, 'pending_payments': 0},
+        )
+        self.assertEqual(stats['revenue_today'], Decimal('250.00'))
+        self.assertEqual(reconcile_dashboard_stats()['revenue_today'], 25000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+        self.assertEqual(dashboard_stats()['orders'], 0)
+
+    def test_admin_stats_endpoint(self):
+        self._create_order()
+        response = self.client.get(reverse('admin-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['users'], 1)
+        self.assertEqual(response.data['orders'], 1)
+        self.assertEqual(response.data['pending_deliveries'], 1)
+        self.assertEqual(response.data['pending_payments'], 1)
+        self.assertIsNotNone(response.data['as_of'])
+
+        with self.assertNumQueries(0):
+            self.client.get(reverse('admin-stats'))
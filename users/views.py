@@ -7,10 +7,9 @@ from rest_framework.mixins import ListModelMixin, CreateModelMixin, UpdateModelM
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from .models import CustomUser
-from products.models import Product
-from orders.models import Order
 from .serializers import CustomUserSerializer, UserUpdateSerializer, AdminUserSerializer
 from .permissions import IsAdminUser,IsCustomerUser
+from .stats import dashboard_stats
 from django.conf import settings
 from rest_framework.permissions import IsAuthenticated, AllowAny
 import requests
@@ -307,16 +306,19 @@ class AdminStatsView(APIView):
 
     def get(self, request):
         try:
-            users_count = CustomUser.objects.filter(role='customer').count()  # Count only customers
-            products_count = Product.objects.count()
-            orders_count = Order.objects.count()
+            stats = dashboard_stats()  # Cached counters, see users/stats.py
 
             return Response({
-                "users": users_count,
-                "products": products_count,
-                "orders": orders_count,
+                "users": stats["customers"],  # Count only customers
+                "products": stats["products"],
+                "orders": stats["orders"],
+                "revenue_today": stats["revenue_today"],
+                "pending_deliveries": stats["pending_deliveries"],
+                "pending_payments": stats["pending_payments"],
+                "as_of": stats["as_of"],
             })
         except Exception as e:
+            logger.error(f"Failed to fetch stats: {str(e)}")
             return Response(
                 {"error": "Failed to fetch stats"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR